@@ -28,7 +28,7 @@
     the OpenERP addons.
 """
 
-import os, sys, imp
+import os, sys, imp, time
 from os.path import join as opj
 import itertools
 import logging
@@ -769,9 +769,14 @@ def load_module_graph(cr, graph, status=None, perform_checks=True, skip_modules=
     modobj = None
     logger.debug('loading %d packages..' % len(graph))
 
+    def add_load_time(module, start):
+        pool.module_load_times[module] = pool.module_load_times.get(module, 0.0) + \
+                time.time() - start
+
     for package in graph:
         if skip_modules and package.name in skip_modules:
             continue
+        start = time.time()
         logger.info('module %s: loading objects' % package.name)
         migrations.migrate_module(package, 'pre')
         register_class(package.name)
@@ -779,6 +784,7 @@ def load_module_graph(cr, graph, status=None, perform_checks=True, skip_modules=
         if hasattr(package, 'init') or hasattr(package, 'update') or package.state in ('to install', 'to upgrade'):
             init_module_objects(cr, package.name, modules)
         cr.commit()
+        add_load_time(package.name, start)
 
     for package in graph:
         status['progress'] = (float(statusi)+0.1) / len(graph)
@@ -787,6 +793,7 @@ def load_module_graph(cr, graph, status=None, perform_checks=True, skip_modules=
 
         if skip_modules and m in skip_modules:
             continue
+        start = time.time()
 
         if modobj is None:
             modobj = pool.get('ir.module.module')
@@ -830,7 +837,8 @@ def load_module_graph(cr, graph, status=None, perform_checks=True, skip_modules=
                 modobj.write(cr, 1, [mid], {'state': 'installed', 'latest_version': ver})
                 cr.commit()
                 # Update translations for all installed languages
-                modobj.update_translations(cr, 1, [mid], None)
+                modobj.update_translations(cr, 1, [mid], None,
+                        {'overwrite': tools.config['overwrite_existing_translations']})
                 cr.commit()
 
             package.state = 'installed'
@@ -838,6 +846,7 @@ def load_module_graph(cr, graph, status=None, perform_checks=True, skip_modules=
                 if hasattr(package, kind):
                     delattr(package, kind)
 
+        add_load_time(m, start)
         statusi += 1
 
     cr.commit()
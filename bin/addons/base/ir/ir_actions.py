@@ -104,6 +104,27 @@ class report_xml(osv.osv):
                         opj('addons',r['report_xml']),
                         r['report_xsl'] and opj('addons',r['report_xsl']))
 
+    @tools.cache()
+    def _lookup_report(self, cr, report_name):
+        """ Return the (id, write date) of the report whose service name
+            is report_name, or (False, False) if there is none
+        """
+        cr.execute("SELECT id, COALESCE(write_date, create_date) FROM ir_act_report_xml"
+                   " WHERE report_name=%s ORDER BY name, id LIMIT 1", (report_name,))
+        return cr.fetchone() or (False, False)
+
+    def create(self, cr, uid, vals, context=None):
+        self._lookup_report.clear_cache(cr.dbname)
+        return super(report_xml, self).create(cr, uid, vals, context=context)
+
+    def write(self, cr, uid, ids, vals, context=None):
+        self._lookup_report.clear_cache(cr.dbname)
+        return super(report_xml, self).write(cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self._lookup_report.clear_cache(cr.dbname)
+        return super(report_xml, self).unlink(cr, uid, ids, context=context)
+
     _name = 'ir.actions.report.xml'
     _table = 'ir_act_report_xml'
     _sequence = 'ir_actions_id_seq'
@@ -20,6 +20,7 @@
 ##############################################################################
 
 import time
+import threading
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import netsvc
@@ -27,6 +28,7 @@ import tools
 from tools.safe_eval import safe_eval as eval
 import pooler
 from osv import fields, osv
+from psycopg2 import OperationalError, errorcodes
 
 def str2tuple(s):
     return eval('tuple(%s)' % (s or ''))
@@ -44,8 +46,16 @@ class ir_cron(osv.osv, netsvc.Agent):
     """ This is the ORM object that periodically executes actions.
     
         Note that we use the netsvc.Agent()._logger member.
+
+        Each due job is run by a worker of the agent, in its own cursor,
+        while another cursor holds a lock on its row, so that server
+        processes sharing a database never run the same job at the same
+        time.
     """
     _name = "ir.cron"
+    # (db_name, job id) of the jobs queued or running in this process
+    _running_jobs = set()
+    _running_lock = threading.Lock()
     _order = 'name'
     _columns = {
         'name': fields.char('Name', size=60, required=True),
@@ -96,53 +106,138 @@ class ir_cron(osv.osv, netsvc.Agent):
             except Exception, e:
                 cr.rollback()
                 self._logger.exception("Job call of self.pool.get('%s').%s(cr, uid, *%r) failed" % (model, func, args))
+                return False
+        return True
 
+    def _lock_job(self, cr, job_id):
+        """ Lock the row of job_id, if it still has to be run and is not
+            locked by someone else. The lock lasts until the transaction
+            of cr ends.
 
-    def _poolJobs(self, db_name, check=False):
+            @return the job, as a dict, or None
+        """
         try:
-            db, pool = pooler.get_db_and_pool(db_name)
-        except:
-            return False
-        cr = db.cursor()
+            cr.execute('SELECT * FROM ir_cron WHERE id=%s '
+                       'AND numbercall<>0 AND active AND nextcall<=now() '
+                       'FOR UPDATE NOWAIT', (job_id,),
+                        debug=self._debug, log_exceptions=False)
+        except OperationalError, e:
+            if e.pgcode != errorcodes.LOCK_NOT_AVAILABLE:
+                raise
+            cr.rollback()
+            self._logger.debug("Job %s is being run by another process", job_id)
+            return None
+        return cr.dictfetchone()
+
+    def _run_job(self, db_name, job_id):
+        """ Run the job_id job of db_name, and schedule its next call
+        """
+        job = None
+        ok = False
+        start = time.time()
         try:
-            if not pool._init:
+            db, pool = pooler.get_db_and_pool(db_name)
+            pooler.check_cache_signaling(db_name)
+            # the row of the job stays locked by lock_cr until its next call
+            # is saved, the job runs in its own cursor, which it may commit
+            # or roll back
+            lock_cr = db.cursor()
+            try:
+                job = self._lock_job(lock_cr, job_id)
+                if not job:
+                    return
                 now = datetime.now()
-                cr.execute('SELECT * FROM ir_cron '
-                        'WHERE numbercall<>0 AND active AND nextcall<=now() '
-                        'ORDER BY priority', debug=self._debug)
-                for job in cr.dictfetchall():
-                    nextcall = datetime.strptime(job['nextcall'], '%Y-%m-%d %H:%M:%S')
-                    numbercall = job['numbercall']
+                nextcall = datetime.strptime(job['nextcall'], '%Y-%m-%d %H:%M:%S')
+                numbercall = job['numbercall']
 
-                    ok = False
+                ok = True
+                done = False
+                job_cr = db.cursor()
+                try:
                     while nextcall < now and numbercall:
                         if numbercall > 0:
                             numbercall -= 1
-                        if not ok or job['doall']:
-                            self._callback(cr, job['user_id'], job['model'], job['function'], job['args'])
+                        if not done or job['doall']:
+                            ok = self._callback(job_cr, job['user_id'], job['model'], job['function'], job['args']) and ok
                         if numbercall:
                             nextcall += _intervalTypes[job['interval_type']](job['interval_number'])
-                        ok = True
-                    addsql = ''
-                    if not numbercall:
-                        addsql = ', active=False'
-                    cr.execute("UPDATE ir_cron "
-                                "SET nextcall=%s, numbercall=%s"+addsql+ \
-                                " WHERE id=%s", 
-                                (nextcall.strftime('%Y-%m-%d %H:%M:%S'), numbercall, job['id']),
-                                debug=self._debug)
-                    cr.commit()
+                        done = True
+                    job_cr.commit()
+                finally:
+                    job_cr.close()
 
+                addsql = ''
+                if not numbercall:
+                    addsql = ', active=False'
+                lock_cr.execute("UPDATE ir_cron "
+                            "SET nextcall=%s, numbercall=%s"+addsql+ \
+                            " WHERE id=%s",
+                            (nextcall.strftime('%Y-%m-%d %H:%M:%S'), numbercall, job_id),
+                            debug=self._debug)
+                lock_cr.commit()
+                pooler.signal_caches_change(db_name)
+            finally:
+                lock_cr.close()
+        except Exception:
+            ok = False
+            self._logger.warning('Exception in cron job %s:', job_id, exc_info=True)
+        finally:
+            self._running_lock.acquire()
+            try:
+                self._running_jobs.discard((db_name, job_id))
+            finally:
+                self._running_lock.release()
+            if job:
+                self.jobDone(db_name, job['name'], start, ok)
+                # take the next call of the job into account
+                self.restart(db_name)
+
+
+    def _poolJobs(self, db_name, check=False):
+        """ Hand the due jobs of db_name to the agent's workers, and
+            schedule the next check
+        """
+        try:
+            db, pool = pooler.get_db_and_pool(db_name)
+        except:
+            return False
+        pooler.check_cache_signaling(db_name)
+        cr = db.cursor()
+        try:
+            if not pool._init:
+                cr.execute('SELECT id FROM ir_cron '
+                        'WHERE numbercall<>0 AND active AND nextcall<=now() '
+                        'ORDER BY priority', debug=self._debug)
+                for (job_id,) in cr.fetchall():
+                    self._running_lock.acquire()
+                    try:
+                        if (db_name, job_id) in self._running_jobs:
+                            continue
+                        self._running_jobs.add((db_name, job_id))
+                    finally:
+                        self._running_lock.release()
+                    self.runTask(db_name, self._run_job, db_name, job_id)
 
+            # the running jobs will reschedule this check when they are done
+            self._running_lock.acquire()
+            try:
+                running = tuple([ id for (db, id) in self._running_jobs if db == db_name ]) or (0,)
+            finally:
+                self._running_lock.release()
             cr.execute('SELECT min(nextcall) AS min_next_call FROM ir_cron '
-                        'WHERE numbercall<>0 AND active ', debug=self._debug)
+                        'WHERE numbercall<>0 AND active AND id NOT IN %s',
+                        (running,), debug=self._debug)
             next_call = cr.dictfetchone()['min_next_call']
             if next_call:
                 next_call = time.mktime(time.strptime(next_call, '%Y-%m-%d %H:%M:%S'))
+                if next_call < time.time():
+                    # jobs locked by another process: check them again later
+                    next_call = time.time() + 60
             else:
                 next_call = int(time.time()) + 3600   # if do not find active cron job from database, it will run again after 1 day
 
             if not check:
+                self.cancel(db_name)
                 self.setAlarm(self._poolJobs, next_call, db_name, db_name)
 
         except Exception, ex:
@@ -265,6 +265,7 @@ class ir_model_fields(osv.osv):
         #
             #Removing _columns entry for that table
             self.pool.get(field.model)._columns.pop(field.name,None)
+        self._clear_resolved_views(cr)
         return super(ir_model_fields, self).unlink(cr, user, ids, context)
 
     def create(self, cr, user, vals, context=None):
@@ -280,6 +281,7 @@ class ir_model_fields(osv.osv):
                 raise except_orm(_('Error'), _('For selection fields, the Selection Options must be given!'))
             self._check_selection(cr, user, vals['selection'], context=context)
         res = super(ir_model_fields,self).create(cr, user, vals, context)
+        self._clear_resolved_views(cr)
         try:
             if vals.get('state','base') == 'manual':
                 if not vals['name'].startswith('x_'):
@@ -395,6 +397,7 @@ class ir_model_fields(osv.osv):
             del vals['state']
         
         res = super(ir_model_fields,self).write(cr, user, ids, vals, context=context)
+        self._clear_resolved_views(cr)
 
         if column_rename:
             if isinstance(column_rename[0], osv.orm.orm):
@@ -600,16 +603,22 @@ class ir_model_access(osv.osv):
     def write(self, cr, uid, *args, **argv):
         self.call_cache_clearing_methods(cr)
         res = super(ir_model_access, self).write(cr, uid, *args, **argv)
+        # fields_get() of the views gives the readonly fields
+        self._clear_resolved_views(cr)
         return res
 
     def create(self, cr, uid, *args, **argv):
         self.call_cache_clearing_methods(cr)
         res = super(ir_model_access, self).create(cr, uid, *args, **argv)
+        # fields_get() of the views gives the readonly fields
+        self._clear_resolved_views(cr)
         return res
 
     def unlink(self, cr, uid, *args, **argv):
         self.call_cache_clearing_methods(cr)
         res = super(ir_model_access, self).unlink(cr, uid, *args, **argv)
+        # fields_get() of the views gives the readonly fields
+        self._clear_resolved_views(cr)
         return res
 
 ir_model_access()
@@ -841,6 +850,7 @@ class ir_model_data(osv.osv):
                     'WHERE module = ANY(%s) AND noupdate=%s',
                     (modules, False), debug=self._debug)
         wkf_todo = []
+        wkf_changed = False
         for (id, name, model, res_id,module) in cr.fetchall():
             if (module,name) not in self.loads:
                 self.unlink_mark[(model,res_id)] = id
@@ -854,7 +864,11 @@ class ir_model_data(osv.osv):
                             "    act_to=act_from, act_from=%s "
                             "WHERE act_to=%s", (res_id,res_id), debug=self._debug)
                     cr.execute("DELETE FROM wkf_transition WHERE act_to=%s", (res_id,), debug=self._debug)
+                    wkf_changed = True
 
+        if wkf_changed:
+            # transitions have been rewired behind the ORM's back
+            netsvc.LocalService("workflow").clear_cache(cr, uid)
         for model,id in wkf_todo:
             wf_service = netsvc.LocalService("workflow")
             wf_service.trg_write(uid, model, id, cr)
@@ -21,8 +21,6 @@
 
 from osv import fields, osv, expression
 import time
-from operator import itemgetter
-from functools import partial
 import tools
 from tools.safe_eval import safe_eval as eval
 import logging
@@ -146,21 +144,8 @@ class ir_rule(osv.osv):
         return dom
 
     def clear_cache(self, cr, uid):
-        cr.execute("""SELECT DISTINCT m.model
-                        FROM ir_rule r
-                        JOIN ir_model m
-                          ON r.model_id = m.id
-                       WHERE r.global
-                          OR EXISTS (SELECT 1
-                                       FROM rule_group_rel g_rel
-                                       JOIN res_groups_users_rel u_rel
-                                         ON g_rel.group_id = u_rel.gid
-                                      WHERE g_rel.rule_group_id = r.id
-                                        AND u_rel.uid = %s)
-                    """, (uid,))
-        models = map(itemgetter(0), cr.fetchall())
-        clear = partial(self._compute_domain.clear_cache, cr.dbname, uid)
-        [clear(model, mode) for model in models for mode in self._MODES]
+        # only the leading argument, uid, is given: clears all its models and modes
+        self._compute_domain.clear_cache(cr.dbname, uid)
 
     def domain_get(self, cr, uid, model_name, mode='read', context=None):
         """
@@ -22,6 +22,8 @@
 from osv import fields, osv
 import tools
 import logging
+import time
+from cStringIO import StringIO
 
 TRANSLATION_TYPE = [
     ('field', 'Field'),
@@ -40,13 +42,34 @@ TRANSLATION_TYPE = [
     ('sql_constraint', 'SQL Constraint')
 ]
 
+def _copy_quote(value):
+    """ Format value as a field of the text format of COPY """
+    if value is None or value is False:
+        return '\\N'
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t') \
+            .replace('\n', '\\n').replace('\r', '\\r')
+
 class ir_translation_import_cursor(object):
     """Temporary cursor for optimizing mass insert into ir.translation
 
     Open it (attached to a sql cursor), feed it with translation data and
     finish() it in order to insert multiple translations in a batch.
+
+    The translations are buffered and sent with COPY to a temporary
+    table, then merged into ir_translation by a few set-based queries.
+    Several files may be fed before finish(): when they have the same
+    terms, the first one wins, or the last one with the 'overwrite'
+    context flag.
     """
     _table_name = 'tmp_ir_translation_import'
+    _columns = ('name', 'lang', 'res_id', 'src', 'type',
+                'imd_model', 'imd_module', 'imd_name', 'value')
+    # translations buffered before they are sent to the database
+    _buffer_size = 5000
 
     def __init__(self, cr, uid, parent, context):
         """ Initializer
@@ -61,10 +84,16 @@ class ir_translation_import_cursor(object):
         self._context = context
         self._overwrite = context.get('overwrite', False)
         self._debug = parent._debug
+        self._parent = parent
         self._parent_table = parent._table
+        self._rows = []
+        self._count = 0
+        self._start = time.time()
 
         # Note that Postgres will NOT inherit the constraints or indexes
         # of ir_translation, so this copy will be much faster.
+        # The ids of the rows, from the sequence of ir_translation, keep
+        # the order in which they were pushed.
 
         cr.execute('''CREATE TEMP TABLE %s(
             imd_model VARCHAR(64),
@@ -76,26 +105,32 @@ class ir_translation_import_cursor(object):
     def push(self, ddict):
         """Feed a translation, as a dictionary, into the cursor
         """
-
-        self._cr.execute("INSERT INTO " + self._table_name \
-                + """(name, lang, res_id, src, type,
-                        imd_model, imd_module, imd_name, value)
-                VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        self._rows.append('\t'.join([_copy_quote(v) for v in
                 (ddict['name'], ddict['lang'], ddict.get('res_id'), ddict['src'], ddict['type'],
                     ddict.get('imd_model'), ddict.get('imd_module'), ddict.get('imd_name'),
-                    ddict['value']),
-                debug=self._debug)
+                    ddict['value'])]))
+        if len(self._rows) >= self._buffer_size:
+            self._flush()
+
+    def _flush(self):
+        """ Send the buffered translations to the temporary table """
+        if not self._rows:
+            return
+        self._count += len(self._rows)
+        self._rows.append('')
+        self._cr.copy_from(StringIO('\n'.join(self._rows)), self._table_name,
+                columns=self._columns)
+        self._rows = []
 
     def finish(self):
         """ Transfer the data from the temp table to ir.translation
         """
-        logger = logging.getLogger('orm')
+        logger = logging.getLogger('i18n')
 
         cr = self._cr
+        self._flush()
         if self._debug:
-            cr.execute("SELECT count(*) FROM %s" % self._table_name)
-            c = cr.fetchone()[0]
-            logger.debug("ir.translation.cursor: We have %d entries to process", c)
+            logger.debug("ir.translation.cursor: We have %d entries to process", self._count)
 
         # Step 1: resolve ir.model.data references to res_ids
         cr.execute("""UPDATE %s AS ti
@@ -124,7 +159,20 @@ class ir_translation_import_cursor(object):
                     " AND irt.name = ti.name AND irt.src = ti.src " \
                     " AND (ti.type != 'model' OR ti.res_id = irt.res_id) "
 
-        # Step 2: update existing (matching) translations
+        # Step 2: keep one translation per term: the first one pushed, or
+        # the last one when overwriting
+        cr.execute("CREATE INDEX %s_key ON %s (lang, type, name)" % \
+            (self._table_name, self._table_name), debug=self._debug)
+        cr.execute("ANALYZE %s" % self._table_name, debug=self._debug)
+        cr.execute("""DELETE FROM %s AS irt
+            USING %s AS ti
+            WHERE %s AND irt.id %s ti.id
+            """ % (self._table_name, self._table_name, find_expr,
+                   self._overwrite and '<' or '>'),
+            debug=self._debug)
+
+        # Step 3: update existing (matching) translations
+        updated = 0
         if self._overwrite:
             cr.execute("""UPDATE ONLY %s AS irt
                 SET value = ti.value
@@ -132,8 +180,9 @@ class ir_translation_import_cursor(object):
                 WHERE %s AND ti.value IS NOT NULL AND ti.value != ''
                 """ % (self._parent_table, self._table_name, find_expr),
                 debug = self._debug)
+            updated = cr.rowcount
 
-        # Step 3: insert new translations
+        # Step 4: insert new translations
 
         cr.execute("""INSERT INTO %s(name, lang, res_id, src, type, value)
             SELECT name, lang, res_id, src, type, value
@@ -141,17 +190,16 @@ class ir_translation_import_cursor(object):
               WHERE NOT EXISTS(SELECT 1 FROM ONLY %s AS irt WHERE %s);
               """ % (self._parent_table, self._table_name, self._parent_table, find_expr),
               debug = self._debug)
+        inserted = cr.rowcount
 
-        if self._debug:
-            cr.execute('SELECT COUNT(*) FROM ONLY %s' % (self._parent_table))
-            c1 = cr.fetchone()[0]
-            cr.execute('SELECT COUNT(*) FROM ONLY %s AS irt, %s AS ti WHERE %s' % \
-                (self._parent_table, self._table_name, find_expr))
-            c = cr.fetchone()[0]
-            logger.debug("ir.translation.cursor:  %d entries now in ir.translation, %d common entries with tmp", c1, c)
-
-        # Step 4: cleanup
+        # Step 5: cleanup
         cr.execute("DROP TABLE %s" % self._table_name)
+        tools.clear_code_catalog(cr)
+        self._parent._clear_resolved_views(cr)
+
+        elapsed = max(time.time() - self._start, 0.001)
+        logger.info("%d translations loaded in %.2fs (%d/s): %d updated, %d inserted",
+                self._count, elapsed, self._count / elapsed, updated, inserted)
         return True
 
 class ir_translation(osv.osv):
@@ -227,15 +275,10 @@ class ir_translation(osv.osv):
                     'AND name=%s ' \
                     'AND res_id = ANY (%s)',
                 (lang,tt,name, ids), debug=self._debug)
-        for id in ids:
-            self.create(cr, uid, {
-                'lang':lang,
-                'type':tt,
-                'name':name,
-                'res_id':id,
-                'value':value,
-                'src':src,
-                })
+        # one insert for all the ids, rather than a create() each
+        cr.execute('INSERT INTO ir_translation (lang, type, name, res_id, value, src) ' \
+                'SELECT %s, %s, %s, unnest(%s), %s, %s',
+                (lang, tt, name, ids, value, src), debug=self._debug)
         return len(ids)
 
     @tools.cache(skiparg=3)
@@ -385,6 +428,15 @@ class ir_translation(osv.osv):
         
         return res
 
+    def _clear_caches(self, cr, trans_obj):
+        """ Clear the catalog of _() for the language of trans_obj, if it
+            is one of its terms, or the resolved views, which may show it
+        """
+        if trans_obj['type'] in ('code', 'sql_constraint'):
+            tools.clear_code_catalog(cr, trans_obj['lang'])
+        elif trans_obj['type'] != 'model':
+            self._clear_resolved_views(cr)
+
     def create(self, cursor, user, vals, context=None):
         if not context:
             context = {}
@@ -392,6 +444,7 @@ class ir_translation(osv.osv):
         for trans_obj in self.read(cursor, user, [ids], ['name','type','res_id','src','lang'], context=context):
             self._get_source.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], source=trans_obj['src'])
             self._get_ids.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], [trans_obj['res_id']])
+            self._clear_caches(cursor, trans_obj)
         return ids
 
     def write(self, cursor, user, ids, vals, context=None):
@@ -399,10 +452,15 @@ class ir_translation(osv.osv):
             context = {}
         if isinstance(ids, (int, long)):
             ids = [ids]
+        if 'type' in vals or 'lang' in vals:
+            # the terms may leave the caches of their type and language
+            for trans_obj in self.read(cursor, user, ids, ['type','lang'], context=context):
+                self._clear_caches(cursor, trans_obj)
         result = super(ir_translation, self).write(cursor, user, ids, vals, context=context)
         for trans_obj in self.read(cursor, user, ids, ['name','type','res_id','src','lang'], context=context):
             self._get_source.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], source=trans_obj['src'])
             self._get_ids.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], [trans_obj['res_id']])
+            self._clear_caches(cursor, trans_obj)
         return result
 
     def unlink(self, cursor, user, ids, context=None):
@@ -413,6 +471,7 @@ class ir_translation(osv.osv):
         for trans_obj in self.read(cursor, user, ids, ['name','type','res_id','src','lang'], context=context):
             self._get_source.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], source=trans_obj['src'])
             self._get_ids.clear_cache(cursor.dbname, user, trans_obj['name'], trans_obj['type'], trans_obj['lang'], [trans_obj['res_id']])
+            self._clear_caches(cursor, trans_obj)
         result = super(ir_translation, self).unlink(cursor, user, ids, context=context)
         return result
 
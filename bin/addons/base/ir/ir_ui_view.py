@@ -98,10 +98,21 @@ class view(osv.osv):
     ]
 
 
+    def create(self, cr, uid, vals, context=None):
+        result = super(view, self).create(cr, uid, vals, context)
+        self._clear_resolved_views(cr)
+        return result
+
+    def unlink(self, cr, uid, ids, context=None):
+        result = super(view, self).unlink(cr, uid, ids, context)
+        self._clear_resolved_views(cr)
+        return result
+
     def write(self, cr, uid, ids, vals, context={}):
         if not isinstance(ids, (list, tuple)):
             ids = [ids]
         result = super(view, self).write(cr, uid, ids, vals, context)
+        self._clear_resolved_views(cr)
 
         # drop the corresponding view customizations (used for dashboards for example), otherwise
         # not all users would see the updated views
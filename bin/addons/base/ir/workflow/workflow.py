@@ -22,6 +22,25 @@
 from osv import fields, osv
 import netsvc
 
+def clear_workflow_cache(obj, cr, uid):
+    """ Forget the workflow definitions cached by the workflow service,
+        after they have been changed by obj in the transaction of cr.
+
+        The definitions are forgotten again at the end of the transaction:
+        until then, other requests may have cached them as they were before
+        the change, and the transaction may cache the ones it changed and
+        roll back.
+        The views are also resolved again, as their workflow buttons depend
+        on the groups of the transitions.
+    """
+    wf_service = netsvc.LocalService("workflow")
+    wf_service.clear_cache(cr, uid)
+    obj._clear_resolved_views(cr)
+    if not cr.transaction.get('workflow_cache_clear'):
+        cr.transaction['workflow_cache_clear'] = True
+        cr.after_commit(wf_service.clear_cache, cr, uid)
+        cr.after_rollback(wf_service.clear_cache, cr, uid)
+
 class workflow(osv.osv):
     _name = "workflow"
     _table = "wkf"
@@ -40,9 +59,9 @@ class workflow(osv.osv):
     def write(self, cr, user, ids, vals, context=None):
         if not context:
             context={}
-        wf_service = netsvc.LocalService("workflow")
-        wf_service.clear_cache(cr, user)
-        return super(workflow, self).write(cr, user, ids, vals, context=context)
+        res = super(workflow, self).write(cr, user, ids, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
 
     def get_active_workitems(self, cr, uid, res, res_id, context=None):
 
@@ -106,9 +125,14 @@ class workflow(osv.osv):
     def create(self, cr, user, vals, context=None):
         if not context:
             context={}
-        wf_service = netsvc.LocalService("workflow")
-        wf_service.clear_cache(cr, user)
-        return super(workflow, self).create(cr, user, vals, context=context)
+        res = super(workflow, self).create(cr, user, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
+    def unlink(self, cr, user, ids, context=None):
+        res = super(workflow, self).unlink(cr, user, ids, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
 
 workflow()
 
@@ -140,6 +164,21 @@ class wkf_activity(osv.osv):
         'split_mode': 'XOR',
     }
 
+    def create(self, cr, user, vals, context=None):
+        res = super(wkf_activity, self).create(cr, user, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
+    def write(self, cr, user, ids, vals, context=None):
+        res = super(wkf_activity, self).write(cr, user, ids, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
+    def unlink(self, cr, user, ids, context=None):
+        res = super(wkf_activity, self).unlink(cr, user, ids, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
 wkf_activity()
 
 class wkf_transition(osv.osv):
@@ -167,6 +206,21 @@ class wkf_transition(osv.osv):
     _defaults = {
         'condition': 'True',
     }
+
+    def create(self, cr, user, vals, context=None):
+        res = super(wkf_transition, self).create(cr, user, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
+    def write(self, cr, user, ids, vals, context=None):
+        res = super(wkf_transition, self).write(cr, user, ids, vals, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
+
+    def unlink(self, cr, user, ids, context=None):
+        res = super(wkf_transition, self).unlink(cr, user, ids, context=context)
+        clear_workflow_cache(self, cr, user)
+        return res
 wkf_transition()
 
 class wkf_instance(osv.osv):
@@ -539,6 +539,8 @@ class module(osv.osv):
         elif not isinstance(filter_lang, (list, tuple)):
             filter_lang = [filter_lang]
 
+        # the files of all the modules and languages are loaded at once
+        irt_cursor = self.pool.get('ir.translation')._get_import_cursor(cr, uid, context=context or {})
         for mod in self.browse(cr, uid, ids):
             if mod.state != 'installed':
                 continue
@@ -566,9 +568,11 @@ class module(osv.osv):
                     to_load.reverse()
                 for (iso_lang, f) in to_load:
                     logger.info('module %s: loading translation file for language %s', mod.name, iso_lang)
-                    tools.trans_load(cr, f, lang, verbose=False, context=context)
+                    tools.trans_load(cr, f, lang, verbose=False, context=context,
+                                     import_cursor=irt_cursor)
                 if to_load == [] and lang != 'en_US':
                     logger.warning('module %s: no translation for language %s', mod.name, lang)
+        irt_cursor.finish()
 
     def check(self, cr, uid, ids, context=None):
         logger = logging.getLogger('init')
@@ -22,6 +22,7 @@
 from osv import osv,fields
 from tools.misc import attrgetter
 import time
+import tools
 
 # -------------------------------------------------------------------------
 # Properties
@@ -129,34 +130,170 @@ class ir_property(osv.osv):
         return values
 
 
+    def _auto_init(self, cr, context=None):
+        super(ir_property, self)._auto_init(cr, context)
+        cr.execute('SELECT indexname FROM pg_indexes WHERE indexname = %s', ('ir_property_fields_res_idx',))
+        if not cr.fetchone():
+            cr.execute('CREATE INDEX ir_property_fields_res_idx ON ir_property (fields_id, res_id)')
+            cr.commit()
+
+    def _has_defaults(self, cr, ids):
+        """ Tell whether ids contain default properties (without res_id) """
+        cr.execute('SELECT 1 FROM ir_property WHERE id = ANY(%s) AND res_id IS NULL LIMIT 1',
+                   (list(ids),))
+        return bool(cr.fetchone())
+
+    def _clear_defaults(self, cr):
+        """ Forget the cached default values, after default properties have
+            been changed in the transaction of cr, and again at the end of
+            the transaction: until then, other requests may cache the
+            values as they were before the change, and this transaction may
+            cache the values it changed and roll back.
+        """
+        clear = self._get_default_value.clear_cache
+        clear(cr.dbname)
+        if not cr.transaction.get('ir_property_clear'):
+            cr.transaction['ir_property_clear'] = True
+            cr.after_commit(clear, cr.dbname)
+            cr.after_rollback(clear, cr.dbname)
+
     def write(self, cr, uid, ids, values, context=None):
-        return super(ir_property, self).write(cr, uid, ids, self._update_values(cr, uid, ids, values), context=context)
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        defaults = self._has_defaults(cr, ids) or ('res_id' in values and not values['res_id'])
+        res = super(ir_property, self).write(cr, uid, ids, self._update_values(cr, uid, ids, values), context=context)
+        if defaults:
+            self._clear_defaults(cr)
+        return res
 
     def create(self, cr, uid, values, context=None):
-        return super(ir_property, self).create(cr, uid, self._update_values(cr, uid, None, values), context=context)
+        res = super(ir_property, self).create(cr, uid, self._update_values(cr, uid, None, values), context=context)
+        if not values.get('res_id'):
+            self._clear_defaults(cr)
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        defaults = self._has_defaults(cr, ids)
+        res = super(ir_property, self).unlink(cr, uid, ids, context=context)
+        if defaults:
+            self._clear_defaults(cr)
+        return res
 
     def get_by_record(self, cr, uid, record, context=None):
-        if record.type in ('char', 'text'):
-            return record.value_text
-        elif record.type == 'float':
-            return record.value_float
-        elif record.type == 'boolean':
-            return bool(record.value_integer)
-        elif record.type in ('integer', 'integer_big'):
-            return record.value_integer
-        elif record.type == 'binary':
-            return record.value_binary
-        elif record.type == 'many2one':
-            return record.value_reference
-        elif record.type == 'datetime':
-            return record.value_datetime
-        elif record.type == 'date':
-            if not record.value_datetime:
+        return self._get_value(cr, uid, record, context=context)
+
+    def _get_value(self, cr, uid, values, context=None):
+        """ Return the value of a property, given as a record or as a
+            dictionary of its type and value columns
+        """
+        type_ = values['type']
+        if type_ in ('char', 'text'):
+            return values['value_text']
+        elif type_ == 'float':
+            return values['value_float']
+        elif type_ == 'boolean':
+            return bool(values['value_integer'])
+        elif type_ in ('integer', 'integer_big'):
+            return values['value_integer']
+        elif type_ == 'binary':
+            return values['value_binary'] and str(values['value_binary'])
+        elif type_ == 'many2one':
+            value = values['value_reference']
+            if value and isinstance(value, basestring):
+                model, res_id = value.split(',')
+                model = self.pool.get(model)
+                if not model:
+                    return False
+                return model.browse(cr, uid, int(res_id), context=context)
+            return value
+        elif type_ == 'datetime':
+            return values['value_datetime']
+        elif type_ == 'date':
+            if not values['value_datetime']:
                 return False
-            return time.strftime('%Y-%m-%d', time.strptime(record.value_datetime, '%Y-%m-%d %H:%M:%S'))
+            return time.strftime('%Y-%m-%d', time.strptime(values['value_datetime'], '%Y-%m-%d %H:%M:%S'))
         return False
 
+    _value_columns = 'type, value_text, value_float, value_integer, value_binary, ' \
+                     'value_reference, value_datetime'
+
+    @tools.cache(skiparg=3)
+    def _get_default_value(self, cr, field_id, company_id):
+        """ Return the type and value columns of the default property of
+            field_id for company_id, as a dictionary, or None.
+
+            The properties of the company take precedence over the ones
+            without company.
+        """
+        cr.execute('SELECT ' + self._value_columns + ' FROM ir_property '
+                   'WHERE fields_id = %s AND res_id IS NULL '
+                   'AND (company_id = %s OR company_id IS NULL) '
+                   'ORDER BY company_id IS NULL, id LIMIT 1',
+                   (field_id, company_id), debug=self._debug)
+        res = cr.dictfetchall()
+        return res and res[0] or None
+
+    def _get_company(self, cr, uid, model, field_id, context=None):
+        """ Return the id of the company whose properties of field_id apply
+        """
+        if context and context.get('force_company'):
+            return context['force_company']
+        company = self.pool.get('res.company')
+        return company._company_default_get(cr, uid, model, field_id, context=context)
+
+    def get_multi(self, cr, uid, names, model, ids, context=None):
+        """ Return the values of the properties names of the records ids
+            of model, or their default values.
+
+            The properties of all the records are read with one query per
+            company (usually a single one), the defaults come from a cache.
+
+            @return { id: { name: value } }, the values being like the
+                    ones of get_by_record(), or False
+        """
+        res = dict([(id, {}.fromkeys(names, False)) for id in ids])
+        cr.execute('SELECT id, name FROM ir_model_fields WHERE model = %s AND name = ANY(%s)',
+                   (model, list(names)))
+        field_names = dict(cr.fetchall())
+        if not (field_names and ids):
+            return res
+
+        companies = {}
+        for field_id, name in field_names.items():
+            company_id = self._get_company(cr, uid, model, field_id, context=context)
+            companies.setdefault(company_id, []).append(field_id)
+            default = self._get_default_value(cr, field_id, company_id)
+            if default:
+                value = self._get_value(cr, uid, default, context=context) or False
+                for id in ids:
+                    res[id][name] = value
+
+        refs = dict([('%s,%s' % (model, id), id) for id in ids])
+        for company_id, field_ids in companies.items():
+            # the properties of the company come last, and win
+            cr.execute('SELECT fields_id, res_id, ' + self._value_columns + ' FROM ir_property '
+                       'WHERE fields_id = ANY(%s) AND res_id = ANY(%s) '
+                       'AND (company_id = %s OR company_id IS NULL) '
+                       'ORDER BY company_id IS NOT NULL, id',
+                       (field_ids, refs.keys(), company_id), debug=self._debug)
+            for row in cr.dictfetchall():
+                res[refs[row['res_id']]][field_names[row['fields_id']]] = \
+                        self._get_value(cr, uid, row, context=context) or False
+        return res
+
     def get(self, cr, uid, name, model, res_id=False, context={}):
+        if not res_id:
+            cr.execute('select id from ir_model_fields where name=%s and model=%s', (name, model))
+            res = cr.fetchone()
+            if not res:
+                return False
+            company_id = self._get_company(cr, uid, model, res[0], context=context)
+            default = self._get_default_value(cr, res[0], company_id)
+            if not default:
+                return False
+            return self._get_value(cr, uid, default, context=context)
         domain = self._get_domain(cr, uid, name, model, context=context)
         if domain is not None:
             domain = [('res_id', '=', res_id)] + domain
@@ -179,11 +316,7 @@ class ir_property(osv.osv):
         if not res:
             return None
 
-        if 'force_company' in context and context['force_company']:
-            cid = context['force_company']
-        else:
-            company = self.pool.get('res.company')
-            cid = company._company_default_get(cr, uid, model, res[0], context=context)
+        cid = self._get_company(cr, uid, model, res[0], context=context)
 
         domain = ['&', ('fields_id', '=', res[0]),
                   '|', ('company_id', '=', cid), ('company_id', '=', False)]
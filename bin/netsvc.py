@@ -497,13 +497,97 @@ class Agent(object):
             the timestamp to 0.
           - A heapq is used to store tasks, so we don't need to sort
             tasks ourself.
+          - Due tasks are queued for a bounded number of worker threads
+            (`[cron] workers` in the configuration), which are started on
+            demand and end when the queue is empty.
     """
     __tasks = []
     __tasks_by_db = {}
+    __queue = []        # due tasks, waiting for a worker
+    __workers = 0       # number of running worker threads
+    # { (db_name, job name): [runs, failures, last start, last duration, total duration] }
+    __job_stats = {}
     _logger = logging.getLogger('netsvc.agent')
     _lock = threading.Condition()
     _alive = True
 
+    @classmethod
+    def _max_workers(cls):
+        return max(1, int(tools.config.get_misc('cron', 'workers', 4)))
+
+    @classmethod
+    def runTask(cls, db_name, function, *args, **kwargs):
+        """ Queue function for a worker thread, to run as soon as possible
+        """
+        cls._lock.acquire()
+        try:
+            cls._queue_task([0, db_name, function, args, kwargs])
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def _queue_task(cls, task):
+        """ Must be called with the lock in acquired state
+        """
+        cls.__queue.append(task)
+        if cls.__workers < cls._max_workers():
+            Agent.__workers += 1
+            thr = threading.Thread(target=cls._worker, name="netsvc.Agent.worker")
+            # not a daemon: let the running jobs finish when the process exits
+            thr.start()
+
+    @classmethod
+    def _worker(cls):
+        while True:
+            cls._lock.acquire()
+            try:
+                if not (cls.__queue and cls._alive):
+                    Agent.__workers -= 1
+                    return
+                timestamp, dbname, function, args, kwargs = cls.__queue.pop(0)
+            finally:
+                cls._lock.release()
+            try:
+                function(*args, **kwargs)
+            except Exception:
+                cls._logger.exception("Task %s of %s failed", function.func_name, dbname)
+
+    @classmethod
+    def jobDone(cls, db_name, job, start, ok=True):
+        """ Record the run of job on db_name, that started at `start`
+            (timestamp) and ended now, for `allStats()`
+        """
+        duration = time.time() - start
+        cls._lock.acquire()
+        try:
+            st = cls.__job_stats.setdefault((db_name, job), [0, 0, 0.0, 0.0, 0.0])
+            st[0] += 1
+            if not ok:
+                st[1] += 1
+            st[2] = start
+            st[3] = duration
+            st[4] += duration
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def allStats(cls):
+        """ Return a newline-delimited string of the workers and jobs stats
+        """
+        cls._lock.acquire()
+        try:
+            res = ["Agent: %d/%d workers, %d queued, %d scheduled" % \
+                    (cls.__workers, cls._max_workers(), len(cls.__queue),
+                    len([t for t in cls.__tasks if t[0]]))]
+            for (db_name, job), st in sorted(cls.__job_stats.items()):
+                res.append("    %s@%s: %d runs, %d failed, last at %s for %.3fs, avg %.3fs" % \
+                        (job, db_name, st[0], st[1],
+                        time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st[2])),
+                        st[3], st[4] / st[0]))
+        finally:
+            cls._lock.release()
+        return '\n'.join(res)
+
     @classmethod
     def setAlarm(cls, function, timestamp, db_name, *args, **kwargs):
         cls._lock.acquire()
@@ -537,7 +621,8 @@ class Agent(object):
     @classmethod
     def runner(cls):
         """Neverending function (intended to be ran in a dedicated thread) that
-           checks every 60 seconds tasks to run. TODO: make configurable
+           hands the due tasks to the worker threads, and sleeps until the
+           next one.
         """
         def pretty_args(args, kwargs, trunc=None):
             """ Format the arguments like we would write them at python
@@ -583,16 +668,10 @@ class Agent(object):
                 if not timestamp:
                     # null timestamp -> cancelled task
                     continue
-                cls._lock.release()
                 cls._logger.debug("Run %s.%s(%s)",
                                 function.im_class.__name__, function.func_name,
                                 pretty_args(args, kwargs, 120))
-                thr = threading.Thread(target=function, args=args, kwargs=kwargs)
-                thr.setDaemon(True)
-                thr.start()
-                time.sleep(1)
-                thr = None
-                cls._lock.acquire()
+                cls._queue_task(task)
             
             # This line must have the lock in acquired state
             wtime = 600.0
@@ -167,6 +167,7 @@ if not ( tools.config["stop_after_init"] or \
     tools.config["translate_out"] ):
     service.http_server.init_servers()
     service.http_server.init_xmlrpc()
+    service.http_server.init_jsonrpc()
     service.http_server.init_static_http()
 
     import service.netrpc_server
@@ -181,6 +182,13 @@ if tools.config.get_misc('modules', 'preload', False):
     for pm in _preload_modules:
         addons.register_class(pm)
     
+import service.workers
+server_processes = service.workers.server_processes()
+
+# with server processes, the scheduled actions only run in the parent, and
+# start once the processes are forked
+cron_databases = []
+
 if tools.config['db_name']:
     for dbname in tools.config['db_name'].split(','):
         _langs = []
@@ -197,10 +205,22 @@ if tools.config['db_name']:
             tools.convert_yaml_import(cr, 'base', file(tools.config["test-file"]), {}, 'test', True)
             cr.rollback()
 
-        pool.get('ir.cron')._poolJobs(db.dbname)
+        if server_processes:
+            cron_databases.append(db.dbname)
+        else:
+            pool.get('ir.cron')._poolJobs(db.dbname)
 
         cr.close()
 
+if tools.config.get_misc('databases', 'preload', False) and not tools.config['stop_after_init']:
+    # the server processes share the registries built before they fork
+    _preload_databases = [name.strip() for name in
+            tools.config.get_misc('databases', 'preload').split(',') if name.strip()]
+    pooler.preload_databases(_preload_databases, wait=bool(server_processes),
+            pooljobs=not server_processes)
+    if server_processes:
+        cron_databases.extend(_preload_databases)
+
 #----------------------------------------------------------
 # translation stuff
 #----------------------------------------------------------
@@ -272,20 +292,36 @@ if tools.config['pidfile']:
     fd.write(pidtext)
     fd.close()
 
-netsvc.Server.startAll()
-logging.getLogger("web-services").info('the server is running, waiting for connections...')
+def start_cron():
+    for dbname in cron_databases:
+        pool = pooler.pool_dic.get(dbname)
+        if pool is not None:
+            pool.get('ir.cron').restart(dbname)
+
+process_number = None
+if server_processes:
+    # the parent process stays in prefork() until it is stopped, and
+    # only runs the scheduled actions
+    process_number = service.workers.prefork(server_processes, started=start_cron)
+    if process_number:
+        netsvc.Agent.cancel(None)
+        server_logger.info("Server process #%d started", process_number)
+
+if process_number or not server_processes:
+    netsvc.Server.startAll()
+    logging.getLogger("web-services").info('the server is running, waiting for connections...')
 
-try:
-    openerp_isrunning.waitFor(False)
-except:
-    # catch *all exceptions*
-    pass
+    try:
+        openerp_isrunning.waitFor(False)
+    except:
+        # catch *all exceptions*
+        pass
 
 server_logger.info("Shutting down Server!")
 netsvc.Agent.quit()
 nrem = netsvc.Server.quitAll()
 server_logger.debug("Server is finished!")
-if tools.config['pidfile']:
+if tools.config['pidfile'] and not process_number:
     os.unlink(tools.config['pidfile'])
 logging.shutdown()
 
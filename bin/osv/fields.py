@@ -1053,12 +1053,39 @@ class related(function):
         from orm import only_ids
         self._field_get2(cr, uid, obj, context)
         if not ids: return {}
-        relation = obj._name
         if self._type in ('one2many', 'many2many'):
             res = dict([(i, []) for i in only_ids(ids)])
         else:
             res = {}.fromkeys(only_ids(ids), False)
 
+        path = self._type not in ('one2many', 'many2many') and self._sql_path(obj)
+        if path:
+            self._sql_read(obj, cr, res, path, context)
+        else:
+            self._browse_read(obj, cr, ids, res, context)
+
+        if self._type=='many2one':
+            ids = filter(None, res.values())
+            if ids:
+                ng = dict(obj.pool.get(self._obj).name_get(cr, 1, ids, context=context))
+                if not ng:
+                    logging.getLogger('orm').warning(
+                            "Couldn't get %s %s for field %s." % \
+                            (self._obj, ids, field_name))
+                    # just go on and have a KeyError below:
+                for r in res:
+                    if res[r]:
+                        res[r] = (res[r], ng[res[r]])
+        elif self._type in ('one2many', 'many2many'):
+            for r in res:
+                if res[r]:
+                    res[r] = [x.id for x in res[r]]
+        return res
+
+    def _browse_read(self, obj, cr, ids, res, context=None):
+        """ Read the values of the chain for ids into res, by browsing the
+            records
+        """
         objlst = obj.browse(cr, 1, ids, context=context)
         for data in objlst:
             if not data:
@@ -1083,23 +1110,79 @@ class related(function):
                 res[data.id] = t_data.id
             elif t_data:
                 res[data.id] = t_data
-        if self._type=='many2one':
-            ids = filter(None, res.values())
-            if ids:
-                ng = dict(obj.pool.get(self._obj).name_get(cr, 1, ids, context=context))
-                if not ng:
-                    logging.getLogger('orm').warning(
-                            "Couldn't get %s %s for field %s." % \
-                            (self._obj, ids, field_name))
-                    # just go on and have a KeyError below:
-                for r in res:
-                    if res[r]:
-                        res[r] = (res[r], ng[res[r]])
-        elif self._type in ('one2many', 'many2many'):
-            for r in res:
-                if res[r]:
-                    res[r] = [x.id for x in res[r]]
-        return res
+
+    # types of the columns that the SQL path of _fnct_read() can fetch as
+    # they are stored
+    _sql_types = ('char', 'text', 'integer', 'integer_big', 'float', 'boolean',
+                  'date', 'datetime', 'time', 'selection', 'many2one')
+
+    def _sql_path(self, obj):
+        """ Compile the chain of fields into a query joining the tables of
+            the models it goes through.
+
+            @return (query, models, column) where query selects the id of
+                    the record of obj, the id of the record holding the value
+                    and the value, models are the models joined, the last
+                    one holding the value, and column is the field of the
+                    value; or None when the chain has x2many hops or fields
+                    that are not plain columns
+        """
+        from orm import orm_memory
+        tables = ['"%s" AS t0' % obj._table]
+        models = [obj]
+        model, alias = obj, 't0'
+        for i, name in enumerate(self.arg):
+            if isinstance(model, orm_memory):
+                return None
+            # the field may be stored in the table of an _inherits parent
+            while name not in model._columns and name in model._inherit_fields:
+                parent_name, link = model._inherit_fields[name][:2]
+                parent = model.pool.get(parent_name)
+                parent_alias = 't%d' % len(tables)
+                tables.append('LEFT JOIN "%s" AS %s ON (%s.id = %s."%s")' % \
+                        (parent._table, parent_alias, parent_alias, alias, link))
+                models.append(parent)
+                model, alias = parent, parent_alias
+            column = model._columns.get(name)
+            if column is None or not column._classic_write or column.read \
+                    or column._type not in self._sql_types:
+                return None
+            if i == len(self.arg) - 1:
+                break
+            if column._type != 'many2one':
+                return None
+            target = model.pool.get(column._obj)
+            if target is None:
+                return None
+            target_alias = 't%d' % len(tables)
+            tables.append('LEFT JOIN "%s" AS %s ON (%s.id = %s."%s")' % \
+                    (target._table, target_alias, target_alias, alias, name))
+            models.append(target)
+            model, alias = target, target_alias
+
+        query = 'SELECT t0.id, %s.id, %s."%s" FROM %s WHERE t0.id = ANY(%%s)' % \
+                (alias, alias, name, ' '.join(tables))
+        return query, models, column
+
+    def _sql_read(self, obj, cr, res, path, context=None):
+        """ Read the values of the chain for the ids of res, with the
+            query compiled by _sql_path()
+        """
+        query, models, column = path
+        for model in models:
+            model._store_flush(cr)
+        cr.execute(query, (map(int, res.keys()),), debug=obj._debug)
+        rows = cr.fetchall()
+        if column.translate and context and context.get('lang'):
+            owner_ids = list(set([owner_id for id, owner_id, value in rows if owner_id]))
+            trans = dict([(tr_id, value) for name, tr_id, value in
+                    obj.pool.get('ir.translation')._get_multi_ids(cr, 1,
+                            [self.arg[-1]], owner_ids, ttype='model',
+                            lang=context['lang'], prepend=models[-1]._name + ',')])
+            rows = [(id, owner_id, trans.get(owner_id, value)) for id, owner_id, value in rows]
+        for id, owner_id, value in rows:
+            if value:
+                res[id] = value
 
     def __init__(self, *arg, **args):
         self.arg = arg
@@ -1187,61 +1270,27 @@ class struct(_column):
 class property(function):
 
     def _get_default(self, obj, cr, uid, prop_name, context=None):
-        return self._get_defaults(obj, cr, uid, [prop_name], context=None)[0][prop_name]
-
-    def _get_defaults(self, obj, cr, uid, prop_name, context=None):
-        prop = obj.pool.get('ir.property')
-        domain = [('fields_id.model', '=', obj._name), ('fields_id.name','in',prop_name), ('res_id','=',False)]
-        ids = prop.search(cr, uid, domain, context=context)
-        replaces = {}
-        default_value = {}.fromkeys(prop_name, False)
-        for prop_rec in prop.browse(cr, uid, ids, context=context):
-            if default_value.get(prop_rec.fields_id.name, False):
-                continue
-            value = prop.get_by_record(cr, uid, prop_rec, context=context) or False
-            default_value[prop_rec.fields_id.name] = value
-            if value and (prop_rec.type == 'many2one'):
-                replaces.setdefault(value._name, {})
-                replaces[value._name][value.id] = True
-        return default_value, replaces
-
-    def _get_by_id(self, obj, cr, uid, prop_name, ids, context=None):
-        prop = obj.pool.get('ir.property')
-        vids = [obj._name + ',' + str(oid) for oid in  ids]
+        return obj.pool.get('ir.property').get(cr, uid, prop_name, obj._name, context=context)
 
-        domain = [('fields_id.model', '=', obj._name), ('fields_id.name','in',prop_name)]
-        #domain = prop._get_domain(cr, uid, prop_name, obj._name, context)
-        if vids:
-            domain = [('res_id', 'in', vids)] + domain
-        return prop.search(cr, uid, domain, context=context)
-
-    # TODO: to rewrite more clean
     def _fnct_write(self, obj, cr, uid, id, prop_name, id_val, obj_dest, context=None):
         if context is None:
             context = {}
+        prop = obj.pool.get('ir.property')
+        def_id = self._field_get(cr, uid, obj._name, prop_name)
+        cid = prop._get_company(cr, uid, obj._name, def_id, context=context)
 
-        nids = self._get_by_id(obj, cr, uid, [prop_name], [id], context)
-        if nids:
-            cr.execute('DELETE FROM ir_property WHERE id IN %s', (tuple(nids),))
+        # the property of the record replaces the ones of its company
+        cr.execute('DELETE FROM ir_property WHERE fields_id = %s AND res_id = %s '
+                   'AND (company_id = %s OR company_id IS NULL)',
+                   (def_id, obj._name + ',' + str(id), cid))
 
-        default_val = self._get_default(obj, cr, uid, prop_name, context)
-        property_create = False
+        default_val = prop._get_default_value(cr, def_id, cid)
+        default_val = default_val and prop._get_value(cr, uid, default_val, context=context) or False
         if isinstance(default_val, osv.orm.browse_record):
-            if default_val.id != id_val:
-                property_create = True
-        elif default_val != id_val:
-            property_create = True
-
-        if property_create:
-            def_id = self._field_get(cr, uid, obj._name, prop_name)
-            company = obj.pool.get('res.company')
-            cid = company._company_default_get(cr, uid, obj._name, def_id,
-                                               context=context)
-            propdef = obj.pool.get('ir.model.fields').browse(cr, uid, def_id,
-                                                             context=context)
-            prop = obj.pool.get('ir.property')
+            default_val = default_val.id
+        if default_val != id_val:
             return prop.create(cr, uid, {
-                'name': propdef.name,
+                'name': prop_name,
                 'value': id_val,
                 'res_id': obj._name+','+str(id),
                 'company_id': cid,
@@ -1250,40 +1299,27 @@ class property(function):
             }, context=context)
         return False
 
-
     def _fnct_read(self, obj, cr, uid, ids, prop_name, obj_dest, context=None):
         from orm import only_ids
-        properties = obj.pool.get('ir.property')
-        domain = [('fields_id.model', '=', obj._name), ('fields_id.name','in',prop_name)]
-        default_val,replaces = self._get_defaults(obj, cr, uid, prop_name, context)
-
-        res = {}
-        dnids = []
-        for id in only_ids(ids):
-            res[id] = default_val.copy()
-            dnids.append(obj._name + ',' + str(id))
-        domain += [('res_id','in', dnids)]
-
-        for prop in properties.browse(cr, uid, domain, context=context):
-            value = properties.get_by_record(cr, uid, prop, context=context)
-            res[prop.res_id.id][prop.fields_id.name] = value or False
-            if value and (prop.type == 'many2one'):
-                record_exists = obj.pool.get(value._name).exists(cr, uid, value.id)
-                if record_exists:
-                    replaces.setdefault(value._name, {})
-                    replaces[value._name][value.id] = True
-                else:
-                    res[prop.res_id.id][prop.fields_id.name] = False
+        res = obj.pool.get('ir.property').get_multi(cr, uid, prop_name, obj._name,
+                                                    only_ids(ids), context=context)
 
+        # many2one values are given as (id, name), when the record can be found
+        replaces = {}
+        for values in res.values():
+            for value in values.values():
+                if value and hasattr(value, '_name'):
+                    replaces.setdefault(value._name, set()).add(value.id)
         for rep in replaces:
-            nids = obj.pool.get(rep).search(cr, uid, [('id','in',replaces[rep].keys())], context=context)
+            nids = obj.pool.get(rep).search(cr, uid, [('id','in',list(replaces[rep]))], context=context)
             replaces[rep] = dict(obj.pool.get(rep).name_get(cr, uid, nids, context=context))
-
-        for prop in prop_name:
-            for id in ids:
-                if res[id][prop] and hasattr(res[id][prop], '_name'):
-                    res[id][prop] = (res[id][prop].id , replaces[res[id][prop]._name].get(res[id][prop].id, False))
-
+        for values in res.values():
+            for name, value in values.items():
+                if value and hasattr(value, '_name'):
+                    if value.id in replaces[value._name]:
+                        values[name] = (value.id, replaces[value._name][value.id])
+                    else:
+                        values[name] = False
         return res
 
 
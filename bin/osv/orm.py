@@ -44,6 +44,7 @@
 import calendar
 import copy
 import datetime
+import itertools
 import logging
 import warnings
 import operator
@@ -127,6 +128,7 @@ _logger = logging.getLogger('orm')
 class browse_null(object):
     """ Readonly python database object browser
     """
+    __slots__ = ('id',)
 
     def __init__(self):
         self.id = False
@@ -167,6 +169,7 @@ class browse_record_list(list):
         Such an instance will be returned when doing a ``browse([ids..])``
         and will be iterable, yielding browse() objects
     """
+    __slots__ = ('context',)
 
     def __init__(self, lst, context=None):
         if not context:
@@ -182,6 +185,102 @@ def only_ids(ids):
     else:
         return ids
 
+_MISSING = object()
+""" Marks the values of browse_model_cache that have not been fetched yet
+"""
+
+class browse_model_cache(object):
+    """ The values of the records of one model, shared by browse_records
+
+        Values are stored by columns: one list per field, indexed by the
+        position of the id of each record in `ids`, which takes much less
+        memory than one dictionary per record.
+    """
+    __slots__ = ('ids', 'index', 'columns')
+
+    def __init__(self):
+        self.ids = []       # [id, ...]
+        self.index = {}     # { id: position in ids }
+        self.columns = {}   # { field name: [value or _MISSING, ...] }
+
+    def __contains__(self, id):
+        return id in self.index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, id):
+        if id not in self.index:
+            self.index[id] = len(self.ids)
+            self.ids.append(id)
+            for column in self.columns.itervalues():
+                column.append(_MISSING)
+
+    def has(self, id, name):
+        column = self.columns.get(name)
+        return column is not None and column[self.index[id]] is not _MISSING
+
+    def get(self, id, name):
+        value = self.columns[name][self.index[id]]
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def set(self, id, name, value):
+        self.add(id)
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = [_MISSING] * len(self.ids)
+        column[self.index[id]] = value
+
+    def update(self, id, values):
+        for name, value in values.iteritems():
+            self.set(id, name, value)
+
+    def missing_ids(self, name):
+        """ Return the ids of the records for which name is not fetched
+        """
+        column = self.columns.get(name)
+        if column is None:
+            return list(self.ids)
+        return [ id for id, value in zip(self.ids, column) if value is _MISSING ]
+
+    def record(self, id):
+        """ Return the values fetched for id, as a dictionary
+        """
+        pos = self.index[id]
+        res = dict((name, column[pos]) for name, column in self.columns.iteritems()
+                    if column[pos] is not _MISSING)
+        res['id'] = id
+        return res
+
+def _prefetch_paths(records, paths):
+    """ Fetch the values along paths of fields, for all the records at once
+
+        @param records a browse_record, or a list of them, of one model
+        @param paths list of dotted paths of fields, like
+                ``['order_line.product_id.categ_id', 'partner_id']``
+    """
+    if isinstance(records, browse_record):
+        records = [records]
+    for path in paths:
+        recs = records
+        for name in path.split('.'):
+            if not recs:
+                break
+            # read name for all the records of the model in the cache
+            recs[0][name]
+            targets = {}
+            for r in recs:
+                value = r[name]
+                if isinstance(value, browse_record):
+                    targets[value.id] = value
+                elif isinstance(value, list):
+                    for v in value:
+                        if isinstance(v, browse_record):
+                            targets[v.id] = v
+            recs = targets.values()
+
 class browse_record(object):
     """ An object that behaves like a row of an object's table.
         It has attributes after the columns of the corresponding object.
@@ -209,11 +308,13 @@ class browse_record(object):
             enough, so you can avoid using 'fields_only'.
     """
     __logger = logging.getLogger('orm.browse_record')
+    __slots__ = ('_list_class', '_cr', '_uid', '_id', '_table', '_context',
+                '_fields_process', '_fields_only', '_data', '_cache')
 
     def __init__(self, cr, uid, id, table, cache, context=None, list_class=None,
                 fields_process=None, fields_only=FIELDS_ONLY_DEFAULT):
         """
-        @param cache a dictionary of model->field->data to be shared accross browse
+        @param cache a dictionary of model->browse_model_cache to be shared accross browse
             objects, thus reducing the SQL read()s . It can speed up things a lot,
             but also be disastrous if not discarded after write()/unlink() operations
         @param table the object (inherited from orm)
@@ -228,29 +329,67 @@ class browse_record(object):
         self._uid = uid
         self._id = id
         self._table = table
-        self._table_name = self._table._name
         self._context = context
         self._fields_process = fields_process
         self._fields_only = fields_only
 
-        cache.setdefault(table._name, {})
-        self._data = cache[table._name]
+        self._data = cache.get(table._name)
+        if self._data is None:
+            self._data = cache[table._name] = browse_model_cache()
 
         if not (id and isinstance(id, (int, long,))):
             raise BrowseRecordError(_('Wrong ID for the %s browse record, got %r, expected an integer.') % (self._table_name, id,))
 #        if not table.exists(cr, uid, id, context):
 #            raise BrowseRecordError(_('Object %s does not exists') % (self,))
 
-        if id not in self._data:
-            self._data[id] = {'id': id}
-
+        self._data.add(id)
         self._cache = cache
 
+    @property
+    def _table_name(self):
+        return self._table._name
+
+    def _register_targets(self, fields_to_fetch, field_values):
+        """ Add the records that the relational fields of field_values
+            point to to the cache of their models, so that the first one
+            accessed fetches them all in one read()
+        """
+        pool = self._table.pool
+        targets = {}
+        for field_name, col in fields_to_fetch:
+            if col._type in ('many2one', 'one2one'):
+                ids = targets.setdefault(col._obj, [])
+                for r in field_values:
+                    value = r[field_name]
+                    if isinstance(value, (list, tuple)):
+                        value = value[0]
+                    if value:
+                        ids.append(value)
+            elif col._type in ('one2many', 'many2many'):
+                ids = targets.setdefault(col._obj, [])
+                for r in field_values:
+                    ids.extend(r[field_name] or [])
+            elif col._type == 'reference':
+                for r in field_values:
+                    if r[field_name]:
+                        ref_obj, ref_id = r[field_name].split(',')
+                        if long(ref_id):
+                            targets.setdefault(ref_obj, []).append(long(ref_id))
+        for model, ids in targets.iteritems():
+            if not ids or pool.get(model) is None:
+                continue
+            model_cache = self._cache.get(model)
+            if model_cache is None:
+                model_cache = self._cache[model] = browse_model_cache()
+            for id in ids:
+                if isinstance(id, (int, long)):
+                    model_cache.add(id)
+
     def __getitem__(self, name):
         if name == 'id':
             return self._id
 
-        if name not in self._data[self._id]:
+        if not self._data.has(self._id, name):
             # build the list of fields we will fetch
 
             if self._table._debug:
@@ -261,8 +400,8 @@ class browse_record(object):
                 if self._table._debug:
                     self.__logger.debug("%s.%s is virtual, fetching for %s", 
                             self._table._name, name, self._id)
-                if '_vptr' not in self._data[self._id]:
-                    ids_v = filter(lambda id: '_vptr' not in self._data[id], self._data.keys())
+                if not self._data.has(self._id, '_vptr'):
+                    ids_v = self._data.missing_ids('_vptr')
                     vptrs = self._table.read(self._cr, self._uid, ids_v, ['_vptr'],
                             context=self._context, load="_classic_write")
                     for data in vptrs:
@@ -271,13 +410,13 @@ class browse_record(object):
                         if '_vptr' not in data:
                             continue
                         # assert len(data) == 2, data  # should only have id, _vptr
-                        self._data[data['id']]['_vptr'] = data['_vptr']
-                if '_vptr' not in self._data[self._id]:
+                        self._data.set(data['id'], '_vptr', data['_vptr'])
+                if not self._data.has(self._id, '_vptr'):
                     self.__logger.warning("%s.%s is virtual, but no _vptr for #%s!", 
                             self._table._name, name, self._id)
-                elif self._data[self._id]['_vptr'] \
-                        and self._data[self._id]['_vptr'] != self._name:
-                    vobj = self._table.pool.get(self._data[self._id]['_vptr'])
+                elif self._data.get(self._id, '_vptr') \
+                        and self._data.get(self._id, '_vptr') != self._name:
+                    vobj = self._table.pool.get(self._data.get(self._id, '_vptr'))
                     if self._debug:
                         self.__logger.debug("%s[%s].%s dispatching to %s..", 
                             self._table._name,self._id, name, vobj._name)
@@ -325,7 +464,7 @@ class browse_record(object):
                 # complete the field list with the inherited fields which are classic or many2one
                 fields_to_fetch += filter(lambda x: x[1]._classic_write and x[1]._prefetch, inherits)
                 # also, filter out the fields that we have already fetched
-                fields_to_fetch = filter(lambda f: f[0] not in self._data[self._id], fields_to_fetch)
+                fields_to_fetch = filter(lambda f: not self._data.has(self._id, f[0]), fields_to_fetch)
                 if isinstance(self._fields_only, (tuple, list)):
                     fields_to_fetch = filter(lambda f: f[0] == name or f[0] in self._fields_only, fields_to_fetch)
                 elif self._fields_only == 'auto':
@@ -349,14 +488,14 @@ class browse_record(object):
             # otherwise we fetch only that field
             else:
                 fields_to_fetch = [(name, col)]
-            ids = filter(lambda id: name not in self._data[id], self._data.keys())
+            ids = self._data.missing_ids(name)
             # read the results
             field_names = map(lambda x: x[0], fields_to_fetch)
 
             if self._table._vtable:
                 field_names.append('_vptr')
             if self._table._debug:
-                self.__logger.debug("Reading ids: %r/ %r", ids, self._data.keys())
+                self.__logger.debug("Reading ids: %r/ %r", ids, self._data.ids)
             field_values = self._table.read(self._cr, self._uid, ids, field_names, context=self._context, load="_classic_write")
             # if self._table._debug: # too much now, please enable if really needed
             #     self.__logger.debug("Got result %r", field_values)
@@ -387,12 +526,14 @@ class browse_record(object):
             for result_line in field_values:
                 res_id = result_line['id']
                 del result_line['id']
-                self._data[res_id].update(result_line)
+                self._data.update(res_id, result_line)
+
+            self._register_targets(fields_to_fetch, field_values)
         
-        if not name in self._data[self._id]:
+        if not self._data.has(self._id, name):
             # How did this happen? Could be a missing model due to custom fields used too soon, see above.
             self.__logger.error( "Ffields: %s, datas: %s"%(field_names, field_values))
-            self.__logger.error( "Data: %s, Table: %s"%(self._data[self._id], self._table))
+            self.__logger.error( "Data: %s, Table: %s"%(self._data.record(self._id), self._table))
             raise KeyError(_('Unknown attribute %s in %s ') % (name, self))
 
         # update the columns stats
@@ -407,9 +548,9 @@ class browse_record(object):
         # Process the return value and convert from raw data into
         # browse records, where applicable. 
         # The browse records shall have a very short life, only as return
-        # values of this function, never stored in self._data{} cache
+        # values of this function, never stored in self._data cache
         
-        ret = self._data[self._id][name]
+        ret = self._data.get(self._id, name)
         col = None
         if name in self._table._columns:
             col = self._table._columns[name]
@@ -572,6 +713,81 @@ def get_pg_type(f):
     return f_type
 
 
+class store_queue(object):
+    """ The recomputations of stored function fields requested during a
+        transaction, when they are deferred (see orm._store_process).
+
+        They are merged by model and fields, and done when the transaction
+        is committed, or before any record is read or searched: a search
+        or a read may involve the fields of other models, through related
+        fields, joins or inherited models.
+    """
+    __slots__ = ('pool', 'context', 'todo', 'background')
+
+    def __init__(self, pool, context):
+        self.pool = pool
+        self.context = context
+        self.todo = {}              # { (priority, model, fields): set(ids) }
+        self.background = False
+
+    @classmethod
+    def get(cls, cr):
+        """ Return the queue of the transaction of cr, if any
+        """
+        return cr.transaction.get('store_queue')
+
+    @classmethod
+    def attach(cls, cr, pool, context):
+        """ Return the queue of the transaction of cr, created if needed
+        """
+        queue = cls.get(cr)
+        if queue is None:
+            queue = cr.transaction['store_queue'] = cls(pool, dict(context))
+            cr.before_commit(queue.flush, cr)
+        return queue
+
+    def add(self, result):
+        """ Queue result, as returned by orm._store_get_values()
+        """
+        for order, model, ids, fields in result:
+            if ids:
+                self.todo.setdefault((order, model, tuple(fields)), set()).update(ids)
+
+    def flush(self, cr):
+        """ Do all the pending recomputations. With the background flag,
+            the largest ones are done by a netsvc.Agent worker once the
+            transaction is committed.
+        """
+        threshold = int(config.get_misc('orm', 'store_background_threshold', 10000))
+        # a recomputation may queue other ones
+        while self.todo:
+            todo = sorted(self.todo.items())
+            self.todo = {}
+            for (order, model, fields), ids in todo:
+                obj = self.pool.get(model)
+                cr.execute('SELECT id FROM "' + obj._table + '" WHERE id = ANY(%s)', (list(ids),))
+                ids = [r[0] for r in cr.fetchall()]
+                if self.background and len(ids) > threshold:
+                    cr.after_commit(netsvc.Agent.runTask, cr.dbname,
+                                    obj._store_recompute, cr.dbname, ids, list(fields))
+                else:
+                    # uid == 1, as for the recomputations done right away
+                    obj._store_set_values(cr, 1, ids, list(fields), self.context)
+        return True
+
+def _view_has_selections(fields):
+    """ Tell whether the fields of a view, or of its sub-views, include
+        many2one fields shown as selections, whose values are read from
+        the records
+    """
+    for field in fields.itervalues():
+        if field.get('type') == 'many2one' and 'selection' in field:
+            return True
+        for view in field.get('views', {}).itervalues():
+            if _view_has_selections(view.get('fields', {})):
+                return True
+    return False
+
 class orm_template(object):
     """ THE base of all ORM models
     """
@@ -596,6 +812,9 @@ class orm_template(object):
     _vtable = False
 
     CONCURRENCY_CHECK_FIELD = '__last_update'
+    # maximum number of rows inserted by one statement in create_multi()
+    CREATE_MULTI_ROWS = 1000
+
     def log(self, cr, uid, id, message, secondary=False, context=None):
         try:
             return self.pool.get('res.log').create(cr, uid,
@@ -660,6 +879,7 @@ class orm_template(object):
         for rec in cr.dictfetchall():
             cols[rec['name']] = rec
 
+        fields_changed = False
         for (k, f) in self._columns.items():
             vals = {
                 'model_id': model_id,
@@ -685,6 +905,7 @@ class orm_template(object):
                     vals['select_level'] = cols[k]['select_level']
 
             if k not in cols:
+                fields_changed = True
                 cr.execute("""INSERT INTO ir_model_fields (
                         model_id, model, name, field_description, ttype,
                         relation,view_load,state,select_level,relation_field, translate ) 
@@ -714,6 +935,7 @@ class orm_template(object):
                             _logger.debug("Column %s[%s] differs: %r != %r", k, key, cols[k][key], vals[key])
                         # cr.execute('UPDATE ir_model_fields SET field_description=%s WHERE model=%s AND name=%s', (vals['field_description'], vals['model'], vals['name']))
                         # cr.commit()
+                        fields_changed = True
                         cr.execute("UPDATE ir_model_fields SET "
                             "model_id=%s, field_description=%s, ttype=%s, relation=%s, "
                             "view_load=%s, select_level=%s, readonly=%s ,required=%s,  "
@@ -727,6 +949,8 @@ class orm_template(object):
                                 debug=self._debug)
                         # Don't check any more attributes, we're up-to-date now.
                         break
+        if fields_changed:
+            self._clear_resolved_views(cr)
         cr.commit()
 
     def _auto_init(self, cr, context=None):
@@ -776,7 +1000,8 @@ class orm_template(object):
                 # _logger.debug("Object %s is virtual because of %s", pclass._name, self._name)
 
     def browse(self, cr, uid, select, context=None, list_class=None, 
-                fields_process=None, fields_only=FIELDS_ONLY_DEFAULT, cache=None):
+                fields_process=None, fields_only=FIELDS_ONLY_DEFAULT, cache=None,
+                prefetch=None):
         """Fetch records as objects allowing to use dot notation to browse fields and relations
 
         :param cr: database cursor
@@ -790,6 +1015,8 @@ class orm_template(object):
         :param cache: The parent's cache. Pleas ONLY use it when the caller is
             itself a browse object, and within a single transaction. If unsure,
             just don't use!
+        :param prefetch: optional list of paths of fields to read right away,
+            for all the records at once, like ``['order_line.product_id']``
         """
         self._list_class = list_class or browse_record_list
         if cache is None:
@@ -797,7 +1024,10 @@ class orm_template(object):
         # need to accepts ints and longs because ids coming from a method
         # launched by button in the interface have a type long...
         if isinstance(select, (int, long)):
-            return browse_record(cr, uid, select, self, cache, context=context, list_class=self._list_class, fields_process=fields_process, fields_only=fields_only)
+            res = browse_record(cr, uid, select, self, cache, context=context, list_class=self._list_class, fields_process=fields_process, fields_only=fields_only)
+            if prefetch:
+                _prefetch_paths(res, prefetch)
+            return res
         elif isinstance(select, (browse_record, browse_record_list, browse_null)):
             return select
         elif isinstance(select, list):
@@ -818,7 +1048,10 @@ class orm_template(object):
                 if self._debug:
                     _logger.debug('%s.browse_search( %s...)' % (self._name, select[:5]))
             
-            return self._list_class([browse_record(cr, uid, id, self, cache, context=context, list_class=self._list_class, fields_process=fields_process, fields_only=fields_only) for id in select], context=context)
+            res = self._list_class([browse_record(cr, uid, id, self, cache, context=context, list_class=self._list_class, fields_process=fields_process, fields_only=fields_only) for id in select], context=context)
+            if prefetch:
+                _prefetch_paths(res, prefetch)
+            return res
         else:
             return browse_null()
 
@@ -956,8 +1189,12 @@ class orm_template(object):
         warning = ''
         warning_fields = []
         datas = []
-        for row in self.browse(cr, uid, ids, context):
-            datas += self.__export_row(cr, uid, row, fields_to_export, context)
+        # browse by chunks, so that the browse cache does not hold all
+        # the records (and their related ones) at once
+        itersize = int(config.get_misc('postgres', 'itersize', 2000))
+        for sub_ids in tools.misc.split_every(itersize, ids, list):
+            for row in self.browse(cr, uid, sub_ids, context):
+                datas += self.__export_row(cr, uid, row, fields_to_export, context)
         return {'datas': datas}
 
     def import_data(self, cr, uid, fields, datas, mode='init', current_module='', noupdate=False, context=None, filename=None):
@@ -1144,6 +1381,22 @@ class orm_template(object):
             data = pickle.load(file(config.get('import_partial')))
             original_value = data.get(filename, 0)
 
+        # The lines without an external id only create records: they are
+        # kept, and created together with create_multi(). Not when the lines
+        # may refer to each other, as they would not find the records
+        # created by the previous lines.
+        batch_size = int(config.get_misc('import', 'batch_size', 1000))
+        batch = []
+        batch_start = 0
+        for path in fields:
+            if path[0] in fields_def and fields_def[path[0]].get('relation') == self._name:
+                batch_size = 0
+
+        def flush():
+            if batch:
+                self.create_multi(cr, uid, batch, context=dict(context, res_log_read=True))
+                del batch[:]
+
         position = 0
         while position<len(datas):
             res = {}
@@ -1154,14 +1407,31 @@ class orm_template(object):
                 cr.rollback()
                 return (-1, res, 'Line ' + str(position) +' : ' + '!\n'.join(warning), '')
 
+            batched = batch_size and mode == 'init' and not (xml_id or res_id) \
+                    and ir_model_data_obj.doinit
+            if batched:
+                if not batch:
+                    batch_start = position
+                batch.append(res)
+                if len(batch) < batch_size:
+                    continue
             try:
-                id = ir_model_data_obj._update(cr, uid, self._name,
-                     current_module, res, mode=mode, xml_id=xml_id,
-                     noupdate=noupdate, res_id=res_id, context=context)
+                flush()
+                if not batched:
+                    id = ir_model_data_obj._update(cr, uid, self._name,
+                         current_module, res, mode=mode, xml_id=xml_id,
+                         noupdate=noupdate, res_id=res_id, context=context)
             except Exception, e:
+                if batch:
+                    return (-1, batch[0], 'Lines ' + str(batch_start) + '-' + str(position) + ' : ' + tools.ustr(e), '')
                 return (-1, res, 'Line ' + str(position) +' : ' + tools.ustr(e), '')
 
             if config.get('import_partial', False) and filename and (not (position%100)):
+                # the checkpoint must not cover lines still in the batch
+                try:
+                    flush()
+                except Exception, e:
+                    return (-1, batch[0], 'Lines ' + str(batch_start) + '-' + str(position) + ' : ' + tools.ustr(e), '')
                 data = pickle.load(file(config.get('import_partial')))
                 data[filename] = position
                 pickle.dump(data, file(config.get('import_partial'),'wb'))
@@ -1169,6 +1439,10 @@ class orm_template(object):
                     self._parent_store_compute(cr)
                 cr.commit()
 
+        try:
+            flush()
+        except Exception, e:
+            return (-1, batch[0], 'Lines ' + str(batch_start) + '-' + str(position) + ' : ' + tools.ustr(e), '')
         if context.get('defer_parent_store_computation'):
             self._parent_store_compute(cr)
         return (position, 0, 0, 0)
@@ -1215,6 +1489,28 @@ class orm_template(object):
         """
         raise NotImplementedError(_('The search_read method is not implemented on this object !'))
 
+    def read_iter(self, cr, user, domain, offset=0, limit=None, order=None, fields=None, context=None, load='_classic_read', itersize=None):
+        """
+        Generator variant of search_read(): yield the records matching the
+        search criteria one by one, reading them by chunks, so that the
+        memory used does not depend on the number of records
+
+        :param itersize: number of records read at once (default: the
+                         ``itersize`` option of the ``[postgres]`` section)
+        :return: iterator over dictionaries with the requested field values
+        """
+        ids = self.search(cr, user, domain, offset=offset, limit=limit, order=order, context=context)
+        itersize = itersize or int(config.get_misc('postgres', 'itersize', 2000))
+        for sub_ids in tools.misc.split_every(itersize, ids, list):
+            for r in self._read_chunk(cr, user, sub_ids, fields, context, load):
+                yield r
+
+    def _read_chunk(self, cr, user, ids, fields, context, load):
+        """ read() ids, and return the records in the order of ids
+        """
+        res = dict((r['id'], r) for r in self.read(cr, user, ids, fields, context=context, load=load))
+        return [res[id] for id in ids if id in res]
+
     def get_invalid_fields(self, cr, uid):
         return list(self._invalids)
 
@@ -1383,6 +1679,14 @@ class orm_template(object):
     def create(self, cr, user, vals, context=None):
         raise NotImplementedError(_('The create method is not implemented on this object !'))
 
+    def create_multi(self, cr, user, vals_list, context=None):
+        """
+        Create a record for each dictionary of field values of vals_list
+
+        :return: ids of the new records, in the order of ``vals_list``
+        """
+        return [self.create(cr, user, vals, context=context) for vals in vals_list]
+
     def fields_get_keys(self, cr, user, context=None):
         res = self._columns.keys()
         for parent in self._inherits:
@@ -1827,6 +2131,117 @@ class orm_template(object):
         if not context:
             context = {}
 
+        cr.execute('SELECT gid FROM res_groups_users_rel WHERE uid=%s ORDER BY gid',
+                    (user,), debug=self._debug)
+        groups = tuple([gid for gid, in cr.fetchall()])
+        result = self._get_resolved_view(cr, user, context, self._name, user == 1, groups,
+                                         view_id, view_type, repr(sorted(context.items())))
+        if isinstance(result, list):
+            # this view may not be cached, see _get_resolved_view()
+            try:
+                result = result.pop()
+            except IndexError:
+                result = self._resolve_view(cr, user, view_id, view_type, context)
+        else:
+            # the overrides of fields_view_get() may modify the result
+            result = copy.deepcopy(result)
+
+        if submenu:
+            if context and context.get('active_id', False):
+                data_menu = self.pool.get('ir.ui.menu').browse(cr, user, context['active_id'], context).action
+                if data_menu:
+                    act_id = data_menu.id
+                    if act_id:
+                        data_action = self.pool.get('ir.actions.act_window').browse(cr, user, [act_id], context)[0]
+                        result['submenu'] = getattr(data_action, 'menus', False)
+        if toolbar:
+            def clean(x):
+                x = x[2]
+                for key in ('report_sxw_content', 'report_rml_content',
+                        'report_sxw', 'report_rml',
+                        'report_sxw_content_data', 'report_rml_content_data'):
+                    if key in x:
+                        del x[key]
+                return x
+            ir_values_obj = self.pool.get('ir.values')
+            resprint = ir_values_obj.get(cr, user, 'action',
+                    'client_print_multi', [(self._name, False)], False,
+                    context)
+            resaction = ir_values_obj.get(cr, user, 'action',
+                    'client_action_multi', [(self._name, False)], False,
+                    context)
+
+            resrelate = ir_values_obj.get(cr, user, 'action',
+                    'client_action_relate', [(self._name, False)], False,
+                    context)
+
+            if self._debug:
+                if resprint:
+                    logging.getLogger('orm').debug('%s: client_print_multi actions: %r', self._name,
+                            [ '%s: %s' % (x[0], x[1]) for x in resprint])
+                if resaction:
+                    logging.getLogger('orm').debug('%s: client_action_multi actions: %r', self._name,
+                            [ '%s: %s' % (x[0], x[1]) for x in resaction])
+                if resrelate:
+                    logging.getLogger('orm').debug('%s: client_action_relate actions: %r', self._name,
+                            [ '%s: %s' % (x[0], x[1]) for x in resrelate])
+            resprint = map(clean, resprint)
+            resaction = map(clean, resaction)
+            resaction = filter(lambda x: not x.get('multi', False), resaction)
+            resprint = filter(lambda x: not x.get('multi', False), resprint)
+            resrelate = map(lambda x: x[2], resrelate)
+
+            for x in resprint + resaction + resrelate:
+                x['string'] = x['name']
+
+            result['toolbar'] = {
+                'print': resprint,
+                'action': resaction,
+                'relate': resrelate
+            }
+        return result
+
+    @tools.cache(skiparg=4)
+    def _get_resolved_view(self, cr, user, context, model, superuser, groups, view_id, view_type, context_key):
+        """ Return the view resolved by _resolve_view(), cached for the
+            model, whether user is the superuser (see
+            _disable_workflow_buttons()), the groups of the user, the view
+            and the context, given by context_key as the context itself may
+            not be hashable
+
+            The views that depend on the records (the many2one fields shown
+            as selections) may not be cached: they are returned in a list,
+            which the first caller empties, so that the next ones resolve
+            the view again.
+            The caches are cleared when the views, fields, translations,
+            access rights or workflow transitions change.
+        """
+        result = self._resolve_view(cr, user, view_id, view_type, context)
+        if _view_has_selections(result['fields']):
+            return [result]
+        return result
+
+    def _clear_resolved_views(self, cr):
+        """ Forget the views resolved by _get_resolved_view(), after what
+            they depend on has been changed in the transaction of cr.
+
+            They are forgotten again at the end of the transaction: until
+            then, other requests may resolve them as they were before the
+            change, and the transaction may resolve them as changed and
+            roll back.
+        """
+        clear = self._get_resolved_view.clear_cache
+        clear(cr.dbname)
+        if not cr.transaction.get('resolved_views_clear'):
+            cr.transaction['resolved_views_clear'] = True
+            cr.after_commit(clear, cr.dbname)
+            cr.after_rollback(clear, cr.dbname)
+
+    def _resolve_view(self, cr, user, view_id, view_type, context):
+        """ Return the architecture of the view, with all its inheriting
+            views applied, and the description of its fields, for
+            fields_view_get()
+        """
         def encode(s):
             #if isinstance(s, unicode):
             #    return s.encode('utf8')
@@ -2116,59 +2531,6 @@ class orm_template(object):
         result['arch'] = xarch
         result['fields'] = xfields
 
-        if submenu:
-            if context and context.get('active_id', False):
-                data_menu = self.pool.get('ir.ui.menu').browse(cr, user, context['active_id'], context).action
-                if data_menu:
-                    act_id = data_menu.id
-                    if act_id:
-                        data_action = self.pool.get('ir.actions.act_window').browse(cr, user, [act_id], context)[0]
-                        result['submenu'] = getattr(data_action, 'menus', False)
-        if toolbar:
-            def clean(x):
-                x = x[2]
-                for key in ('report_sxw_content', 'report_rml_content',
-                        'report_sxw', 'report_rml',
-                        'report_sxw_content_data', 'report_rml_content_data'):
-                    if key in x:
-                        del x[key]
-                return x
-            ir_values_obj = self.pool.get('ir.values')
-            resprint = ir_values_obj.get(cr, user, 'action',
-                    'client_print_multi', [(self._name, False)], False,
-                    context)
-            resaction = ir_values_obj.get(cr, user, 'action',
-                    'client_action_multi', [(self._name, False)], False,
-                    context)
-
-            resrelate = ir_values_obj.get(cr, user, 'action',
-                    'client_action_relate', [(self._name, False)], False,
-                    context)
-
-            if self._debug:
-                if resprint:
-                    logging.getLogger('orm').debug('%s: client_print_multi actions: %r', self._name,
-                            [ '%s: %s' % (x[0], x[1]) for x in resprint])
-                if resaction:
-                    logging.getLogger('orm').debug('%s: client_action_multi actions: %r', self._name,
-                            [ '%s: %s' % (x[0], x[1]) for x in resaction])
-                if resrelate:
-                    logging.getLogger('orm').debug('%s: client_action_relate actions: %r', self._name,
-                            [ '%s: %s' % (x[0], x[1]) for x in resrelate])
-            resprint = map(clean, resprint)
-            resaction = map(clean, resaction)
-            resaction = filter(lambda x: not x.get('multi', False), resaction)
-            resprint = filter(lambda x: not x.get('multi', False), resprint)
-            resrelate = map(lambda x: x[2], resrelate)
-
-            for x in resprint + resaction + resrelate:
-                x['string'] = x['name']
-
-            result['toolbar'] = {
-                'print': resprint,
-                'action': resaction,
-                'relate': resrelate
-            }
         return result
 
     _view_look_dom_arch = __view_look_dom_arch
@@ -2713,6 +3075,7 @@ class orm(orm_template):
         """
         context = context or {}
         self.pool.get('ir.model.access').check(cr, uid, self._name, 'read', context=context)
+        self._store_flush(cr)
         if not fields:
             fields = self._columns.keys()
 
@@ -2860,31 +3223,177 @@ class orm(orm_template):
         return '"%s".%s' % (current_table._table, field)
 
     def _parent_store_compute(self, cr):
+        """ Renumber the whole parent_left/parent_right nested set, with
+            [orm] parent_store_gap free positions between consecutive bounds
+        """
         if not self._parent_store:
             return
         _logger.info('Computing parent left and right for table %s...' % (self._table, ))
-        def browse_rec(root, pos=0):
-# TODO: set order
-            where = self._parent_name+'='+str(root)
-            if not root:
-                where = self._parent_name+' IS NULL'
-            if self._parent_order:
-                where += ' order by '+self._parent_order
-            cr.execute('SELECT id FROM '+self._table+' WHERE '+where)
-            pos2 = pos + 1
-            for id in cr.fetchall():
-                pos2 = browse_rec(id[0], pos2)
-            cr.execute('update '+self._table+' set parent_left=%s, parent_right=%s where id=%s', (pos,pos2,root))
-            return pos2+1
-        query = 'SELECT id FROM '+self._table+' WHERE '+self._parent_name+' IS NULL'
-        if self._parent_order:
-            query += ' order by '+self._parent_order
-        pos = 0
-        cr.execute(query)
-        for (root,) in cr.fetchall():
-            pos = browse_rec(root, pos)
+        stride = self._parent_store_gap() + 1
+        self._parent_store_number(cr, None, stride, stride)
         return True
 
+    def _parent_store_gap(self):
+        return int(config.get_misc('orm', 'parent_store_gap', 16))
+
+    def _parent_store_number(self, cr, root, start, stride):
+        """ Number the nodes of the subtree of root, or of all the trees if
+            root is None, in one set-based UPDATE: in preorder, from start,
+            with stride - 1 free positions after each bound.
+
+            With n nodes in the subtree, root gets the bounds start and
+            start + (2n - 1) * stride.
+        """
+        if root:
+            base, params = 'id = %s', (root,)
+        else:
+            base, params = '"parent" IS NULL', ()
+        # The position of a node among the bounds of a compact numbering is
+        # 2 * (its index in preorder) - depth, and its right bound comes
+        # 2 * (number of nodes in its subtree) - 1 positions after it.
+        cr.execute("""UPDATE "%(table)s" SET parent_left = %%s + (2 * n.idx - n.depth) * %%s,
+                                             parent_right = %%s + (2 * (n.idx + s.size) - n.depth - 1) * %%s
+                      FROM (WITH RECURSIVE ranked AS (
+                                SELECT id, "%(parent)s" AS parent,
+                                       row_number() OVER (PARTITION BY "%(parent)s" ORDER BY %(order)s) AS rank
+                                FROM "%(table)s"
+                            ), tree(id, depth, path, ids) AS (
+                                SELECT id, 0, ARRAY[rank], ARRAY[id] FROM ranked WHERE %(base)s
+                              UNION ALL
+                                SELECT r.id, tree.depth + 1, tree.path || r.rank, tree.ids || r.id
+                                FROM ranked r JOIN tree ON (r.parent = tree.id)
+                                WHERE NOT r.id = ANY(tree.ids)
+                            ), sizes AS (
+                                SELECT unnest(ids) AS id, count(*) AS size FROM tree GROUP BY 1
+                            )
+                            SELECT tree.id, tree.depth, sizes.size,
+                                   row_number() OVER (ORDER BY tree.path) - 1 AS idx
+                            FROM tree JOIN sizes ON (sizes.id = tree.id)
+                      ) AS n
+                      WHERE "%(table)s".id = n.id""" % {
+                'table': self._table,
+                'parent': self._parent_name,
+                'order': self._parent_order or self._order,
+                'base': base,
+            }, (start, stride, start, stride) + params, debug=self._debug)
+
+    def _parent_store_place(self, cr, id, parent):
+        """ Give its bounds to the new record id in the parent_left/
+            parent_right nested set, or move them with the ones of its
+            children, after it has been put under parent.
+
+            The record takes free positions between its siblings, so that
+            only its rows are updated. When there are not enough of them,
+            the subtree of the closest ancestor that has room for its nodes
+            is renumbered, or the whole nested set if none has.
+
+            The free positions are read and taken while holding a lock on
+            the parent (see _parent_store_lock()), so that concurrent
+            inserts under the same parent do not take the same ones, while
+            inserts under different parents run in parallel.
+        """
+        table = self._table
+        cr.execute('SELECT parent_left, parent_right FROM "%s" WHERE id=%%s' % (table,), (id,))
+        pleft, pright = cr.fetchone()
+        moved = pleft is not None and pright is not None
+        width = moved and (pright - pleft + 1) or 2
+
+        self._parent_store_lock(cr, parent)
+        # the free positions are between the previous and the next siblings,
+        # in the order of the parent
+        if parent:
+            cr.execute('SELECT parent_left, parent_right FROM "%s" WHERE id=%%s' % (table,), (parent,))
+            start, end = cr.fetchone()
+            if moved and start is not None and pleft <= start < pright:
+                raise except_orm(_('UserError'), _('Recursivity Detected.'))
+            clause, params = '"%s"=%%s' % (self._parent_name,), (parent,)
+        else:
+            start, end = 0, None
+            clause, params = '"%s" IS NULL' % (self._parent_name,), ()
+        cr.execute('SELECT id, parent_left, parent_right FROM "%s" WHERE %s ORDER BY %s' % \
+                    (table, clause, self._parent_order or self._order), params)
+        after = False
+        for sibling, sleft, sright in cr.fetchall():
+            if sibling == id:
+                after = True
+            elif sleft is None or sright is None:
+                continue
+            elif after:
+                end = sleft
+                break
+            else:
+                start = sright
+        if not parent and end is None:
+            # last root: after all the other records
+            cr.execute('SELECT max(parent_right) FROM "%s" WHERE id != %%s' % (table,), (id,))
+            start = max(start, cr.fetchone()[0] or 0)
+
+        room = False
+        if start is not None and (end is None or end - start - 1 >= width):
+            # make sure that the positions are not used by other records,
+            # when the order of the siblings is not the one of the bounds
+            query = 'SELECT 1 FROM "%s" WHERE parent_left > %%s' % (table,)
+            query_params = [start]
+            if end is not None:
+                query += ' AND parent_left < %s'
+                query_params.append(end)
+            if moved:
+                query += ' AND NOT (parent_left >= %s AND parent_left < %s)'
+                query_params += [pleft, pright]
+            cr.execute(query + ' LIMIT 1', query_params)
+            room = not cr.rowcount
+        if room:
+            if end is None:
+                gap = self._parent_store_gap()
+            else:
+                gap = min(self._parent_store_gap(), (end - start - 1 - width) // 3)
+            left = start + 1 + gap
+            if moved:
+                cr.execute('UPDATE "%s" SET parent_left=parent_left+%%s, parent_right=parent_right+%%s '
+                           'WHERE parent_left >= %%s AND parent_left < %%s' % (table,),
+                           (left - pleft, left - pleft, pleft, pright))
+            else:
+                cr.execute('UPDATE "%s" SET parent_left=%%s, parent_right=%%s WHERE id=%%s' % (table,),
+                           (left, left + 1 + gap, id))
+            return
+
+        ancestor = parent
+        while ancestor:
+            cr.execute('SELECT parent_left, parent_right, "%s" FROM "%s" WHERE id=%%s FOR UPDATE' % \
+                        (self._parent_name, table), (ancestor,))
+            aleft, aright, aparent = cr.fetchone()
+            if aleft is None or aright is None:
+                break
+            # the inserts under the nodes of the subtree must wait for its
+            # renumbering
+            cr.execute('SELECT id FROM "%s" WHERE parent_left > %%s AND parent_left < %%s FOR UPDATE' % \
+                        (table,), (aleft, aright))
+            cr.execute("""WITH RECURSIVE tree(id) AS (
+                              SELECT %%s
+                            UNION
+                              SELECT t.id FROM "%s" t JOIN tree ON (t."%s" = tree.id)
+                          ) SELECT count(*) FROM tree""" % (table, self._parent_name), (ancestor,))
+            size = cr.fetchone()[0]
+            stride = (aright - aleft) // (2 * size - 1)
+            if stride >= 2:
+                self._parent_store_number(cr, ancestor, aleft, stride)
+                cr.execute('UPDATE "%s" SET parent_right=%%s WHERE id=%%s' % (table,), (aright, ancestor))
+                return
+            ancestor = aparent
+        self._parent_store_lock(cr, False)
+        cr.execute('SELECT id FROM "%s" FOR UPDATE' % (table,))
+        self._parent_store_compute(cr)
+
+    def _parent_store_lock(self, cr, parent):
+        """ Lock the parent row until the end of the transaction, before its
+            free positions are looked for. The top-level records have no
+            parent row: the row of the model in ir_model stands for it.
+        """
+        if parent:
+            cr.execute('SELECT id FROM "%s" WHERE id=%%s FOR UPDATE' % (self._table,), (parent,))
+        else:
+            cr.execute('SELECT id FROM ir_model WHERE model=%s FOR UPDATE', (self._name,))
+
     def _update_store(self, cr, f, k):
         _logger.debug("storing computed values of field '%s.%s'" % (self._name, k,))
         ss = self._columns[k]._symbol_set
@@ -3664,6 +4173,30 @@ class orm(orm_template):
 
         return result
 
+    def read_iter(self, cr, user, domain, offset=0, limit=None, order=None, fields=None, context=None, load='_classic_read', itersize=None):
+        """ Generator variant of search_read(), fetching the ids through a
+            server-side cursor. See orm_template.read_iter().
+        """
+        if context is None:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'read', context=context)
+        self._store_flush(cr)
+
+        query = self._where_calc(cr, user, domain, context=context)
+        self._apply_ir_rules(cr, user, query, 'read', context=context)
+        order_by = self._generate_order_by(order, query)
+        from_clause, where_clause, where_clause_params = query.get_sql()
+
+        limit_str = limit and ' LIMIT %d' % limit or ''
+        offset_str = offset and ' OFFSET %d' % offset or ''
+        where_str = where_clause and (" WHERE %s" % where_clause) or ''
+
+        for rows in cr.iterate('SELECT "%s".id FROM ' % self._table + from_clause +
+                where_str + order_by + limit_str + offset_str,
+                where_clause_params, itersize=itersize, debug=self._debug):
+            for r in self._read_chunk(cr, user, [x['id'] for x in rows], fields, context, load):
+                yield r
+
     def _read_flat(self, cr, user, ids, fields_to_read, context=None, load='_classic_read'):
         """ Perform the SQL query for reading data
           @param ids can be a list of integers, *or* a tuple of (query, order, limit, offset)
@@ -3673,6 +4206,7 @@ class orm(orm_template):
             context = {}
         if not ids:
             return []
+        self._store_flush(cr)
         s_query = None
         if isinstance(ids, (list, tuple)):
             ids = map(lambda x:int(x), ids)
@@ -3773,7 +4307,10 @@ class orm(orm_template):
                 params.append(s_query.limit)
                 
             # Perform the big read of the table, fetch the data!
-            cr.execute(query, params, debug=self._debug)
+            if s_query:
+                cr.execute(query, params, debug=self._debug)
+            else:
+                cr.execute_hot(query, params, debug=self._debug)
 
             if ids is not None and rule_clause:
                 ids = list(set(ids)) # eliminate duplicates
@@ -3863,10 +4400,10 @@ class orm(orm_template):
         if todo and getattr(self, '_function_field_browse', False):
             if self._debug:
                 _logger.debug('%s: using browse_records in function fields for %r', self._name, ids)
-            browse_cache = {self._name: {} }
+            browse_cache = {self._name: browse_model_cache() }
             for r in res:
                 # pre-fill the cache with all data we have so far
-                browse_cache[self._name][r['id']] = r
+                browse_cache[self._name].update(r['id'], r)
             browse_records = browse_record_list( [ \
                     browse_record(cr, user, id, table=self, cache=browse_cache, context=context, fields_only=True)
                     for id in ids ])
@@ -4064,8 +4601,7 @@ class orm(orm_template):
         ir_property.unlink(cr, uid, property_ids, context=context)
 
         wf_service = netsvc.LocalService("workflow")
-        for oid in ids:
-            wf_service.trg_delete(uid, self._name, oid, cr)
+        wf_service.trg_delete_multi(uid, self._name, ids, cr)
 
 
         # Shall we also remove the inherited records in python, here?
@@ -4089,13 +4625,15 @@ class orm(orm_template):
                     (self._name, list(ids), ['%s,%s' % (self._name, sid) for sid in ids]),
                     debug=self._debug)
 
+        result = []
         for order, object, store_ids, fields in result_store:
             if object != self._name:
                 obj =  self.pool.get(object)
                 cr.execute('SELECT id FROM '+obj._table+' WHERE id = ANY(%s)', (store_ids,))
                 rids = map(lambda x: x[0], cr.fetchall())
                 if rids:
-                    obj._store_set_values(cr, uid, rids, fields, context)
+                    result.append((order, object, rids, fields))
+        self._store_process(cr, uid, result, context)
 
         return True
 
@@ -4296,70 +4834,14 @@ class orm(orm_template):
             if self.pool._init:
                 self.pool._init_parent[self._name]=True
             else:
-                order = self._parent_order or self._order
-                parent_val = vals[self._parent_name]
-                if parent_val:
-                    clause, params = '%s=%%s' % (self._parent_name,), (parent_val,)
-                else:
-                    clause, params = '%s IS NULL' % (self._parent_name,), ()
-
                 for id in parents_changed:
-                    cr.execute('SELECT parent_left, parent_right FROM %s WHERE id=%%s' % (self._table,), (id,))
-                    pleft, pright = cr.fetchone()
-                    distance = pright - pleft + 1
-
-                    # Positions of current siblings, to locate proper insertion point;
-                    # this can _not_ be fetched outside the loop, as it needs to be refreshed
-                    # after each update, in case several nodes are sequentially inserted one
-                    # next to the other (i.e computed incrementally)
-                    cr.execute('SELECT parent_right, id FROM %s WHERE %s ORDER BY %s' % (self._table, clause, order), params)
-                    parents = cr.fetchall()
-
-                    # Find Position of the element
-                    position = None
-                    for (parent_pright, parent_id) in parents:
-                        if parent_id == id:
-                            break
-                        position = parent_pright+1
-
-                    # It's the first node of the parent
-                    if not position:
-                        if not parent_val:
-                            position = 1
-                        else:
-                            cr.execute('SELECT parent_left FROM '+self._table+' WHERE id=%s', (parent_val,))
-                            position = cr.fetchone()[0]+1
-
-                    if pleft < position <= pright:
-                        raise except_orm(_('UserError'), _('Recursivity Detected.'))
-
-                    if pleft < position:
-                        cr.execute('UPDATE '+self._table+' SET parent_left=parent_left+%s WHERE parent_left >= %s', (distance, position))
-                        cr.execute('UPDATE '+self._table+' SET parent_right=parent_right+%s where parent_right >= %s', (distance, position))
-                        cr.execute('UPDATE '+self._table+' SET parent_left=parent_left+%s, parent_right=parent_right+%s WHERE parent_left >= %s AND parent_left < %s', (position-pleft,position-pleft, pleft, pright))
-                    else:
-                        cr.execute('UPDATE '+self._table+' SET parent_left=parent_left+%s WHERE parent_left >= %s', (distance, position))
-                        cr.execute('UPDATE '+self._table+' SET parent_right=parent_right+%s WHERE parent_right >= %s', (distance, position))
-                        cr.execute('UPDATE '+self._table+' SET parent_left=parent_left-%s, parent_right=parent_right-%s WHERE parent_left >= %s AND parent_left < %s', (pleft-position+distance,pleft-position+distance, pleft+distance, pright+distance))
+                    self._parent_store_place(cr, id, vals[self._parent_name])
 
         result += self._store_get_values(cr, user, ids, vals.keys(), context)
-        result.sort()
-
-        done = {}
-        for order, object, ids_r, fields_r in result:
-            key = (object,tuple(fields_r))
-            done.setdefault(key, {})
-            # avoid to do several times the same computation
-            todo = []
-            for id in ids_r:
-                if id not in done[key]:
-                    done[key][id] = True
-                    todo.append(id)
-            self.pool.get(object)._store_set_values(cr, user, todo, fields_r, context)
+        self._store_process(cr, user, result, context)
 
         wf_service = netsvc.LocalService("workflow")
-        for id in ids:
-            wf_service.trg_write(user, self._name, id, cr)
+        wf_service.trg_write_multi(user, self._name, ids, cr)
         return True
 
     #
@@ -4391,6 +4873,161 @@ class orm(orm_template):
             context = {}
         self.pool.get('ir.model.access').check(cr, user, self._name, 'create', context=context)
 
+        vals, tocreate = self._create_split(cr, user, vals, context)
+
+        # We here assume that the model is a real table. If not, the end of this block
+        # will raise an SQL exception and rollback the intermediate steps. Hopefully.
+        # Example : any dashboard which has all the fields readonly.(due to Views(database views))
+
+        (upd0, upd1, upd2) = ([], [], [])
+        parent_context = self._create_parent_context(context)
+        for table in tocreate:
+            record_id = tocreate[table].pop('id', None)
+            if record_id is None or not record_id:
+                record_id = self.pool.get(table).create(cr, user, tocreate[table], context=parent_context)
+            else:
+                self.pool.get(table).write(cr, user, [record_id], tocreate[table], context=parent_context)
+
+            upd0.append(self._inherits[table])
+            upd1.append('%s')
+            upd2.append(record_id)
+
+        (cols0, cols1, cols2, upd_todo) = self._create_columns(cr, user, vals, context)
+        upd0 += cols0
+        upd1 += cols1
+        upd2 += cols2
+        cr.execute('INSERT INTO "%s" (%s) VALUES (%s) RETURNING id' % \
+                    (self._table, ', '.join(upd0), ','.join(upd1)), tuple(upd2), debug=self._debug)
+        id_new = cr.fetchone()[0]
+        self.check_access_rule(cr, user, [id_new], 'create', context=context)
+
+        if self._parent_store and not context.get('defer_parent_store_computation'):
+            if self.pool._init:
+                self.pool._init_parent[self._name]=True
+            else:
+                self._parent_store_place(cr, id_new, vals.get(self._parent_name, False))
+
+        rel_context = self._create_rel_context(context)
+        result = []
+        for field in upd_todo:
+            result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
+        self._validate(cr, user, [id_new], context)
+
+        if not context.get('no_store_function', False):
+            result += self._store_get_values(cr, user, [id_new], vals.keys(), context)
+            self._store_process(cr, user, result, context)
+
+        if self._log_create and not (context and context.get('no_store_function', False)):
+            message = self._description + \
+                " '" + \
+                self.name_get(cr, user, [id_new], context=context)[0][1] + \
+                "' " + _("created.")
+            self.log(cr, user, id_new, message, True, context=context)
+        wf_service = netsvc.LocalService("workflow")
+        wf_service.trg_create(user, self._name, id_new, cr)
+        return id_new
+
+    def create_multi(self, cr, user, vals_list, context=None):
+        """
+        Create several records at once: the rows are inserted with
+        multi-row INSERT statements, then the constraints are checked, the
+        stored function fields recomputed and the workflows started once
+        for all the new records.
+
+        Models that override create() get their records created one by
+        one through it, so that their own logic still applies.
+
+        :param vals_list: list of dictionaries of field values, as for create()
+        :return: ids of the new records, in the order of ``vals_list``
+        :raise AccessError, ValidateError, UserError: as create()
+        """
+        if self.create.im_func is not orm.create.im_func:
+            return super(orm, self).create_multi(cr, user, vals_list, context=context)
+        if not vals_list:
+            return []
+        if not context:
+            context = {}
+        self.pool.get('ir.model.access').check(cr, user, self._name, 'create', context=context)
+
+        records = [self._create_split(cr, user, vals, context) for vals in vals_list]
+
+        # the _inherits parents, created at once too
+        rows = [([], [], []) for vals in vals_list]
+        parent_context = self._create_parent_context(context)
+        for table, column in self._inherits.items():
+            parent = self.pool.get(table)
+            new_rows = []
+            new_vals = []
+            for row, (vals, tocreate) in zip(rows, records):
+                record_id = tocreate[table].pop('id', None)
+                if record_id is None or not record_id:
+                    new_rows.append(row)
+                    new_vals.append(tocreate[table])
+                else:
+                    parent.write(cr, user, [record_id], tocreate[table], context=parent_context)
+                row[0].append(column)
+                row[1].append('%s')
+                row[2].append(record_id)
+            for row, parent_id in zip(new_rows, parent.create_multi(cr, user, new_vals, context=parent_context)):
+                row[2][-1] = parent_id
+
+        todo = []
+        for row, (vals, tocreate) in zip(rows, records):
+            (cols0, cols1, cols2, upd_todo) = self._create_columns(cr, user, vals, context)
+            row[0].extend(cols0)
+            row[1].extend(cols1)
+            row[2].extend(cols2)
+            todo.append(upd_todo)
+
+        # the ids are taken from the sequence beforehand, to insert the
+        # rows with the same columns together, whatever their order
+        cr.execute('SELECT nextval(%s) FROM generate_series(1, %s)', (self._sequence, len(rows)))
+        ids = [r[0] for r in cr.fetchall()]
+        groups = {}
+        for id_new, (upd0, upd1, upd2) in zip(ids, rows):
+            groups.setdefault((tuple(upd0), tuple(upd1)), []).append([id_new] + upd2)
+        for (upd0, upd1), values in groups.items():
+            row_sql = '(' + ','.join(('%s',) + upd1) + ')'
+            for sub_values in tools.misc.split_every(self.CREATE_MULTI_ROWS, values, list):
+                cr.execute('INSERT INTO "%s" (%s) VALUES %s' % \
+                            (self._table, ', '.join(('id',) + upd0), ','.join([row_sql] * len(sub_values))),
+                           tuple(itertools.chain(*sub_values)), debug=self._debug)
+        self.check_access_rule(cr, user, ids, 'create', context=context)
+
+        if self._parent_store and not context.get('defer_parent_store_computation'):
+            if self.pool._init:
+                self.pool._init_parent[self._name]=True
+            else:
+                for id_new, (vals, tocreate) in zip(ids, records):
+                    self._parent_store_place(cr, id_new, vals.get(self._parent_name, False))
+
+        rel_context = self._create_rel_context(context)
+        result = []
+        written = set()
+        for id_new, (vals, tocreate), upd_todo in zip(ids, records, todo):
+            for field in upd_todo:
+                result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
+            written.update(vals)
+        self._validate(cr, user, ids, context)
+
+        if not context.get('no_store_function', False):
+            result += self._store_get_values(cr, user, ids, list(written), context)
+            self._store_process(cr, user, result, context)
+
+        if self._log_create and not (context and context.get('no_store_function', False)):
+            for id_new, name in self.name_get(cr, user, ids, context=context):
+                message = self._description + " '" + name + "' " + _("created.")
+                self.log(cr, user, id_new, message, True, context=context)
+        wf_service = netsvc.LocalService("workflow")
+        wf_service.trg_create_multi(user, self._name, ids, cr)
+        return ids
+
+    def _create_split(self, cr, user, vals, context):
+        """ Complete vals with the default values, and move the values of
+            the fields of the _inherits parents out of it
+
+            :return: (vals, {parent model: values of the parent record})
+        """
         vals = self._add_missing_default_values(cr, user, vals, context)
 
         tocreate = {}
@@ -4402,8 +5039,6 @@ class orm(orm_template):
             if self.pool.get(v)._vtable:
                 tocreate[v]['_vptr'] = self._name
 
-        (upd0, upd1, upd2) = ([], [], [])
-        upd_todo = []
         for v in vals.keys():
             if v == '_vptr':
                 continue
@@ -4415,29 +5050,35 @@ class orm(orm_template):
                 if (v not in self._inherit_fields) and (v not in self._columns):
                     del vals[v]
 
-        # We here assume that the model is a real table. If not, the end of this block
-        # will raise an SQL exception and rollback the intermediate steps. Hopefully.
-        # Example : any dashboard which has all the fields readonly.(due to Views(database views))
-
         for table in tocreate:
             if self._inherits[table] in vals:
                 del vals[self._inherits[table]]
+        return vals, tocreate
 
-            record_id = tocreate[table].pop('id', None)
-            
-            # When linking/creating parent records, force context without 'no_store_function' key that
-            # defers stored functions computing, as these won't be computed in batch at the end of create(). 
-            parent_context = dict(context)
-            parent_context.pop('no_store_function', None)
-            
-            if record_id is None or not record_id:
-                record_id = self.pool.get(table).create(cr, user, tocreate[table], context=parent_context)
-            else:
-                self.pool.get(table).write(cr, user, [record_id], tocreate[table], context=parent_context)
+    def _create_parent_context(self, context):
+        # When linking/creating parent records, force context without 'no_store_function' key that
+        # defers stored functions computing, as these won't be computed in batch at the end of create().
+        parent_context = dict(context)
+        parent_context.pop('no_store_function', None)
+        return parent_context
 
-            upd0.append(self._inherits[table])
-            upd1.append('%s')
-            upd2.append(record_id)
+    def _create_rel_context(self, context):
+        # default element in context must be removed when call a one2many or many2many
+        rel_context = context.copy()
+        for c in context.items():
+            if c[0].startswith('default_'):
+                del rel_context[c[0]]
+        return rel_context
+
+    def _create_columns(self, cr, user, vals, context):
+        """ Check the values of a new record, and return what to insert
+            in the columns of its table
+
+            :return: (column names, SQL placeholders, SQL parameters,
+                      fields to set after the insertion)
+        """
+        (upd0, upd1, upd2) = ([], [], [])
+        upd_todo = []
 
         #Start : Set bool fields to be False if they are not touched(to make search more powerful)
         bool_fields = [x for x in self._columns.keys() if self._columns[x]._type=='boolean']
@@ -4484,65 +5125,8 @@ class orm(orm_template):
             upd0 += ['create_uid', 'create_date']
             upd1 += ['%s', 'now()']
             upd2.append(user)
-        cr.execute('INSERT INTO "%s" (%s) VALUES (%s) RETURNING id' % \
-                    (self._table, ', '.join(upd0), ','.join(upd1)), tuple(upd2), debug=self._debug)
-        id_new = cr.fetchone()[0]
-        self.check_access_rule(cr, user, [id_new], 'create', context=context)
         upd_todo.sort(lambda x, y: self._columns[x].priority-self._columns[y].priority)
-
-        if self._parent_store and not context.get('defer_parent_store_computation'):
-            if self.pool._init:
-                self.pool._init_parent[self._name]=True
-            else:
-                parent = vals.get(self._parent_name, False)
-                if parent:
-                    cr.execute('SELECT parent_right FROM '+self._table+' WHERE '+self._parent_name+'=%s ORDER BY '+(self._parent_order or self._order), (parent,))
-                    pleft_old = None
-                    result_p = cr.fetchall()
-                    for (pleft,) in result_p:
-                        if not pleft:
-                            break
-                        pleft_old = pleft
-                    if not pleft_old:
-                        cr.execute('SELECT parent_left FROM '+self._table+' WHERE id=%s', (parent,))
-                        pleft_old = cr.fetchone()[0]
-                    pleft = pleft_old
-                else:
-                    cr.execute('SELECT max(parent_right) FROM '+self._table)
-                    pleft = cr.fetchone()[0] or 0
-                cr.execute('UPDATE '+self._table+' SET parent_left=parent_left+2 WHERE parent_left > %s', (pleft,))
-                cr.execute('UPDATE '+self._table+' SET parent_right=parent_right+2 WHERE parent_right > %s', (pleft,))
-                cr.execute('UPDATE '+self._table+' SET parent_left=%s,parent_right=%s WHERE id=%s', (pleft+1,pleft+2,id_new))
-
-        # default element in context must be removed when call a one2many or many2many
-        rel_context = context.copy()
-        for c in context.items():
-            if c[0].startswith('default_'):
-                del rel_context[c[0]]
-
-        result = []
-        for field in upd_todo:
-            result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
-        self._validate(cr, user, [id_new], context)
-
-        if not context.get('no_store_function', False):
-            result += self._store_get_values(cr, user, [id_new], vals.keys(), context)
-            result.sort()
-            done = []
-            for order, object, ids, fields2 in result:
-                if not (object, ids, fields2) in done:
-                    self.pool.get(object)._store_set_values(cr, user, ids, fields2, context)
-                    done.append((object, ids, fields2))
-
-        if self._log_create and not (context and context.get('no_store_function', False)):
-            message = self._description + \
-                " '" + \
-                self.name_get(cr, user, [id_new], context=context)[0][1] + \
-                "' " + _("created.")
-            self.log(cr, user, id_new, message, True, context=context)
-        wf_service = netsvc.LocalService("workflow")
-        wf_service.trg_create(user, self._name, id_new, cr)
-        return id_new
+        return (upd0, upd1, upd2, upd_todo)
 
     def _store_get_values(self, cr, uid, ids, fields, context):
         """Returns an ordered list of fields.functions to call due to
@@ -4598,6 +5182,7 @@ class orm(orm_template):
             return True
         field_flag = False
         field_dict = {}
+        values = {}     # { id: { field: value } }
         if self._log_access:
             cr.execute('SELECT id,write_date FROM '+self._table+' WHERE id = ANY (%s)', (map(int, ids),))
             res = cr.fetchall()
@@ -4629,10 +5214,8 @@ class orm(orm_template):
                 for id, value in result.items():
                     if field_flag:
                         for f in value.keys():
-                            if f in field_dict[id]:
+                            if f in field_dict.get(id, ()):
                                 value.pop(f)
-                    upd0 = []
-                    upd1 = []
                     for v in value:
                         if v not in val:
                             continue
@@ -4641,13 +5224,7 @@ class orm(orm_template):
                                 value[v] = value[v][0]
                             except:
                                 pass
-                        upd0.append('"'+v+'"='+self._columns[v]._symbol_set[0])
-                        upd1.append(self._columns[v]._symbol_set[1](value[v]))
-                    upd1.append(id)
-                    if upd0 and upd1:
-                        cr.execute('UPDATE "' + self._table + '" SET ' + \
-                            ','.join(upd0) + ' WHERE id = %s', upd1,
-                            debug=self._debug)
+                        values.setdefault(id, {})[v] = value[v]
 
             else:
                 for f in val:
@@ -4664,12 +5241,90 @@ class orm(orm_template):
                                 value = value[0]
                             except:
                                 pass
-                        cr.execute('UPDATE "' + self._table + '" SET ' + \
-                            '"'+f+'"='+self._columns[f]._symbol_set[0] + ' WHERE id = %s', 
-                                (self._columns[f]._symbol_set[1](value),id),
-                                debug=self._debug)
+                        values.setdefault(id, {})[f] = value
+        self._store_write_values(cr, values)
         return True
 
+    def _store_write_values(self, cr, values):
+        """ Write the values of stored function fields, {id: {field: value}},
+            with an UPDATE ... FROM (VALUES ...) statement per set of fields
+            and per chunk of records
+        """
+        groups = {}
+        for id, value in values.items():
+            groups.setdefault(tuple(sorted(value)), []).append(id)
+        for fields, ids in groups.items():
+            columns = [self._columns[f] for f in fields]
+            casts = [get_pg_type(column) for column in columns]
+            row_sql = '(%s,' + ','.join([column._symbol_set[0] for column in columns]) + ')'
+            set_sql = ','.join(['"%s"=v."%s"%s' % (f, f, cast and '::' + cast[0] or '')
+                                for f, cast in zip(fields, casts)])
+            for sub_ids in tools.misc.split_every(cr.IN_MAX, ids, list):
+                params = []
+                for id in sub_ids:
+                    params.append(id)
+                    for f, column in zip(fields, columns):
+                        params.append(column._symbol_set[1](values[id][f]))
+                cr.execute('UPDATE "%s" SET %s FROM (VALUES %s) AS v(id, %s) WHERE "%s".id = v.id' % \
+                            (self._table, set_sql, ','.join([row_sql] * len(sub_ids)),
+                             ','.join(['"%s"' % f for f in fields]), self._table),
+                           params, debug=self._debug)
+
+    def _store_process(self, cr, uid, result, context):
+        """ Recompute the stored function fields given by result, as
+            returned by _store_get_values(), doing each field once per record.
+
+            With the ``defer_store_function`` context key, or the option of
+            the same name in the ``[orm]`` section, they are queued for the
+            whole transaction instead (see store_queue). With the
+            ``store_function_background`` context key, the largest queued
+            recomputations are done in the background after the commit.
+        """
+        if not result:
+            return
+        context = context or {}
+        if context.get('defer_store_function',
+                       config.get_misc('orm', 'defer_store_function', False)):
+            queue = store_queue.attach(cr, self.pool, context)
+            queue.add(result)
+            if context.get('store_function_background'):
+                queue.background = True
+            return
+        result.sort()
+        done = {}
+        for order, object, ids_r, fields_r in result:
+            key = (object,tuple(fields_r))
+            done.setdefault(key, {})
+            # avoid to do several times the same computation
+            todo = []
+            for id in ids_r:
+                if id not in done[key]:
+                    done[key][id] = True
+                    todo.append(id)
+            self.pool.get(object)._store_set_values(cr, uid, todo, fields_r, context)
+
+    def _store_flush(self, cr):
+        """ Do the queued recomputations of stored function fields, of any
+            model
+        """
+        queue = store_queue.get(cr)
+        if queue is not None and queue.todo:
+            queue.flush(cr)
+
+    def _store_recompute(self, db_name, ids, fields):
+        """ Recompute stored function fields outside of any request, by
+            chunks of records, each in its own transaction
+        """
+        import pooler
+        db = pooler.get_db_only(db_name)
+        for sub_ids in tools.misc.split_every(1000, ids, list):
+            cr = db.cursor()
+            try:
+                self._store_set_values(cr, 1, sub_ids, fields, {})
+                cr.commit()
+            finally:
+                cr.close()
+
     #
     # TODO: Validate
     #
@@ -4864,6 +5519,7 @@ class orm(orm_template):
         if context is None:
             context = {}
         self.pool.get('ir.model.access').check(cr, access_rights_uid or user, self._name, 'read', context=context)
+        self._store_flush(cr)
 
         query = self._where_calc(cr, user, args, context=context)
         self._apply_ir_rules(cr, user, query, 'read', context=context)
@@ -5123,7 +5779,7 @@ class orm(orm_template):
         if type(ids) in (int, long):
             ids = [ids]
         query = 'SELECT COUNT(id) FROM "%s"  WHERE ID = ANY(%%s)' % (self._table)
-        cr.execute(query, (ids,), debug=self._debug)
+        cr.execute_hot(query, (ids,), debug=self._debug)
         return cr.fetchone()[0] == len(ids)
 
     def check_recursion(self, cr, uid, ids, context=None, parent=None):
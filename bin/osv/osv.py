@@ -120,7 +120,10 @@ class object_proxy(netsvc.Service):
             try:
                 if not pooler.get_pool(dbname)._ready:
                     raise except_osv('Database not ready', 'Currently, this database is not fully loaded and can not be used.')
-                return f(self, dbname, *args, **kwargs)
+                pooler.check_cache_signaling(dbname)
+                res = f(self, dbname, *args, **kwargs)
+                pooler.signal_caches_change(dbname)
+                return res
             except orm.except_orm, inst:
                 if inst.name == 'AccessError':
                     self.logger.debug("AccessError", exc_info=True)
@@ -240,6 +243,13 @@ class object_proxy(netsvc.Service):
 
     def exec_workflow_cr(self, cr, uid, obj, method, *args):
         wf_service = netsvc.LocalService("workflow")
+        if isinstance(args[0], list):
+            # Signal all the records at once, return the first action, if any
+            res = wf_service.trg_validate_multi(uid, obj, args[0], method, cr)
+            for res_id in args[0]:
+                if res.get(res_id):
+                    return res[res_id]
+            return False
         return wf_service.trg_validate(uid, obj, args[0], method, cr)
 
     @check
@@ -284,6 +294,8 @@ class osv_pool(object):
         self.logger = logging.getLogger("pool")
         #: Store some values, temprarily, for the init phase
         self._init_values = {}
+        #: seconds spent loading each module, see addons.load_module_graph
+        self.module_load_times = {}
 
     def init_set(self, cr, mode):
         different = mode != self._init
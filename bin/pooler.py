@@ -19,60 +19,263 @@
 #
 ##############################################################################
 
+import threading
+import time
+
 pool_dic = {}
 
+#: last seen value of the cache signaling sequence, per database
+_cache_signaling = {}
+
+#: databases whose registry is completely loaded
+_loaded = set()
+#: last time the registry of each database was asked for
+_last_used = {}
+#: seconds spent building the registry of each database
+_load_times = {}
+#: per-database locks, held while a registry is built
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _db_lock(db_name):
+    _locks_lock.acquire()
+    try:
+        lock = _locks.get(db_name)
+        if lock is None:
+            lock = _locks[db_name] = threading.RLock()
+        return lock
+    finally:
+        _locks_lock.release()
+
 def get_db_and_pool(db_name, force_demo=False, status=None, update_module=False, pooljobs=True, languages=False):
+    """ Return the database and the registry of db_name, which is built
+        on the first call.
+
+        Only one thread builds a registry, the others wait for it to be
+        complete; the thread building it gets it as it is, as the modules
+        being loaded need it.
+    """
     if not status:
         status={}
 
     db = get_db_only(db_name)
 
-    if db_name in pool_dic:
-        pool = pool_dic[db_name]
-    else:
-        import addons
-        import osv.osv
-        import logging
-        from tools import config
-        
-        log = logging.getLogger('pooler')
-        allowed_res = config.get_misc('databases', 'allowed')
-        if allowed_res:
-            dbs_allowed = [ x.strip() for x in allowed_res.split(' ')]
-            if db_name not in dbs_allowed:
-                log.critical('Illegal database requested: %s', db_name)
-                raise AttributeError('Illegal database: %s'% db_name)
-
-        log.info("Starting pooler of database: %s" % db_name)
-        
-        pool = osv.osv.osv_pool()
-        pool_dic[db_name] = pool
+    if db_name in _loaded:
+        pool = pool_dic.get(db_name)
+        if pool is not None:
+            _last_used[db_name] = time.time()
+            return db, pool
 
-        try:
-            addons.load_modules(db, force_demo, status, update_module, languages=languages)
-        except Exception:
-            del pool_dic[db_name]
-            log.exception("Could not load modules for %s" % db_name)
-            raise
+    lock = _db_lock(db_name)
+    lock.acquire()
+    try:
+        if db_name in pool_dic:
+            pool = pool_dic[db_name]
+            loaded = False
+        else:
+            pool = _load_pool(db, force_demo, status, update_module, pooljobs, languages)
+            loaded = True
+        _last_used[db_name] = time.time()
+    finally:
+        lock.release()
+    if loaded:
+        _evict_pools()
+    return db, pool
+
+def _load_pool(db, force_demo, status, update_module, pooljobs, languages):
+    """ Build the registry of the database db, must be called with its lock
+        held
+    """
+    import addons
+    import osv.osv
+    import logging
+    from tools import config
+
+    db_name = db.dbname
+    log = logging.getLogger('pooler')
+    allowed_res = config.get_misc('databases', 'allowed')
+    if allowed_res:
+        dbs_allowed = [ x.strip() for x in allowed_res.split(' ')]
+        if db_name not in dbs_allowed:
+            log.critical('Illegal database requested: %s', db_name)
+            raise AttributeError('Illegal database: %s'% db_name)
+
+    log.info("Starting pooler of database: %s" % db_name)
+    start = time.time()
+
+    pool = osv.osv.osv_pool()
+    pool_dic[db_name] = pool
+
+    try:
+        addons.load_modules(db, force_demo, status, update_module, languages=languages)
+    except Exception:
+        del pool_dic[db_name]
+        log.exception("Could not load modules for %s" % db_name)
+        raise
+
+    cr = db.cursor()
+    try:
+        pool.init_set(cr, False)
+        pool.get('ir.actions.report.xml').register_all(cr)
+        if config.get_misc('cache', 'signaling', False):
+            _cache_signaling[db_name] = _init_cache_signaling(cr)
+        cr.commit()
+    finally:
+        cr.close()
+
+    if pooljobs:
+        pool.get('ir.cron').restart(db.dbname)
+    _loaded.add(db_name)
+    _load_times[db_name] = time.time() - start
+    log.info('Successfuly loaded database "%s" in %.3fs' % (db_name, _load_times[db_name]))
+    for module, seconds in sorted(pool.module_load_times.items(), key=lambda x: -x[1]):
+        log.debug('    module %s: %.3fs', module, seconds)
+    return pool
+
+def _evict_pools():
+    """ Free the least recently used registries while there are more than
+        `[databases] max_pools` (0, the default, for no limit), but only
+        the ones that have not been used for `[databases] pool_idle`
+        seconds and have no open cursor
+    """
+    import logging
+    import sql_db
+    from tools import config
 
-        cr = db.cursor()
+    max_pools = int(config.get_misc('databases', 'max_pools', 0))
+    if not max_pools or len(_loaded) <= max_pools:
+        return
+    idle = time.time() - int(config.get_misc('databases', 'pool_idle', 300))
+    candidates = sorted([(_last_used.get(name, 0), name) for name in list(_loaded)])
+    count = len(candidates)
+    for used, db_name in candidates:
+        if count <= max_pools or used > idle:
+            break
+        lock = _db_lock(db_name)
+        if not lock.acquire(False):
+            # being built or restarted
+            continue
         try:
-            pool.init_set(cr, False)
-            pool.get('ir.actions.report.xml').register_all(cr)
-            cr.commit()
+            if sql_db._Pool.used_count(sql_db.dsn(db_name)):
+                continue
+            logging.getLogger('pooler').info('Freeing the pooler of database: %s', db_name)
+            _loaded.discard(db_name)
+            pool_dic.pop(db_name, None)
+            _cache_signaling.pop(db_name, None)
+            _load_times.pop(db_name, None)
+            sql_db.close_db(db_name)
+            count -= 1
         finally:
-            cr.close()
+            lock.release()
+
+def preload_databases(db_names, wait=False, pooljobs=True):
+    """ Build the registries of the databases db_names in the background,
+        in parallel; the requests to these databases wait for them
+
+        @param wait return only when all the registries are built, e.g.
+            to share them with the processes forked afterwards
+        @param pooljobs start the scheduled actions of the databases
+    """
+    import logging
+    def load(db_name):
+        try:
+            get_db_and_pool(db_name, pooljobs=pooljobs)
+        except Exception:
+            logging.getLogger('pooler').exception('Could not preload database %s', db_name)
+    threads = []
+    for db_name in db_names:
+        thread = threading.Thread(target=load, args=(db_name,), name='preload-%s' % db_name)
+        thread.setDaemon(True)
+        thread.start()
+        threads.append(thread)
+    if wait:
+        for thread in threads:
+            thread.join()
+
+def stats():
+    """ Return a newline-delimited string of the loaded registries """
+    now = time.time()
+    res = ["Poolers: %d loaded" % len(_loaded)]
+    for db_name in sorted(_loaded):
+        pool = pool_dic.get(db_name)
+        if pool is None:
+            continue
+        times = sorted(pool.module_load_times.items(), key=lambda x: -x[1])[:5]
+        res.append("    %s: loaded in %.3fs, idle for %ds, slowest modules: %s" % \
+                (db_name, _load_times.get(db_name, 0.0), now - _last_used.get(db_name, now),
+                ', '.join(['%s %.3fs' % t for t in times])))
+    return '\n'.join(res)
 
-        if pooljobs:
-            pool.get('ir.cron').restart(db.dbname)
-        log.info('Successfuly loaded database \"%s\"' % db_name)
-    return db, pool
 
+def _init_cache_signaling(cr):
+    """ Make sure the cache signaling sequence exists, return its value
+    """
+    cr.execute("SELECT relname FROM pg_class WHERE relkind = 'S' AND relname = 'base_cache_signaling'")
+    if not cr.fetchall():
+        cr.execute("CREATE SEQUENCE base_cache_signaling INCREMENT BY 1 START WITH 1")
+        cr.execute("SELECT nextval('base_cache_signaling')")
+    cr.execute("SELECT last_value FROM base_cache_signaling")
+    return cr.fetchone()[0]
+
+def check_cache_signaling(db_name):
+    """ Discard the local caches of db_name, if another server process has
+        signalled that they are stale.
+
+        Shall be called before serving any request on that database. It is
+        a no-op unless the "cache.signaling" option is set.
+    """
+    if db_name not in _cache_signaling:
+        return
+    import logging
+    import tools
+
+    cr = get_db_only(db_name).cursor()
+    try:
+        cr.execute("SELECT last_value FROM base_cache_signaling")
+        seq = cr.fetchone()[0]
+    finally:
+        cr.close()
+    if seq != _cache_signaling[db_name]:
+        logging.getLogger('pooler').debug("Caches of %s invalidated by another process", db_name)
+        tools.cache.clean_caches_for_db(db_name, signal=False)
+        _cache_signaling[db_name] = seq
+
+def signal_caches_change(db_name):
+    """ Tell the other server processes, if the current thread has cleared
+        any cache of db_name.
+
+        Shall be called once the transaction that caused the change has
+        been committed.
+    """
+    import tools
+    if not tools.cache.pop_changed(db_name):
+        return
+    if db_name not in _cache_signaling:
+        return
+
+    cr = get_db_only(db_name).cursor()
+    try:
+        cr.execute("SELECT nextval('base_cache_signaling')")
+        seq = cr.fetchone()[0]
+        cr.commit()
+    finally:
+        cr.close()
+    if seq != _cache_signaling[db_name] + 1:
+        # some other process has signalled in the meanwhile, which we
+        # would miss by just storing the new value
+        tools.cache.clean_caches_for_db(db_name, signal=False)
+    _cache_signaling[db_name] = seq
 
 def restart_pool(db_name, force_demo=False, status=None, update_module=False, languages=False):
-    if db_name in pool_dic:
-        del pool_dic[db_name]
-    return get_db_and_pool(db_name, force_demo, status, update_module=update_module, languages=languages)
+    lock = _db_lock(db_name)
+    lock.acquire()
+    try:
+        _loaded.discard(db_name)
+        if db_name in pool_dic:
+            del pool_dic[db_name]
+        return get_db_and_pool(db_name, force_demo, status, update_module=update_module, languages=languages)
+    finally:
+        lock.release()
 
 
 def get_db_only(db_name):
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+""" Render RML documents to PDF in worker processes
+
+    The documents are evaluated by the server (see rml2pdf.utils.expand),
+    only the layout by reportlab, which holds the GIL, is done by the
+    workers. Their number is the ``workers`` option of the ``[report]``
+    section; with 0, the default, everything is rendered by the server.
+"""
+
+import logging
+import threading
+import tools
+import rml2pdf
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+_logger = logging.getLogger('report.render_pool')
+
+class render_job(object):
+    """ A document to render, with everything the renderer needs
+
+        The RML is already expanded: it is rendered without localcontext,
+        so that the [[ ]] in the values of the records are not evaluated.
+    """
+    __slots__ = ('rml', 'internal_header', 'images', 'path', 'title', 'page_limit')
+
+    def __init__(self, rml, internal_header, images, path, title, page_limit):
+        self.rml = rml
+        self.internal_header = internal_header
+        self.images = images
+        self.path = path
+        self.title = title
+        self.page_limit = page_limit
+
+    def __getstate__(self):
+        return (self.rml, self.internal_header, self.images, self.path, self.title, self.page_limit)
+
+    def __setstate__(self, state):
+        (self.rml, self.internal_header, self.images, self.path, self.title, self.page_limit) = state
+
+    def render(self):
+        return rml2pdf.parseNode(self.rml, None, images=self.images, path=self.path,
+                                 title=self.title, page_limit=self.page_limit,
+                                 internal_header=self.internal_header)
+
+def _render(job):
+    return job.render()
+
+class render_pool(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._size = 0
+
+    def workers(self):
+        """ Number of worker processes, 0 if rendering is done in-process
+        """
+        if multiprocessing is None:
+            return 0
+        return int(tools.config.get_misc('report', 'workers', 0))
+
+    def _get_pool(self):
+        size = self.workers()
+        self._lock.acquire()
+        try:
+            if self._pool is None or self._size != size:
+                if self._pool is not None:
+                    self._pool.close()
+                _logger.info('Starting %d report rendering processes', size)
+                self._pool = multiprocessing.Pool(size)
+                self._size = size
+            return self._pool
+        finally:
+            self._lock.release()
+
+    def render(self, items):
+        """ Return an iterator over items, in the same order, where the
+            render_job instances are replaced by the PDF documents they
+            give, as (data, 'pdf') tuples. They are rendered in parallel.
+        """
+        jobs = [item for item in items if isinstance(item, render_job)]
+        if not jobs:
+            return iter(items)
+        if self.workers():
+            rendered = self._get_pool().imap(_render, jobs)
+        else:
+            rendered = (job.render() for job in jobs)
+        return self._merge(items, rendered)
+
+    def _merge(self, items, rendered):
+        for item in items:
+            if isinstance(item, render_job):
+                yield (rendered.next(), 'pdf')
+            else:
+                yield item
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        finally:
+            self._lock.release()
+
+pool = render_pool()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
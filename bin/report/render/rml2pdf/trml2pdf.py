@@ -269,8 +269,10 @@ class _rml_styles(object,):
         return style
 
 class _rml_doc(object):
-    def __init__(self, node, localcontext, images={}, path='.', title=None, page_limit=None):
+    def __init__(self, node, localcontext, images={}, path='.', title=None, page_limit=None,
+                 internal_header=False):
         self.localcontext = localcontext
+        self.internal_header = internal_header
         self.etree = node
         self.filename = self.etree.get('filename')
         self.images = images
@@ -349,7 +351,7 @@ class _rml_doc(object):
         if len(el):
             pt_obj = _rml_template(self.localcontext, out, el[0], self, 
                     images=self.images, path=self.path, title=self.title,
-                    page_limit=self.page_limit)
+                    page_limit=self.page_limit, internal_header=self.internal_header)
             el = utils._child_get(self.etree, self, 'story')
             pt_obj.render(el)
         else:
@@ -980,10 +982,11 @@ class TinyDocTemplate(platypus.BaseDocTemplate):
 
 class _rml_template(object):
     def __init__(self, localcontext, out, node, doc, images=None, path='.', 
-            title=None, page_limit=None):
+            title=None, page_limit=None, internal_header=False):
         if localcontext is None:
             localcontext={'internal_header':True}
         self.localcontext = localcontext
+        self.internal_header = internal_header
         if images is None:
             self.images = {}
         else:
@@ -1041,19 +1044,28 @@ class _rml_template(object):
             # Reset Page Number with new story tag
             fis.append(PageReset())
             story_cnt += 1
-        if self.localcontext and self.localcontext.get('internal_header',False):
+        if self.internal_header or (self.localcontext and self.localcontext.get('internal_header',False)):
             self.doc_tmpl.afterFlowable(fis)
             self.doc_tmpl.build(fis,canvasmaker=NumberedCanvas)
         else:
             self.doc_tmpl.build(fis)
 
-def parseNode(rml, localcontext=None,fout=None, images=None, path='.',title=None, page_limit=None):
+def parseNode(rml, localcontext=None,fout=None, images=None, path='.',title=None, page_limit=None,
+              internal_header=False):
+    """ Render the RML document rml to PDF
+
+        @param localcontext the values of the [[ expressions ]] of rml,
+                nothing is evaluated if it is empty
+        @param internal_header whether to number the pages for the internal
+                header, as localcontext['internal_header'] does
+    """
     node = etree.XML(rml)
     if localcontext is None:
         localcontext = {}
     if images is None:
         images = {}
-    r = _rml_doc(node, localcontext, images, path, title=title, page_limit=page_limit)
+    r = _rml_doc(node, localcontext, images, path, title=title, page_limit=page_limit,
+                 internal_header=internal_header)
     #try to override some font mappings
     try:
         from customfonts import SetCustomFonts
@@ -41,6 +41,7 @@ import locale
 
 import logging
 import re
+from lxml import etree
 import reportlab
 import sys
 
@@ -130,6 +131,12 @@ def _child_get(node, self=None, tagname=None):
 def _process_text(self, txt):
         if not self.localcontext:
             return str2xml(txt)
+        return str2xml(_eval_text(self, txt))
+
+def _eval_text(self, txt):
+        """ Translate txt and replace its [[ expressions ]] with their
+            values, as _process_text() but without escaping the result
+        """
         if not txt:
             return ''
         result = ''
@@ -151,7 +158,44 @@ def _process_text(self, txt):
                     result += txt
                 elif txt and (txt is not None) and (txt is not False):
                     result += ustr(txt)
-        return str2xml(result)
+        return result
+
+class _evaluator(object):
+    def __init__(self, localcontext):
+        self.localcontext = localcontext
+
+def _expand_node(self, node, out):
+    for n in _child_get(node, self):
+        if not isinstance(n.tag, basestring):
+            # comments and processing instructions
+            continue
+        attrib = dict((k, v) for k, v in n.attrib.items() if not k.startswith('rml_'))
+        n2 = etree.SubElement(out, n.tag, attrib)
+        if n.tag == 'image' and not (n.get('file') or n.get('name')):
+            # as trml2pdf: the data of the image is the value of the expression
+            n2.text = n.text
+            for key in _regex.findall(n.text or ''):
+                n2.text = eval(key, {}, self.localcontext) or ''
+        else:
+            n2.text = _eval_text(self, n.text)
+        _expand_node(self, n, n2)
+        n2.tail = _eval_text(self, n.tail)
+
+def expand(node, localcontext):
+    """ Return a copy of the (preprocessed) RML document node, with its
+        loops, conditions and [[ expressions ]] evaluated in localcontext.
+
+        The result renders as node would, without localcontext, so it can
+        be sent to another process. The stories are evaluated first, as
+        trml2pdf builds all their flowables before drawing the pages.
+    """
+    self = _evaluator(localcontext)
+    root = etree.Element(node.tag, node.attrib)
+    stories = etree.Element(node.tag)
+    _expand_node(self, [n for n in node if n.tag == 'story'], stories)
+    _expand_node(self, [n for n in node if n.tag != 'story'], root)
+    root.extend(list(stories))
+    return root
 
 def text_get(node):
     return ''.join([ustr(n.text) for n in node])
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+""" Cache of the documents printed by reports, on disk
+
+    Only the reports listed in the ``render_cache_reports`` option of the
+    ``[report]`` section are cached, as the others may print values that
+    change without their records being written (e.g. the current date).
+    The documents are files named after the hash of their key, in
+    ``render_cache_dir``, and the least recently used ones are removed
+    when they take more than ``render_cache_size`` MB.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import tools
+
+_logger = logging.getLogger('report.render_cache')
+
+class render_cache(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dir = None
+        self._size = None    # bytes taken by the files of the cache
+        self.hits = self.misses = self.evicted = 0
+
+    def enabled(self, report_name):
+        """ Tell whether the documents of the report report_name (without
+            the 'report.' prefix) are cached
+        """
+        names = tools.config.get_misc('report', 'render_cache_reports', '')
+        return report_name in [n.strip() for n in names.split(',')]
+
+    def _get_dir(self):
+        if self._dir is None:
+            path = tools.config.get_misc('report', 'render_cache_dir', None) or \
+                    os.path.join(tempfile.gettempdir(), 'openerp-report-cache')
+            if not os.path.isdir(path):
+                os.makedirs(path, 0700)
+            self._dir = path
+        return self._dir
+
+    def _path(self, key):
+        return os.path.join(self._get_dir(), hashlib.sha1(repr(key)).hexdigest())
+
+    def get(self, key):
+        """ Return the (document, format) cached for key, or None """
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            format = f.readline()[:-1]
+            result = f.read()
+        finally:
+            f.close()
+        try:
+            # the modification time of the files orders the evictions
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return result, format
+
+    def put(self, key, result, format):
+        """ Store the document result, of the given format, for key """
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self._get_dir(), prefix='.tmp-')
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write('%s\n' % format)
+            f.write(result)
+        finally:
+            f.close()
+        # the renaming is atomic, concurrent readers see the whole file
+        os.rename(tmp_path, path)
+        self._lock.acquire()
+        try:
+            if self._size is None:
+                self._size = sum([size for _, _, size in self._files()])
+            else:
+                self._size += len(result)
+            self._evict()
+        finally:
+            self._lock.release()
+
+    def _files(self):
+        """ Return the (modification time, path, size) of the cached
+            documents
+        """
+        res = []
+        path = self._get_dir()
+        for name in os.listdir(path):
+            if name.startswith('.'):
+                continue
+            try:
+                st = os.stat(os.path.join(path, name))
+            except OSError:
+                # removed by another process
+                continue
+            res.append((st.st_mtime, os.path.join(path, name), st.st_size))
+        return res
+
+    def _evict(self):
+        """ Remove the least recently used documents until the cache fits
+            in its size
+
+            Must be called with self._lock held
+        """
+        limit = int(tools.config.get_misc('report', 'render_cache_size', 100)) * 1024 * 1024
+        if self._size <= limit:
+            return
+        # recount, the files are shared with the other server processes
+        files = self._files()
+        files.sort()
+        self._size = sum([size for _, _, size in files])
+        for mtime, path, size in files:
+            if self._size <= limit:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evicted += 1
+        _logger.debug('%d evicted documents, %d bytes left', self.evicted, self._size)
+
+    def stats(self):
+        return "Report render cache: %d hits, %d misses, %d evicted" % \
+                (self.hits, self.misses, self.evicted)
+
+cache = render_cache()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
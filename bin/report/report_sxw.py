@@ -28,6 +28,9 @@ import re
 import time
 from interface import report_rml
 import preprocess
+from render import render_pool
+import render_cache
+from render.rml2pdf import utils as rml_utils
 import logging
 import pooler
 import tools
@@ -35,6 +38,7 @@ import zipfile
 import common
 from osv.fields import float as float_class, function as function_class
 from osv.orm import browse_record
+from tools.lru import LRU
 
 DT_FORMAT = '%Y-%m-%d'
 DHM_FORMAT = '%Y-%m-%d %H:%M:%S'
@@ -67,6 +71,9 @@ rml2sxw = {
     'para': 'p',
 }
 
+# preprocessed RML documents of the reports, see report_sxw._get_template()
+_templates = LRU(int(tools.config.get_misc('report', 'template_cache', 64)))
+
 class _format(object):
     def set_value(self, cr, uid, name, object, field, lang_obj):
         self.object = object
@@ -344,14 +351,16 @@ class rml_parse(object):
             text = ''.join(piece_list)
         return text
 
-    def _add_header(self, rml_dom, header='external'):
+    def _get_header(self, header='external'):
+        """ Return the RML of the header added by _add_header() """
         if header=='internal':
-            rml_head =  self.rml_header2
+            return self.rml_header2
         elif header=='internal landscape':
-            rml_head =  self.rml_header3
-        else:
-            rml_head =  self.rml_header
+            return self.rml_header3
+        return self.rml_header
 
+    def _add_header(self, rml_dom, header='external'):
+        rml_head = self._get_header(header)
         if not rml_head:
             return False
 
@@ -411,10 +420,9 @@ class report_sxw(report_rml, preprocess.report):
             context.update({'internal_header':self.internal_header})
         pool = pooler.get_pool(cr.dbname)
         ir_obj = pool.get('ir.actions.report.xml')
-        report_xml_ids = ir_obj.search(cr, uid,
-                [('report_name', '=', self.name[7:])], context=context)
-        if report_xml_ids:
-            report_xml = ir_obj.browse(cr, uid, report_xml_ids[0], context=context)
+        report_xml_id = ir_obj._lookup_report(cr, self.name[7:])[0]
+        if report_xml_id:
+            report_xml = ir_obj.browse(cr, uid, report_xml_id, context=context)
         else:
             title = ''
             report_file = tools.file_open(self.tmpl, subdir=None)
@@ -428,8 +436,6 @@ class report_sxw(report_rml, preprocess.report):
                 report_xml = a(title=title, report_type=report_type, report_rml_content=rml, name=title, attachment=False, header=self.header)
             finally:
                 report_file.close()
-        if report_xml.header:
-            report_xml.header = self.header
         report_type = report_xml.report_type
         if report_type in ['sxw','odt']:
             fnct = self.create_source_odt
@@ -441,11 +447,50 @@ class report_sxw(report_rml, preprocess.report):
             fnct = self.create_source_mako2html
         else:
             raise NotImplementedError('Unknown Report Type: %s' % report_type)
+        key = None
+        if report_xml_id and render_cache.cache.enabled(self.name[7:]):
+            key = self._render_cache_key(cr, uid, ids, data, report_xml, context)
+            if key is not None:
+                fnct_ret = render_cache.cache.get(key)
+                if fnct_ret is not None:
+                    # the records are not read: check that uid may read them
+                    table_obj = pool.get(self.table)
+                    pool.get('ir.model.access').check(cr, uid, self.table, 'read', context=context)
+                    table_obj.check_access_rule(cr, uid, list(set(ids)), 'read', context=context)
+                    return fnct_ret
         fnct_ret = fnct(cr, uid, ids, data, report_xml, context)
         if not fnct_ret:
             return (False,False)
+        if key is not None and fnct_ret[0]:
+            try:
+                render_cache.cache.put(key, fnct_ret[0], fnct_ret[1])
+            except (IOError, OSError):
+                logging.getLogger('report').warning('Could not cache the document of %s', self.name, exc_info=True)
         return fnct_ret
 
+    def _render_cache_key(self, cr, uid, ids, data, report_xml, context):
+        """ Return the key of the document printed for the ids records, in
+            the render cache: the report, the write dates of its definition
+            and of the records, the data, the language, and the groups and
+            company of uid, or None if it cannot be cached
+        """
+        table_obj = pooler.get_pool(cr.dbname).get(self.table)
+        if not (table_obj and table_obj._log_access) or not ids:
+            return None
+        # the records are printed in the order of ids, duplicates included
+        cr.execute('SELECT id, COALESCE(write_date, create_date) FROM "%s" WHERE id IN %%s' % table_obj._table,
+                   (tuple(set(ids)),))
+        write_dates = dict(cr.fetchall())
+        dates = tuple([(id, write_dates.get(id)) for id in ids])
+        cr.execute('SELECT gid FROM res_groups_users_rel WHERE uid=%s ORDER BY gid', (uid,))
+        groups = [gid for gid, in cr.fetchall()]
+        cr.execute('SELECT company_id FROM res_users WHERE id=%s', (uid,))
+        company = cr.fetchone()
+        write_date = pooler.get_pool(cr.dbname).get('ir.actions.report.xml')._lookup_report(cr, self.name[7:])[1]
+        return (cr.dbname, self.name, write_date, report_xml.report_type, dates,
+                repr(sorted((data or {}).items())), context.get('lang'), groups,
+                company and company[0])
+
     def create_source_odt(self, cr, uid, ids, data, report_xml, context=None):
         return self.create_single_odt(cr, uid, ids, data, report_xml, context or {})
 
@@ -460,7 +505,15 @@ class report_sxw(report_rml, preprocess.report):
             context={}
         pool = pooler.get_pool(cr.dbname)
         attach = report_xml.attachment
+        # render the documents of the records in worker processes, unless
+        # a subclass renders them its own way
+        if report_xml.report_type == 'pdf' and ids and len(ids) > 1 and render_pool.pool.workers() \
+                and type(self).create_single_pdf.im_func is report_sxw.create_single_pdf.im_func:
+            create_single = self.prepare_single_pdf
+        else:
+            create_single = self.create_single_pdf
         results = []
+        attachments = {}    # { index in results: (attachment name, record id) }
         if ids and attach:
             objs = self.getObjects(cr, uid, ids, context)
             for obj in objs:
@@ -476,28 +529,16 @@ class report_sxw(report_rml, preprocess.report):
                         results.append((d,'pdf'))
                         continue
                 # else, create the pdf again
-                result = self.create_single_pdf(cr, uid, [obj.id], data, report_xml, context)
+                result = create_single(cr, uid, [obj.id], data, report_xml, context)
                 if not result:
                     continue
                 if aname:
-                    try:
-                        name = aname+'.'+result[1]
-                        pool.get('ir.attachment').create(cr, uid, {
-                            'name': aname,
-                            'datas': base64.encodestring(result[0]),
-                            'datas_fname': name,
-                            'res_model': self.table,
-                            'res_id': obj.id,
-                            }, context=context
-                        )
-                    except Exception:
-                        #TODO: should probably raise a proper osv_except instead, shouldn't we? see LP bug #325632
-                        logging.getLogger('report').error('Could not create saved report attachment', exc_info=True)
+                    attachments[len(results)] = (aname, obj.id)
                 results.append(result)
         else:
             if ids:
                 for id in ids:
-                    result = self.create_single_pdf(cr, uid, [id], data, report_xml, context)
+                    result = create_single(cr, uid, [id], data, report_xml, context)
                     if result:
                         results.append(result)
             else:
@@ -506,41 +547,120 @@ class report_sxw(report_rml, preprocess.report):
                 if result:
                     results.append(result)
         if results:
-            if results[0][1] == 'pdf':
+            if isinstance(results[0], render_pool.render_job) or results[0][1] == 'pdf':
                 from pyPdf import PdfFileWriter, PdfFileReader
                 output = PdfFileWriter()
-                for r in results:
+                # the documents are merged as soon as they are rendered
+                for index, r in enumerate(render_pool.pool.render(results)):
+                    if index in attachments:
+                        self._save_attachment(cr, uid, r, attachments[index], context)
                     reader = PdfFileReader(cStringIO.StringIO(r[0]))
                     for page in range(reader.getNumPages()):
                         output.addPage(reader.getPage(page))
                 s = cStringIO.StringIO()
                 output.write(s)
-                return s.getvalue(), results[0][1]
+                return s.getvalue(), 'pdf'
+            for index in attachments:
+                self._save_attachment(cr, uid, results[index], attachments[index], context)
         return False
 
-    def create_single_pdf(self, cr, uid, ids, data, report_xml, context=None):
-        if not context:
-            context={}
-        logo = None
-        context = context.copy()
-        title = report_xml.name
+    def _save_attachment(self, cr, uid, result, attachment, context):
+        aname, res_id = attachment
+        try:
+            name = aname+'.'+result[1]
+            pooler.get_pool(cr.dbname).get('ir.attachment').create(cr, uid, {
+                'name': aname,
+                'datas': base64.encodestring(result[0]),
+                'datas_fname': name,
+                'res_model': self.table,
+                'res_id': res_id,
+                }, context=context
+            )
+        except Exception:
+            #TODO: should probably raise a proper osv_except instead, shouldn't we? see LP bug #325632
+            logging.getLogger('report').error('Could not create saved report attachment', exc_info=True)
+
+    def _parse_single_pdf(self, cr, uid, ids, data, report_xml, context):
+        """ Return the preprocessed RML document of the ids records, with
+            its parser, or (None, None) if the report has no RML
+        """
         rml = report_xml.report_rml_content
         # if no rml file is found
         if not rml:
-            return False
+            return None, None
         rml_parser = self.parser(cr, uid, self.name2, context=context)
         objs = self.getObjects(cr, uid, ids, context)
         rml_parser.set_context(objs, data, ids, report_xml.report_type)
-        processed_rml = etree.XML(rml)
-        if report_xml.header:
-            rml_parser._add_header(processed_rml, self.header)
+        return self._get_template(cr, report_xml, rml_parser), rml_parser
+
+    def _get_template(self, cr, report_xml, rml_parser):
+        """ Return the RML document of report_xml, parsed, with the header
+            of rml_parser and preprocessed.
+
+            The documents of the reports stored in the database are cached
+            by report, write date, type and header, and shared: they must
+            not be modified, but copied first.
+        """
+        header = report_xml.header and self.header
+        key = None
+        report_id = getattr(report_xml, 'id', False)
+        if report_id:
+            ir_obj = pooler.get_pool(cr.dbname).get('ir.actions.report.xml')
+            lookup_id, write_date = ir_obj._lookup_report(cr, self.name[7:])
+            if lookup_id == report_id:
+                key = (cr.dbname, self.name, report_id, write_date, report_xml.report_type,
+                       header, header and rml_parser._get_header(header))
+                try:
+                    return _templates[key]
+                except KeyError:
+                    pass
+        processed_rml = etree.XML(report_xml.report_rml_content)
+        if header:
+            rml_parser._add_header(processed_rml, header)
         processed_rml = self.preprocess_rml(processed_rml,report_xml.report_type)
+        if key is not None:
+            _templates[key] = processed_rml
+        return processed_rml
+
+    def create_single_pdf(self, cr, uid, ids, data, report_xml, context=None):
+        if not context:
+            context={}
+        logo = None
+        context = context.copy()
+        title = report_xml.name
+        processed_rml, rml_parser = self._parse_single_pdf(cr, uid, ids, data, report_xml, context)
+        if processed_rml is None:
+            return False
         if rml_parser.logo:
             logo = base64.decodestring(rml_parser.logo)
         create_doc = self.generators[report_xml.report_type]
         pdf = create_doc(etree.tostring(processed_rml),rml_parser.localcontext,logo,title.encode('utf8'))
         return (pdf, report_xml.report_type)
 
+    def prepare_single_pdf(self, cr, uid, ids, data, report_xml, context=None):
+        """ Same as create_single_pdf(), but only evaluate the document, and
+            return a render_pool.render_job to turn it into a PDF
+        """
+        if not context:
+            context={}
+        context = context.copy()
+        processed_rml, rml_parser = self._parse_single_pdf(cr, uid, ids, data, report_xml, context)
+        if processed_rml is None:
+            return False
+        images = dict(self.bin_datas)
+        if rml_parser.logo:
+            images['logo'] = base64.decodestring(rml_parser.logo)
+        else:
+            images.pop('logo', None)
+        try:
+            rml = etree.tostring(rml_utils.expand(processed_rml, rml_parser.localcontext))
+        except ValueError:
+            # values that cannot be put in an XML document, the renderer
+            # gets them through the localcontext
+            return self.create_single_pdf(cr, uid, ids, data, report_xml, context)
+        return render_pool.render_job(rml, self.internal_header, images,
+                                      self._get_path(), report_xml.name.encode('utf8'), self._page_limit)
+
     def create_single_odt(self, cr, uid, ids, data, report_xml, context=None):
         if not context:
             context={}
@@ -626,7 +746,7 @@ class report_sxw(report_rml, preprocess.report):
                              encoding='utf-8', xml_declaration=True)
         sxw_contents = {'content.xml':odt, 'meta.xml':meta}
 
-        if report_xml.header:
+        if report_xml.header and self.header:
             #Add corporate header/footer
             rml_file = tools.file_open(os.path.join('base', 'report', 'corporate_%s_header.xml' % report_type))
             try:
@@ -51,7 +51,20 @@ import select
 import socket
 import re
 import xmlrpclib
+import base64
+import datetime
+import itertools
 import StringIO
+import zlib
+import workers
+
+try:
+    import simplejson as json
+except ImportError:
+    try:
+        import json
+    except ImportError:
+        json = None
 
 from SimpleXMLRPCServer import SimpleXMLRPCDispatcher
 
@@ -103,6 +116,20 @@ class ThreadedHTTPServer(ConnThreadingMixIn, SimpleXMLRPCDispatcher, HTTPServer)
             flags |= fcntl.FD_CLOEXEC
             fcntl.fcntl(self.fileno(), fcntl.F_SETFD, flags)
         self.socket.settimeout(2)
+        # the server processes of workers.prefork() all wait for the
+        # connections of the socket, only one of them gets each: the others
+        # must not wait for the next one in accept()
+        self._accept_noblock = bool(workers.server_processes())
+
+    def get_request(self):
+        if not self._accept_noblock:
+            return HTTPServer.get_request(self)
+        sock = self.socket
+        sock.setblocking(0)
+        try:
+            return sock.accept()
+        finally:
+            sock.settimeout(2)
 
     def handle_error(self, request, client_address):
         """ Override the error handler
@@ -238,6 +265,10 @@ class BaseHttpDaemon(threading.Thread, netsvc.Server):
 
     def run(self):
         self.running = True
+        if workers.pool_threads():
+            # created here, as the threads of the poller do not survive
+            # the forks of workers.prefork()
+            self.server.poller = workers.get_poller()
         while self.running:
             try:
                 self.server.handle_request()
@@ -249,7 +280,10 @@ class BaseHttpDaemon(threading.Thread, netsvc.Server):
     def stats(self):
         res = "%sd: " % self._RealProto + ((self.running and "running") or  "stopped")
         if self.server:
-            res += ", %d threads" % (len(self.server._threads),)
+            if self.server.poller is not None:
+                res += ", connections served by the workers"
+            else:
+                res += ", %d threads" % (len(self.server._threads),)
         return res
 
     def append_svc(self, service):
@@ -443,7 +477,7 @@ class xrBaseRequestHandler(FixSendError, HttpLogHandler, SimpleXMLRPCServer.Simp
             max_chunk_size = 10*1024*1024
             clen = int(self.headers["content-length"])
             rbuffer = BoundStream(self.rfile, clen, chunk_size=max_chunk_size)
-            data = ''
+            chunks = []
             if self.headers.get('content-encoding',False) == 'gzip':
                 rbuffer = gzip.GzipFile(mode='rb', fileobj=rbuffer)
 
@@ -452,9 +486,10 @@ class xrBaseRequestHandler(FixSendError, HttpLogHandler, SimpleXMLRPCServer.Simp
                     chunk = rbuffer.read()
                     if not chunk:
                         break
-                    data += chunk
+                    chunks.append(chunk)
             except EOFError:
                 pass
+            data = ''.join(chunks)
 
             # In previous versions of SimpleXMLRPCServer, _dispatch
             # could be overridden in this class, instead of in
@@ -578,6 +613,205 @@ def init_xmlrpc():
                         secure_only=sso):
             logging.getLogger("web-services").info( "Registered XML-RPC 2.0 over HTTP")
 
+def _json_default(value):
+    """ Encode the values that the JSON encoder does not know, like the
+        XML-RPC marshaller would
+    """
+    if isinstance(value, xmlrpclib.Binary):
+        return base64.encodestring(value.data)
+    if isinstance(value, (xmlrpclib.DateTime, datetime.date)):
+        return str(value)
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+class jsonBaseRequestHandler(FixSendError, HttpLogHandler, BaseHTTPRequestHandler):
+    """ JSON-RPC 2.0 requests, sent by POST
+
+        The list results of more than _stream_rows rows are encoded and
+        sent by pieces, with the chunked transfer encoding, compressed on
+        the fly if the client accepts gzip.
+    """
+    protocol_version = 'HTTP/1.1'
+    _auth_domain = None
+    _logger = logging.getLogger('jsonrpc')
+    _stream_rows = 1000
+
+    def setup(self):
+        self.connection = dummyconn()
+
+    def handle(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def _read_body(self):
+        rbuffer = BoundStream(self.rfile, int(self.headers.get('content-length', 0)),
+                              chunk_size=10*1024*1024)
+        if self.headers.get('content-encoding',False) == 'gzip':
+            rbuffer = gzip.GzipFile(mode='rb', fileobj=rbuffer)
+        chunks = []
+        try:
+            while True:
+                chunk = rbuffer.read()
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except EOFError:
+            pass
+        return ''.join(chunks)
+
+    def _error(self, id, code, message, data=None):
+        error = {'code': code, 'message': message}
+        if data is not None:
+            error['data'] = data
+        return {'jsonrpc': '2.0', 'id': id, 'error': error}
+
+    def _call(self, request):
+        """ Run one request, return its response, or None for a
+            notification
+        """
+        if not isinstance(request, dict) or not isinstance(request.get('method'), basestring):
+            return self._error(None, -32600, 'Invalid Request')
+        id = request.get('id')
+        params = request.get('params', [])
+        if not isinstance(params, list):
+            return self._error(id, -32602, 'Invalid params', 'params must be an array')
+        try:
+            service_name = self.path.split("/")[-1]
+            result = self.dispatch(service_name, request['method'], params)
+        except netsvc.OpenERPDispatcherException, e:
+            response = self._error(id, e.get_faultCode(), tools.ustr(e.args[0]),
+                                   {'origin': e.args[2], 'details': tools.ustr(e.args[1]),
+                                    'traceback': e.traceback})
+        else:
+            response = {'jsonrpc': '2.0', 'id': id, 'result': result}
+        if 'id' not in request:
+            return None
+        return response
+
+    def do_POST(self):
+        try:
+            request = json.loads(self._read_body())
+        except ValueError, e:
+            response = self._error(None, -32700, 'Parse error', tools.ustr(e))
+        else:
+            if isinstance(request, list):
+                response = [r for r in map(self._call, request) if r is not None] or None
+            else:
+                response = self._call(request)
+        if response is None:
+            self.send_response(204)
+            self.send_header("Content-length", "0")
+            self.end_headers()
+            return
+        self._send(response)
+
+    def _encode(self, response):
+        """ Yield the JSON encoding of response, by pieces if it is a big
+            list result, whose rows are then encoded by batches
+        """
+        result = isinstance(response, dict) and response.get('result')
+        if not (isinstance(result, (list, tuple)) and len(result) > self._stream_rows):
+            yield json.dumps(response, default=_json_default)
+            return
+        head = dict(response)
+        del head['result']
+        yield json.dumps(head)[:-1] + ', "result": ['
+        for i in xrange(0, len(result), self._stream_rows):
+            rows = json.dumps(result[i:i + self._stream_rows], default=_json_default)[1:-1]
+            yield i and ',' + rows or rows
+        yield ']}'
+
+    def _write_chunk(self, data):
+        if data:
+            self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+
+    def _send(self, response):
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '').split(',')
+        pieces = self._encode(response)
+        data = pieces.next()
+        try:
+            more = pieces.next()
+        except StopIteration:
+            more = None
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        if more is not None and self.request_version == 'HTTP/1.1':
+            self.send_header('Transfer-Encoding', 'chunked')
+            if compress:
+                self.send_header('Content-Encoding', 'gzip')
+            self.end_headers()
+            zip = compress and zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            for data in itertools.chain([data, more], pieces):
+                if zip:
+                    data = zip.compress(data)
+                self._write_chunk(data)
+            if zip:
+                self._write_chunk(zip.flush())
+            self.wfile.write('0\r\n\r\n')
+        else:
+            if more is not None:
+                data = ''.join(itertools.chain([data, more], pieces))
+            if compress and len(data) > 512:
+                zip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                data = zip.compress(data) + zip.flush()
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header("Content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        self.wfile.flush()
+
+class JSONRPCRequestHandler(netsvc.OpenERPDispatcher, jsonBaseRequestHandler):
+    """ JSON-RPC dispatcher of the services, which take the credentials
+        in their parameters, as with /xmlrpc/
+    """
+    pass
+
+class JSONRPCRequestHandler2_Pub(netsvc.OpenERPDispatcher2, jsonBaseRequestHandler):
+    """ JSON-RPC dispatcher, Global methods, authenticated by HTTP
+    """
+    _auth_domain = 'pub'
+
+    def get_db_from_path(self, path):
+        return False
+
+class JSONRPCRequestHandler2_Root(netsvc.OpenERPDispatcher2, jsonBaseRequestHandler):
+    """ JSON-RPC dispatcher, Admin methods
+    """
+    _auth_domain = 'root'
+
+    def get_db_from_path(self, path):
+        return True
+
+class JSONRPCRequestHandler2_Db(netsvc.OpenERPDispatcher2, jsonBaseRequestHandler):
+    """ JSON-RPC dispatcher, DB methods
+    """
+    _auth_domain = 'db'
+
+    def get_db_from_path(self, path):
+        if path.startswith('/'):
+            path = path[1:]
+        db = path.split('/',1)[0]
+        return db
+
+def init_jsonrpc():
+    if not tools.config.get_misc('jsonrpc', 'enable', True):
+        return
+    if json is None:
+        logging.getLogger("web-services").warning("No json module, JSON-RPC is disabled")
+        return
+    sso = tools.config.get_misc('jsonrpc', 'ssl_require', False)
+    if reg_http_service(HTTPDir('/jsonrpc/', JSONRPCRequestHandler), secure_only=sso) \
+        and reg_http_service(HTTPDir('/jsonrpc2/pub/', JSONRPCRequestHandler2_Pub),
+                        secure_only=sso) \
+        and reg_http_service(HTTPDir('/jsonrpc2/root/', JSONRPCRequestHandler2_Root,
+                        OpenERPRootProvider(realm="OpenERP Admin", domain='root')),
+                        secure_only=sso) \
+        and reg_http_service(HTTPDir('/jsonrpc2/db/', JSONRPCRequestHandler2_Db,
+                        OpenERPAuthProvider()),
+                        secure_only=sso):
+        logging.getLogger("web-services").info("Registered JSON-RPC over HTTP")
+
 class StaticHTTPHandler(HttpLogHandler, FixSendError, HttpOptions, HTTPHandler):
     _logger = logging.getLogger('httpd')
     _HTTP_OPTIONS = { 'Allow': ['OPTIONS', 'GET', 'HEAD'] }
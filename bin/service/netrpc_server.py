@@ -35,6 +35,7 @@ import traceback
 import netsvc
 import tiny_socket
 import tools
+import workers
 
 class TinySocketClientThread(threading.Thread, netsvc.OpenERPDispatcher):
     def __init__(self, sock, threads):
@@ -60,44 +61,65 @@ class TinySocketClientThread(threading.Thread, netsvc.OpenERPDispatcher):
     def run(self):
         self.running = True
         try:
-            ts = tiny_socket.mysocket(self.sock)
+            self.ts = tiny_socket.mysocket(self.sock)
         except Exception:
             self.threads.remove(self)
             self.running = False
             return False
 
         while self.running:
-            try:
-                msg = ts.myreceive()
-                result = self.dispatch(msg[0], msg[1], msg[2:])
-                ts.mysend(result)
-            except socket.timeout:
-                #terminate this channel because other endpoint is gone
+            if not self.serve_one():
                 break
-            except netsvc.OpenERPDispatcherException, e:
-                try:
-                    new_e = Exception(e.compat_string()) # avoid problems of pickeling
-                    logging.getLogger('web-services').debug("netrpc: rpc-dispatching exception", exc_info=True)
-                    ts.mysend(new_e, exception=True, traceback=e.traceback)
-                except Exception:
-                    #terminate this channel if we can't properly send back the error
-                    logging.getLogger('web-services').exception("netrpc: cannot deliver exception message to client")
-                    break
-            except Exception, e:
-                try:
-                    tb = getattr(e, 'traceback', sys.exc_info())
-                    tb_s = "".join(traceback.format_exception(*tb))
-                    logging.getLogger('web-services').debug("netrpc: communication-level exception", exc_info=True)
-                    ts.mysend(e, exception=True, traceback=tb_s)
-                except Exception, ex:
-                    #terminate this channel if we can't properly send back the error
-                    logging.getLogger('web-services').exception("netrpc: cannot deliver exception message to client")
-                    break
 
         self.threads.remove(self)
         self.running = False
         return True
 
+    def serve_one(self):
+        """ Receive one request of the client and send back its answer
+
+            @return whether the connection must be kept open
+        """
+        ts = self.ts
+        try:
+            msg = ts.myreceive()
+            result = self.dispatch(msg[0], msg[1], msg[2:])
+            ts.mysend(result)
+        except socket.timeout:
+            #terminate this channel because other endpoint is gone
+            return False
+        except netsvc.OpenERPDispatcherException, e:
+            try:
+                new_e = Exception(e.compat_string()) # avoid problems of pickeling
+                logging.getLogger('web-services').debug("netrpc: rpc-dispatching exception", exc_info=True)
+                ts.mysend(new_e, exception=True, traceback=e.traceback)
+            except Exception:
+                #terminate this channel if we can't properly send back the error
+                logging.getLogger('web-services').exception("netrpc: cannot deliver exception message to client")
+                return False
+        except Exception, e:
+            try:
+                tb = getattr(e, 'traceback', sys.exc_info())
+                tb_s = "".join(traceback.format_exception(*tb))
+                logging.getLogger('web-services').debug("netrpc: communication-level exception", exc_info=True)
+                ts.mysend(e, exception=True, traceback=tb_s)
+            except Exception, ex:
+                #terminate this channel if we can't properly send back the error
+                logging.getLogger('web-services').exception("netrpc: cannot deliver exception message to client")
+                return False
+        return True
+
+    def close(self):
+        """ Close the connection, when it is served by a `workers.connection_poller` """
+        self.running = False
+        if self.sock:
+            try:
+                self.sock.shutdown(getattr(socket, 'SHUT_RDWR', 2))
+            except Exception:
+                pass
+            self.sock.close()
+            self.sock = None
+
     def stop(self):
         self.running = False
 
@@ -115,7 +137,11 @@ class TinySocketServerThread(threading.Thread,netsvc.Server):
         self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.socket.bind((self.__interface, self.__port))
         self.socket.listen(5)
+        # the server processes of workers.prefork() all accept on the
+        # socket, only one of them gets each connection
+        self.socket.setblocking(0)
         self.threads = []
+        self.poller = None
         self._log = logging.getLogger('web-services')
         self._log.info("starting NET-RPC service at %s port %d" % \
                         (interface or '0.0.0.0', port,))
@@ -123,13 +149,25 @@ class TinySocketServerThread(threading.Thread,netsvc.Server):
     def run(self):
         try:
             self.running = True
+            if workers.pool_threads():
+                # created here, as the threads of the poller do not
+                # survive the forks of workers.prefork()
+                self.poller = workers.get_poller()
             while self.running:
                 timeout = self.socket.gettimeout() or self._busywait_timeout
                 fd_sets = select.select([self.socket], [], [], timeout)
                 if not fd_sets[0]:
                     continue
-                (clientsocket, address) = self.socket.accept()
+                try:
+                    (clientsocket, address) = self.socket.accept()
+                except socket.error:
+                    # taken by another server process
+                    continue
                 ct = TinySocketClientThread(clientsocket, self.threads)
+                if self.poller:
+                    ct.ts = tiny_socket.mysocket(clientsocket)
+                    self.poller.register(clientsocket, ct)
+                    continue
                 clientsocket = None
                 # ct.daemon = True
                 self.threads.append(ct)
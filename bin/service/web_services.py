@@ -32,11 +32,15 @@ import release
 import security
 import sql_db
 import sys
+import tempfile
 import threading
 import time
 import tools
+import workers
+import zlib
 from tools.translate import _
 from cStringIO import StringIO
+from report import render_cache
 
 #.apidoc title: Exported Service methods
 #.apidoc module-mods: member-order: bysource
@@ -67,13 +71,15 @@ class baseExportService(netsvc.ExportService):
         fn = getattr(self, 'exp_'+method)
         if domain == 'db':
             u, p, db, uid = auth.auth_creds[auth.last_auth]
+            pooler.check_cache_signaling(db)
             cr = pooler.get_db(db).cursor()
             try:
                 res = fn(cr, uid, *params)
                 cr.commit()
-                return res
             finally:
                 cr.close()
+            pooler.signal_caches_change(db)
+            return res
         else:
             return fn(*params)
 
@@ -423,11 +429,13 @@ class _ObjectService(baseExportService):
         (db, uid, passwd ) = params[0:3]
         params = params[3:]
         security.check(db,uid,passwd)
+        pooler.check_cache_signaling(db)
         cr = pooler.get_db(db).cursor()
         fn = getattr(self, 'exp_'+method)
         res = fn(cr, uid, *params)
         cr.commit()
         cr.close()
+        pooler.signal_caches_change(db)
         return res
 
 class common(_ObjectService):
@@ -685,6 +693,18 @@ GNU Public Licence.
         res += netsvc.Server.allStats()
         res += "\n"
         res += netsvc.ExportService.allStats()
+        res += "\n"
+        res += tools.cache.allStats()
+        res += "\n"
+        res += render_cache.cache.stats()
+        res += "\n"
+        res += netsvc.Agent.allStats()
+        res += "\n"
+        res += sql_db._Pool.stats()
+        res += "\n"
+        res += pooler.stats()
+        res += "\n"
+        res += workers.stats()
         try:
             import gc
             if gc.isenabled():
@@ -879,7 +899,10 @@ class wizard(dbExportDispatch,baseExportService):
     def _execute(self, db, uid, wiz_id, datas, action, context):
         self.wiz_datas[wiz_id].update(datas)
         wiz = netsvc.LocalService('wizard.'+self.wiz_name[wiz_id])
-        return wiz.execute(db, uid, self.wiz_datas[wiz_id], action, context)
+        pooler.check_cache_signaling(db)
+        res = wiz.execute(db, uid, self.wiz_datas[wiz_id], action, context)
+        pooler.signal_caches_change(db)
+        return res
 
     def exp_create(self, db, uid, wiz_name, datas=None):
         if not datas:
@@ -904,12 +927,15 @@ class wizard(dbExportDispatch,baseExportService):
             raise Exception, 'WizardNotFound'
 wizard()
 
-#
-# TODO: set a maximum report number per user to avoid DOS attacks
 #
 # Report state:
 #     False -> True
 #
+# The jobs wait in a queue until the number of reports running for their
+# database and for their user are below the limits of the [report] section,
+# their results are spooled to temporary files and freed when fetched or,
+# if nobody claims them, once result_ttl seconds have passed.
+#
 
 class ExceptionWithTraceback(Exception):
     def __init__(self, msg, tb):
@@ -917,8 +943,36 @@ class ExceptionWithTraceback(Exception):
         self.traceback = tb
         self.args = (msg, tb)
 
+def _spool_encode(f, compress=False, chunk_size=57 * 1024):
+    """ Return the base64 encoding of the content of the file f, read and
+        encoded by chunks, zlib-compressed first if compress is set
+    """
+    zip = compress and zlib.compressobj()
+    out = StringIO()
+    rest = ''
+    f.seek(0)
+    while True:
+        data = f.read(chunk_size)
+        last = not data
+        if zip:
+            if last:
+                data = zip.flush()
+            else:
+                data = zip.compress(data)
+        data = rest + data
+        # base64 encodes 57 bytes per line, the lines of the chunks
+        # must be full to be concatenated
+        if last:
+            n = len(data)
+        else:
+            n = len(data) - len(data) % 57
+        out.write(base64.encodestring(data[:n]))
+        rest = data[n:]
+        if last:
+            return out.getvalue()
+
 class _report_spool_job(threading.Thread):
-    def __init__(self, id, db, uid, obj, ids, datas=None, context=None):
+    def __init__(self, id, db, uid, obj, ids, datas=None, context=None, on_done=None):
         """A report job, that should be spooled in the background
 
         @param id the index at the parent spool list, shall not be trusted,
@@ -928,6 +982,7 @@ class _report_spool_job(threading.Thread):
         @param obj the report orm object (string w/o the 'report.' prefix)
         @param ids of the obj model
         @param datas dictionary of input to report
+        @param on_done function called with the job when it has finished
         """
         threading.Thread.__init__(self)
         self.id = id
@@ -939,17 +994,25 @@ class _report_spool_job(threading.Thread):
         self.context = context
         if self.context is None:
             self.context = {}
+        self.on_done = on_done
         self.result = False
         self.format = None
         self.state = False
         self.exception = None
+        self.cr = None
         self.name = "report-%s-%s" % (self.report_obj, self.id)
+        self.queued = time.time()
+        self.started = None
+        self.finished = None
 
     def run(self):
+        self.started = time.time()
         try:
             self.cr = pooler.get_db(self.db).cursor()
+            pooler.check_cache_signaling(self.db)
             self.go()
             self.cr.commit()
+            pooler.signal_caches_change(self.db)
         except Exception, e:
             logger = logging.getLogger('web-services')
             logger.exception('Exception: %s' % (e))
@@ -972,6 +1035,9 @@ class _report_spool_job(threading.Thread):
             if self.cr:
                 self.cr.close()
                 self.cr = None
+            self.finished = time.time()
+            if self.on_done:
+                self.on_done(self)
         return True
         
         
@@ -986,6 +1052,12 @@ class _report_spool_job(threading.Thread):
             self.cr.rollback()
             self.cr.close()
             self.cr = None
+
+    def cancel(self):
+        """ Mark a job that has not been started as stopped """
+        self.exception = ExceptionWithTraceback('Report stopped: %r' % self, None)
+        self.state = True
+        self.finished = time.time()
         
     def __repr__(self):
         """Readable name of report job
@@ -999,19 +1071,58 @@ class _report_spool_job(threading.Thread):
         if not result:
             tb = sys.exc_info()
             self.exception = ExceptionWithTraceback('RML is not available at specified location or not enough data to print!', tb)
-        self.result = result
+        else:
+            self.spool(result)
         self.format = format
         self.state = True
         return True
 
+    def spool(self, result):
+        """ Write the result of the report to a temporary file, which
+            self.result becomes
+        """
+        #CHECKME: why is this needed???
+        if isinstance(result, unicode):
+            result = result.encode('latin1', 'replace')
+        f = tempfile.TemporaryFile(prefix='openerp-report-',
+                dir=tools.config.get_misc('report', 'spool_dir', None))
+        try:
+            f.write(result)
+            f.flush()
+        except Exception:
+            f.close()
+            raise
+        self.result = f
+
+    def encoded_result(self, compress=False):
+        """ Return the result of the report, base64-encoded (and
+            compressed by zlib first if compress is set), or False
+        """
+        if not self.result:
+            return False
+        return _spool_encode(self.result, compress)
+
+    def close(self):
+        """ Free the spooled result """
+        if self.result:
+            self.result.close()
+            self.result = False
+
 class report_spool(dbExportDispatch, baseExportService):
     _auth_commands = { 'db': ['report','report_get', 'report_stop'] }
     def __init__(self, name='report'):
         netsvc.ExportService.__init__(self, name)
         self.joinGroup('web-services')
         self._reports = {}
+        self._pending = []   # jobs waiting to be started, in order
+        self._running = {}   # { db or (db, uid): number of running jobs }
+        # finished jobs, total waiting and running times, reaped results
+        self._done = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+        self._reaped = 0
         self.id = 0
-        self.id_protect = threading.Semaphore()
+        self.id_protect = threading.Lock()
 
     def dispatch(self, method, auth, params):
         (db, uid, passwd ) = params[0:3]
@@ -1024,18 +1135,83 @@ class report_spool(dbExportDispatch, baseExportService):
         return res
 
     def stats(self, _pre_msg=None):
-        ret = baseExportService.stats(self, _pre_msg='%d reports' % len(self._reports))
-        for id, r in self._reports.items():
-            if not r:
-                continue
-            ret += '\n    [%d] ' % id
-            if r.is_alive() or not r.state:
-                ret += 'running '
-            else:
-                ret += 'finished '
-            ret += repr(r)
+        self.id_protect.acquire()
+        try:
+            msg = '%d reports, %d queued, %d running, %d done' % \
+                    (len(self._reports), len(self._pending),
+                    len([r for r in self._reports.values() if r.started and not r.finished]),
+                    self._done)
+            if self._done:
+                msg += ' (avg wait %.3fs, avg run %.3fs)' % \
+                        (self._wait_time / self._done, self._run_time / self._done)
+            msg += ', %d reaped' % self._reaped
+            ret = baseExportService.stats(self, _pre_msg=msg)
+            for db in sorted(set(r.db for r in self._reports.values())):
+                ret += '\n    %s: %d queued, %d running' % \
+                        (db, len([r for r in self._pending if r.db == db]),
+                        self._running.get(db, 0))
+            for id, r in self._reports.items():
+                if not r:
+                    continue
+                ret += '\n    [%d] ' % id
+                if not r.started and not r.finished:
+                    ret += 'queued '
+                elif r.is_alive() or not r.state:
+                    ret += 'running '
+                else:
+                    ret += 'finished '
+                ret += repr(r)
+        finally:
+            self.id_protect.release()
         return ret
 
+    def _start_jobs(self):
+        """ Start the pending jobs allowed by the limits of concurrent
+            reports per database and per user
+
+            Must be called with self.id_protect held
+        """
+        per_db = int(tools.config.get_misc('report', 'max_jobs_per_db', 4))
+        per_user = int(tools.config.get_misc('report', 'max_jobs_per_user', 2))
+        for job in self._pending[:]:
+            if per_db and self._running.get(job.db, 0) >= per_db:
+                continue
+            if per_user and self._running.get((job.db, job.uid), 0) >= per_user:
+                continue
+            self._pending.remove(job)
+            for key in (job.db, (job.db, job.uid)):
+                self._running[key] = self._running.get(key, 0) + 1
+            job.start()
+
+    def _job_done(self, job):
+        self.id_protect.acquire()
+        try:
+            for key in (job.db, (job.db, job.uid)):
+                self._running[key] -= 1
+                if not self._running[key]:
+                    del self._running[key]
+            self._done += 1
+            self._wait_time += job.started - job.queued
+            self._run_time += job.finished - job.started
+            self._start_jobs()
+        finally:
+            self.id_protect.release()
+
+    def _reap(self):
+        """ Free the results that have not been fetched in time
+
+            Must be called with self.id_protect held
+        """
+        ttl = int(tools.config.get_misc('report', 'result_ttl', 3600))
+        if not ttl:
+            return
+        limit = time.time() - ttl
+        for id, report in self._reports.items():
+            if report.finished and report.finished < limit:
+                del self._reports[id]
+                report.close()
+                self._reaped += 1
+
     def exp_report(self, db, uid, object, ids, datas=None, context=None):
         if not datas:
             datas={}
@@ -1043,12 +1219,16 @@ class report_spool(dbExportDispatch, baseExportService):
             context={}
 
         self.id_protect.acquire()
-        self.id += 1
-        id = self.id
-        self.id_protect.release()
-
-        self._reports[id] = _report_spool_job(id, db, uid, object, ids, datas=datas, context=context)
-        self._reports[id].start()
+        try:
+            self._reap()
+            self.id += 1
+            id = self.id
+            self._reports[id] = _report_spool_job(id, db, uid, object, ids, datas=datas,
+                                                  context=context, on_done=self._job_done)
+            self._pending.append(self._reports[id])
+            self._start_jobs()
+        finally:
+            self.id_protect.release()
         return id
 
     def _check_report(self, report_id):
@@ -1059,24 +1239,27 @@ class report_spool(dbExportDispatch, baseExportService):
         res = {'state': report.state }
         if res['state']:
             if tools.config['reportgz']:
-                import zlib
-                res2 = zlib.compress(report.result)
+                res2 = report.encoded_result(compress=True)
                 res['code'] = 'zlib'
             else:
-                #CHECKME: why is this needed???
-                if isinstance(report.result, unicode):
-                    res2 = report.result.encode('latin1', 'replace')
-                else:
-                    res2 = report.result
+                res2 = report.encoded_result()
             if res2:
-                res['result'] = base64.encodestring(res2)
+                res['result'] = res2
             res['format'] = report.format
             self.id_protect.acquire()
-            del self._reports[report_id]
-            self.id_protect.release()
+            try:
+                self._reports.pop(report_id, None)
+            finally:
+                self.id_protect.release()
+            report.close()
         return res
 
     def exp_report_get(self, db, uid, report_id):
+        self.id_protect.acquire()
+        try:
+            self._reap()
+        finally:
+            self.id_protect.release()
         if report_id in self._reports:
             if self._reports[report_id].uid == uid:
                 return self._check_report(report_id)
@@ -1098,6 +1281,14 @@ class report_spool(dbExportDispatch, baseExportService):
         if report_id in self._reports:
             report = self._reports[report_id]
             if report.uid == uid or uid == 1:
+                self.id_protect.acquire()
+                try:
+                    if report in self._pending:
+                        self._pending.remove(report)
+                        report.cancel()
+                        return True
+                finally:
+                    self.id_protect.release()
                 if report.is_alive() and not report.state:
                     report.stop()
                     report.join(timeout=timeout)
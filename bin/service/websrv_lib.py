@@ -337,12 +337,59 @@ class MultiHTTPHandler(FixSendError, HttpOptions, BaseHTTPRequestHandler):
     auth_required_msg = """ <html><head><title>Authorization required</title></head>
     <body>You must authenticate to use this service</body><html>\r\r"""
 
-    def __init__(self, request, client_address, server):
+    def __init__(self, request, client_address, server, serve=True):
         self.in_handlers = {}
         self.sec_realms = {}
+        if not serve:
+            # see attach()
+            self.request = request
+            self.client_address = client_address
+            self.server = server
+            self.setup()
+            self.log_message("MultiHttpHandler attached to %s" %(str(client_address)))
+            return
         SocketServer.StreamRequestHandler.__init__(self,request,client_address,server)
         self.log_message("MultiHttpHandler init for %s" %(str(client_address)))
 
+    @classmethod
+    def attach(cls, request, client_address, server):
+        """ Build a handler for the connection request, without serving
+            it: serve_one() must be called when a request comes in, and
+            close() when the connection is to be closed
+        """
+        return cls(request, client_address, server, serve=False)
+
+    def serve_one(self):
+        """ Serve the request that came in at the connection, and the
+            ones that are already buffered after it
+
+            @return whether the connection must be kept open
+        """
+        while True:
+            self.close_connection = 1
+            self.handle_one_request()
+            if self.close_connection:
+                return False
+            if not self._pending_input():
+                return True
+
+    def _pending_input(self):
+        """ Tell whether data is buffered at the input, which would not
+            make the connection readable
+        """
+        pending = getattr(self.connection, 'pending', None)
+        if pending is not None and pending():
+            return True
+        rbuf = getattr(self.rfile, '_rbuf', None)
+        if not rbuf:
+            return False
+        if hasattr(rbuf, 'tell'):
+            return rbuf.tell() > 0
+        return len(rbuf) > 0
+
+    def close(self):
+        self.finish()
+
     def _handle_one_foreign(self,fore, path, auth_provider):
         """ This method overrides the handle_one_request for *children*
             handlers. It is required, since the first line should not be
@@ -690,6 +737,11 @@ class ConnThreadingMixIn:
     # main process
     daemon_threads = False
 
+    # When set, the connections are handed to this poller (see
+    # service/workers.py), which handles their requests with a fixed
+    # set of threads, instead of a new thread each
+    poller = None
+
     def _get_next_name(self):
         return None
 
@@ -697,6 +749,8 @@ class ConnThreadingMixIn:
         """Start a new thread to process the request."""
         if not threading: # happens while quitting python
             return
+        if self.poller is not None:
+            return self._handle_request_pooled()
         n = self._get_next_name()
         t = threading.Thread(name=n, target=self._handle_request2)
         if self.daemon_threads:
@@ -738,4 +792,42 @@ class ConnThreadingMixIn:
                     pass
         self._mark_end(ct)
 
+    def _handle_request_pooled(self):
+        """ Accept a connection and hand it to the poller """
+        if not self.socket:
+            return
+        try:
+            request, client_address = self.get_request()
+        except (socket_error, socket.timeout):
+            # e.g. accepted by another server process
+            return
+        if self.verify_request(request, client_address):
+            self.poller.register(request, PooledConnection(self, request, client_address))
+        else:
+            self.close_request(request)
+
+class PooledConnection(object):
+    """ A connection served by a poller of ConnThreadingMixIn
+
+        Its handler is only built (and its setup(), e.g. the SSL
+        handshake, run) at the first request, in a thread of the poller.
+    """
+    def __init__(self, server, request, client_address):
+        self.server = server
+        self.request = request
+        self.client_address = client_address
+        self.handler = None
+
+    def serve_one(self):
+        if self.handler is None:
+            self.handler = self.server.RequestHandlerClass.attach(
+                    self.request, self.client_address, self.server)
+        return self.handler.serve_one()
+
+    def close(self):
+        if self.handler is not None:
+            self.handler.close()
+        else:
+            self.server.close_request(self.request)
+
 #eof
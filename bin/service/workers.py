@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+#.apidoc title: Worker threads and processes of the servers
+
+""" Serve the client connections with a fixed number of threads, and
+    optionally in several processes.
+
+    By default, the HTTP and NET-RPC servers keep one thread per client
+    connection, for as long as it is open. With ``threads`` set in the
+    ``[workers]`` section, the idle connections are watched by one
+    `connection_poller` thread instead, which hands them to its worker
+    threads when a request comes in.
+
+    With ``processes`` set, `prefork()` forks that many server processes,
+    which accept the connections of the listening sockets they share.
+    The parent process only runs the scheduled actions and restarts the
+    processes that die.
+"""
+
+import errno
+import logging
+import os
+import Queue
+import select
+import signal
+import socket
+import threading
+import time
+import tools
+
+_logger = logging.getLogger('workers')
+
+def pool_threads():
+    """ Number of worker threads of the servers of a process, 0 for a
+        thread per connection
+    """
+    if os.name != 'posix':
+        return 0
+    return int(tools.config.get_misc('workers', 'threads', 0))
+
+def server_processes():
+    """ Number of server processes forked by prefork(), 0 for none """
+    if os.name != 'posix':
+        return 0
+    return int(tools.config.get_misc('workers', 'processes', 0))
+
+class connection_poller(object):
+    """ Wait for requests on many connections, handle them with a fixed
+        number of threads.
+
+        The connections are registered with an object that handles them:
+        its ``serve_one()`` method is called by a worker thread when the
+        connection is readable, and tells whether the connection must be
+        kept, its ``close()`` method is called to drop the connection.
+    """
+    def __init__(self, name, threads, idle_timeout):
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._new = []          # (socket, handler) to register
+        self._conns = {}        # { fd: (socket, handler, time of last activity) }
+        self._busy = 0
+        self._served = 0
+        self._running = True
+        self._wake_r, self._wake_w = os.pipe()
+        thread = threading.Thread(target=self._poll, name='%s-poller' % name)
+        thread.setDaemon(True)
+        thread.start()
+        for i in range(threads):
+            thread = threading.Thread(target=self._work, name='%s-worker-%d' % (name, i))
+            thread.setDaemon(True)
+            thread.start()
+        self._threads = threads
+
+    def register(self, sock, handler):
+        """ Watch the connection sock, until its next request """
+        self._lock.acquire()
+        try:
+            self._new.append((sock, handler))
+        finally:
+            self._lock.release()
+        os.write(self._wake_w, 'x')
+
+    def _make_poll(self):
+        """ Return the poll object, its event mask and its timeout of 10
+            seconds, in its own unit: seconds for epoll, milliseconds for
+            poll
+        """
+        if hasattr(select, 'epoll'):
+            return select.epoll(), select.EPOLLIN | select.EPOLLPRI | select.EPOLLERR | select.EPOLLHUP, 10
+        return select.poll(), select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP, 10000
+
+    def _poll(self):
+        poll, mask, timeout = self._make_poll()
+        poll.register(self._wake_r, mask)
+        last_check = time.time()
+        while self._running:
+            try:
+                events = poll.poll(timeout)
+            except (IOError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            now = time.time()
+            for fd, event in events:
+                if fd == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                conn = self._conns.pop(fd, None)
+                if conn is None:
+                    continue
+                poll.unregister(fd)
+                self._queue.put(conn[:2])
+
+            self._lock.acquire()
+            try:
+                new, self._new = self._new, []
+            finally:
+                self._lock.release()
+            for sock, handler in new:
+                try:
+                    fd = sock.fileno()
+                    poll.register(fd, mask)
+                except (socket.error, IOError, ValueError):
+                    self._close(handler)
+                    continue
+                self._conns[fd] = (sock, handler, now)
+
+            if self.idle_timeout and now - last_check > 10:
+                last_check = now
+                for fd, (sock, handler, since) in self._conns.items():
+                    if now - since > self.idle_timeout:
+                        del self._conns[fd]
+                        poll.unregister(fd)
+                        self._close(handler)
+
+    def _work(self):
+        while True:
+            sock, handler = self._queue.get()
+            self._busy += 1
+            try:
+                try:
+                    keep = handler.serve_one()
+                except Exception:
+                    _logger.exception('%s: error when serving a request', self.name)
+                    keep = False
+            finally:
+                self._busy -= 1
+                self._served += 1
+            if keep and self._running:
+                self.register(sock, handler)
+            else:
+                self._close(handler)
+
+    def _close(self, handler):
+        try:
+            handler.close()
+        except Exception:
+            _logger.debug('%s: error when closing a connection', self.name, exc_info=True)
+
+    def stop(self):
+        self._running = False
+        os.write(self._wake_w, 'x')
+        for sock, handler, since in self._conns.values():
+            self._close(handler)
+        self._conns = {}
+
+    def stats(self):
+        return "%d threads, %d busy, %d connections idle, %d requests served" % \
+                (self._threads, self._busy, len(self._conns), self._served)
+
+_poller = None
+_poller_lock = threading.Lock()
+
+def get_poller():
+    """ Return the connection poller of the servers of the process,
+        created at the first call
+    """
+    global _poller
+    _poller_lock.acquire()
+    try:
+        if _poller is None:
+            _poller = connection_poller('server', pool_threads(),
+                    int(tools.config.get_misc('workers', 'idle_timeout', 1200)))
+        return _poller
+    finally:
+        _poller_lock.release()
+
+def stats():
+    """ Return the statistics of the connection poller, if any """
+    if _poller is None:
+        return "Workers: a thread per connection"
+    return "Workers: " + _poller.stats()
+
+def _close_inherited_connections():
+    import sql_db
+    sql_db._Pool.close_idle()
+
+def _forget_inherited_connections():
+    """ Drop the connections the parent process was using when it forked,
+        without closing them: they are still the parent's
+    """
+    import sql_db
+    sql_db._Pool.forget_used()
+
+def prefork(count, started=None):
+    """ Fork count server processes and return in each of them; the
+        parent process restarts the processes that exit, until it is
+        asked to stop, and then returns None after stopping them.
+
+        Nothing must run in other threads when prefork() is called, e.g.
+        the scheduled actions: `started` is called in the parent, once
+        the processes are forked, to start them.
+
+        @param started function called without argument in the parent
+            process, after forking the processes
+        @return the number of the process, from 1, in the children
+    """
+    _close_inherited_connections()
+    parent = os.getpid()
+    children = {}   # { pid: number }
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+    old_handlers = dict((signum, signal.signal(signum, stop))
+                        for signum in (signal.SIGINT, signal.SIGTERM))
+
+    def spawn(number):
+        pid = os.fork()
+        if pid:
+            children[pid] = number
+            return None
+        # the parent stops the processes, with SIGTERM, when it is
+        # interrupted from the terminal
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, old_handlers[signal.SIGTERM])
+        _forget_inherited_connections()
+        _watch_parent(parent)
+        return number
+
+    for number in range(1, count + 1):
+        if spawn(number):
+            return number
+    _logger.info('Started %d server processes', count)
+    if started:
+        started()
+
+    while not stopping:
+        try:
+            pid, status = os.wait()
+        except OSError, e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        number = children.pop(pid, None)
+        if number is None or stopping:
+            continue
+        _logger.warning('Server process %d (#%d) exited with status %d, restarting it',
+                        pid, number, status)
+        time.sleep(1)
+        if spawn(number):
+            return number
+
+    _logger.info('Stopping the server processes')
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    for pid in children.keys():
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+    for signum, old in old_handlers.items():
+        signal.signal(signum, old)
+    return None
+
+def _watch_parent(parent):
+    """ Stop the current (child) process when parent exits """
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(5)
+        _logger.warning('Parent process %d is gone, stopping', parent)
+        os.kill(os.getpid(), signal.SIGTERM)
+    thread = threading.Thread(target=watch, name='workers.watch_parent')
+    thread.setDaemon(True)
+    thread.start()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
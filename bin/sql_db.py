@@ -40,7 +40,7 @@ from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, ISOLATION_LEVEL_READ
 from psycopg2.psycopg1 import cursor as psycopg1cursor
 from psycopg2.pool import PoolError
 
-from psycopg2 import OperationalError
+from psycopg2 import OperationalError, errorcodes
 import psycopg2.extensions
 import warnings
 
@@ -67,10 +67,14 @@ psycopg2.extensions.register_type(psycopg2.extensions.new_type((700, 701, 1700,)
 
 import tools
 from tools.func import wraps, frame_codeinfo
+from tools.lru import LRU
 from netsvc import Agent
 from datetime import datetime as mdt
 from datetime import timedelta
+import hashlib
+import itertools
 import threading
+import time
 from inspect import currentframe
 
 import re
@@ -148,6 +152,8 @@ class Cursor(object):
     IN_MAX = 1000 # decent limit on size of IN queries - guideline = Oracle limit
     __logger = logging.getLogger('db.cursor')
     __pgmode = None
+    __iter_counter = itertools.count(1)
+    _auto_prepare = tools.config.get_misc('postgres', 'auto_prepare', False)
 
     def check(f):
         @wraps(f)
@@ -173,6 +179,11 @@ class Cursor(object):
         self.dbname = dbname
         self.auth_proxy = None
         self._serialized = serialized
+        self._prepared_synced = False
+        self._precommit = []    # [(function, args)], see before_commit()
+        self._postcommit = []
+        self._postrollback = []
+        self.transaction = {}   # data kept until the end of the transaction
         self._cnx, self._obj = pool.borrow(dsn(dbname), True)
         self.__closed = False   # real initialisation value
         self.autocommit(False)
@@ -180,8 +191,6 @@ class Cursor(object):
             self.__caller = frame_codeinfo(currentframe(),2)
         else:
             self.__caller = False
-        if not hasattr(self._cnx,'_prepared'):
-            self._cnx._prepared = []
         if not self.__pgmode:
             # No features shall use these modes yet!
             #if self._cnx.server_version >= 90200:
@@ -213,7 +222,8 @@ class Cursor(object):
     def execute(self, query, params=None, debug=False, log_exceptions=True, _fast=False):
         """ Execute some SQL command
             @param debug   Verbosely log the query being sent (not results, yet)
-            @param log_exceptions ignored, left there mainly for API compatibility with trunk
+            @param log_exceptions if False, do not log operational errors
+                    (eg. locks not available), that the caller expects
         """
             
         if params and not _fast:
@@ -230,7 +240,8 @@ class Cursor(object):
             params = params or None
             res = self._obj.execute(query, params)
         except OperationalError, oe:
-            self.__logger.exception("Postgres Operational error: %s", oe)
+            if log_exceptions:
+                self.__logger.exception("Postgres Operational error: %s", oe)
             self.status = False
             raise
         except psycopg2.ProgrammingError, pe:
@@ -272,6 +283,39 @@ class Cursor(object):
         return res
 
 
+    @check
+    def iterate(self, query, params=None, itersize=None, debug=False):
+        """ Execute a query through a named, server-side cursor, and yield
+            its rows as lists of (up to itersize) dictionaries
+
+            Only one chunk of the result is held in memory at a time, and
+            the cursor can still be used for other queries meanwhile, in
+            the same transaction.
+
+            @param itersize number of rows fetched at once, defaults to
+                    `[postgres] itersize` in the configuration
+        """
+        if not itersize:
+            itersize = int(tools.config.get_misc('postgres', 'itersize', 2000))
+        if params:
+            query = query.replace('%d','%s').replace('%f','%s')
+        name = 'openerp_iter_%d' % self.__iter_counter.next()
+        if self.sql_log or debug:
+            self.__logger.debug("Q(%s): %s", name, query)
+        cur = self._cnx.cursor(name, cursor_factory=psycopg1cursor)
+        try:
+            cur.execute(query, params or None)
+            while True:
+                rows = cur.dictfetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass # already gone with its transaction
+
     def split_for_in_conditions(self, ids):
         """Split a list of identifiers into one or more smaller tuples
            safe for IN conditions, after uniquifying them."""
@@ -297,6 +341,24 @@ class Cursor(object):
         self.sql_log_count = 0
         self.sql_log = False
 
+    def _prepared_statements(self):
+        """ Return the PreparedStatements of the connection, after having
+            checked, once per cursor, that they still exist on the server
+            (the session may have been reset meanwhile)
+        """
+        prepared = getattr(self._cnx, '_prepared', None)
+        if prepared is None:
+            prepared = self._cnx._prepared = PreparedStatements(
+                    int(tools.config.get_misc('postgres', 'prepared_max', 256)))
+            self._prepared_synced = True
+        if not self._prepared_synced:
+            if len(prepared):
+                self.execute('SELECT name FROM pg_prepared_statements', _fast=True)
+                if prepared.sync([x[0] for x in self._obj.fetchall()]):
+                    self._pool.pool_stats['prepared_resets'] += 1
+            self._prepared_synced = True
+        return prepared
+
     def execute_prepared(self, name, query, params=None, debug=False, datatypes=None):
         """ Execute and return one query, through a prepared statement.
             The name argument is required, and should be unique accross all code.
@@ -305,11 +367,21 @@ class Cursor(object):
             statement under this name.
             datatypes, if specified, will strictly define the parameter types to
             the prepared statement.
+
+            Each connection keeps at most `[postgres] prepared_max` statements,
+            the least recently used ones are DEALLOCATE'd.
         """
         assert ( (not datatypes) or len(datatypes) == len(params or []))
         assert (name)
-        
-        if name not in self._cnx._prepared:
+
+        prepared = self._prepared_statements()
+        # if no transaction is open yet, nothing is lost by rolling back
+        # and trying again, should the statement have disappeared
+        get_status = getattr(self._cnx, 'get_transaction_status', None)
+        can_retry = get_status is not None and \
+                get_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+        if name not in prepared:
             if '%d' in query or '%f' in query:
                 self.__logger.warn(query)
                 self.__logger.warn("SQL queries cannot contain %d or %f anymore. Use only %s")
@@ -327,14 +399,47 @@ class Cursor(object):
         
             qry = 'PREPARE ' + name + args + ' AS ' + query + ';'
             
-            self.execute(qry, debug=debug, _fast=True)
-            self._cnx._prepared.append(name)
+            for old_name in prepared.add(name):
+                self.execute('DEALLOCATE ' + old_name + ';', debug=debug, _fast=True)
+                self._pool.pool_stats['deallocations'] += 1
+            try:
+                self.execute(qry, debug=debug, _fast=True)
+            except psycopg2.Error:
+                prepared.discard(name)
+                raise
+            self._pool.pool_stats['prepares'] += 1
         
         args = ''
         if params and len(params):
                 args = [ '%s' for x in range(len(params)) ]
                 args = '(' + ', '.join(args) + ')'
-        return self.execute('EXECUTE ' +name + ' '+ args + ';', params, debug=debug, _fast=True)
+        try:
+            return self.execute('EXECUTE ' +name + ' '+ args + ';', params, debug=debug, _fast=True)
+        except psycopg2.Error, e:
+            if e.pgcode != errorcodes.INVALID_SQL_STATEMENT_NAME:
+                raise
+            # the session has been reset behind our back: forget all the
+            # statements of the connection
+            self._pool.pool_stats['prepared_resets'] += 1
+            prepared.clear()
+            if not can_retry:
+                raise
+            self.__logger.info("Prepared statement %s has disappeared, preparing it again", name)
+            self.rollback()
+            return self.execute_prepared(name, query, params, debug=debug, datatypes=datatypes)
+
+    def execute_hot(self, query, params=None, debug=False):
+        """ Execute one of the queries that are run the most often. If
+            `[postgres] auto_prepare` is set, it is done through a prepared
+            statement named after the query.
+        """
+        if not self._auto_prepare:
+            return self.execute(query, params, debug=debug)
+        if isinstance(query, unicode):
+            key = query.encode('utf-8')
+        else:
+            key = query
+        return self.execute_prepared('auto_' + hashlib.md5(key).hexdigest(), query, params, debug=debug)
 
     @check
     def close(self):
@@ -348,6 +453,8 @@ class Cursor(object):
 
         if not self._serialized:
             self.rollback() # Ensure we close the current transaction.
+        else:
+            self._run_hooks(self._postrollback)
 
         self._obj.close()
 
@@ -360,7 +467,7 @@ class Cursor(object):
         self.__closed = True
 
         if leak:
-            self._cnx.leaked = True
+            self._pool.leak(self._cnx)
         else:
             keep_in_pool = self.dbname not in ('template1', 'template0', 'postgres')
             self._pool.give_back(self._cnx, keep_in_pool=keep_in_pool)
@@ -372,15 +479,59 @@ class Cursor(object):
 
     @check
     def commit(self):
-        """ Perform an SQL `COMMIT`
+        """ Perform an SQL `COMMIT`, after the calls registered with
+            `before_commit()`, and before the ones of `after_commit()`
         """
-        return self._cnx.commit()
+        while self._precommit:
+            function, args = self._precommit.pop(0)
+            function(*args)
+        res = self._cnx.commit()
+        self._run_hooks(self._postcommit)
+        return res
 
     @check
     def rollback(self):
-        """ Perform an SQL `ROLLBACK`
+        """ Perform an SQL `ROLLBACK`, forget the calls registered for the
+            commit of the transaction, and its data, then perform the calls
+            registered with `after_rollback()`
         """
-        return self._cnx.rollback()
+        self._precommit = []
+        res = self._cnx.rollback()
+        self._run_hooks(self._postrollback)
+        return res
+
+    def _run_hooks(self, calls):
+        """ Forget the data and the calls registered for the transaction,
+            which has ended, and perform calls (the ones of
+            `after_commit()` or of `after_rollback()`)
+        """
+        self.transaction = {}
+        self._postcommit = []
+        self._postrollback = []
+        for function, args in calls:
+            try:
+                function(*args)
+            except Exception:
+                self.__logger.exception("Call of %s at the end of the transaction failed", function.__name__)
+
+    def before_commit(self, function, *args):
+        """ Call function(*args) at the next commit, before it is
+            performed, so that it is part of the current transaction
+        """
+        self._precommit.append((function, args))
+
+    def after_commit(self, function, *args):
+        """ Call function(*args) once the current transaction has been
+            committed. Errors are logged, not raised.
+        """
+        self._postcommit.append((function, args))
+
+    def after_rollback(self, function, *args):
+        """ Call function(*args) once the current transaction has been
+            rolled back, e.g. to forget what was cached from its changes.
+            Errors are logged, not raised.
+        """
+        self._postrollback.append((function, args))
 
     @check
     def __getattr__(self, name):
@@ -408,14 +559,74 @@ class Cursor(object):
 class PsycoConnection(psycopg2.extensions.connection):
     pass
 
+class PreparedStatements(object):
+    """ The names of the statements prepared on one connection, the least
+        recently used first
+    """
+    def __init__(self, size):
+        self._evicted = []
+        self._names = LRU(size, on_evict=self._on_evict)
+
+    def _on_evict(self, name, value):
+        self._evicted.append(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        if name in self._names:
+            self._names[name] # mark it as recently used
+            return True
+        return False
+
+    def add(self, name):
+        """ Record that name is prepared
+
+            @return the names of the statements that must be deallocated
+                    to make room for it
+        """
+        self._names[name] = True
+        evicted, self._evicted = self._evicted, []
+        return evicted
+
+    def discard(self, name):
+        if name in self._names:
+            del self._names[name]
+
+    def clear(self):
+        self._names.clear()
+        self._evicted = []
+
+    def sync(self, server_names):
+        """ Forget the statements that are not in server_names anymore
+
+            @return whether some had disappeared
+        """
+        server_names = set(server_names)
+        lost = [ name for name in self._names.keys() if name.lower() not in server_names ]
+        for name in lost:
+            del self._names[name]
+        return bool(lost)
+
 class ConnectionPool(object):
     """ The pool of connections to database(s)
     
         Keep a set of connections to pg databases open, and reuse them
         to open cursors for all transactions.
-        
-        The connections are *not* automatically closed. Only a close_db()
-        can trigger that.
+
+        Idle connections are kept in one stack per database (per normalised
+        dsn, see `dsn_key()`), so that borrowing one does not need to look
+        at the connections of the other databases. Up to `maxconn`
+        connections may be open at once; when all of them are in use,
+        borrowers wait for one to be given back, for at most
+        `[db_pool] wait_timeout` seconds.
+
+        Idle connections are closed when there are more than
+        `[db_pool] max_idle` of them for a database, when they have been
+        idle for more than `[db_pool] idle_timeout` seconds (but for
+        `[db_pool] min_idle` of them) or, when they are borrowed or given
+        back, if they have been open for more than `[db_pool] max_age`
+        seconds. Zero disables these limits.
     """
     __logger = logging.getLogger('db.connection_pool')
 
@@ -431,24 +642,33 @@ class ConnectionPool(object):
 
 
     def __init__(self, maxconn=64, pgmode=None):
-        self._connections = []
+        self._idle = {}     # { dsn key: [connection, ...] }, the most recent last
+        self._used = {}     # { connection: dsn key }
+        self._leaked = []   # connections of cursors that were not closed
+        self._count = 0     # number of open connections
         self._maxconn = max(maxconn, 1)
-        self._lock = threading.Lock()
+        self._lock = threading.Condition()
         self._debug_pool = tools.config.get_misc('debug', 'db_pool', False)
+        self._min_idle = int(tools.config.get_misc('db_pool', 'min_idle', 0))
+        self._max_idle = int(tools.config.get_misc('db_pool', 'max_idle', 0))
+        self._idle_timeout = float(tools.config.get_misc('db_pool', 'idle_timeout', 0))
+        self._max_age = float(tools.config.get_misc('db_pool', 'max_age', 0))
+        self._wait_timeout = float(tools.config.get_misc('db_pool', 'wait_timeout', 30))
         self.sql_stats = {}
+        self.reset_pool_stats()
         if pgmode: # not None or False
             Cursor.set_pgmode(pgmode)
 
     def __del__(self):
         # explicitly free them
-        del self._connections
+        del self._idle
+        del self._used
         if self.sql_stats:
             self.print_all_stats()
 
     def __repr__(self):
-        used = len([1 for c, u in self._connections[:] if u])
-        count = len(self._connections)
-        return "ConnectionPool(used=%d/count=%d/max=%d)" % (used, count, self._maxconn)
+        used = len(self._used)
+        return "ConnectionPool(used=%d/count=%d/max=%d)" % (used, self._count, self._maxconn)
 
     def _debug(self, msg, *args):
         if self._debug_pool:
@@ -480,100 +700,255 @@ class ConnectionPool(object):
         self._debug_pool = do_debug
         self.__logger.info("Debugging set to %s" % str(do_debug))
 
+    def reset_pool_stats(self):
+        self.pool_stats = {
+            'checkouts': 0,     # connections borrowed
+            'creations': 0,     # connections opened
+            'closed': 0,        # connections closed by the pool
+            'waits': 0,         # borrows that had to wait for a connection
+            'wait_time': 0.0,   # total time spent waiting, in seconds
+            'max_wait': 0.0,
+            'timeouts': 0,      # borrows that waited in vain
+            'prepares': 0,      # statements prepared
+            'deallocations': 0, # statements deallocated to make room
+            'prepared_resets': 0, # sessions found without their statements
+        }
+
+    def leak(self, connection):
+        """ Return the connection of a cursor that was not closed
+
+            This is called from `Cursor.__del__`, which must not take
+            the lock, so the connection is only given back at the next
+            borrow().
+        """
+        self._leaked.append(connection)
+
+    def _discard(self, cnx):
+        """ Close a connection that is not in the pool anymore
+            Must be called with the lock in acquired state.
+        """
+        self._count -= 1
+        self.pool_stats['closed'] += 1
+        self._lock.notify()
+        try:
+            cnx.close()
+        except Exception:
+            pass
+
+    def _is_old(self, cnx, now):
+        return self._max_age and (now - cnx._created > self._max_age)
+
+    def _reap_idle(self, key, now):
+        """ Close the connections of key that have been idle for too long
+            Must be called with the lock in acquired state.
+        """
+        stack = self._idle.get(key)
+        if not (stack and self._idle_timeout):
+            return
+        while len(stack) > self._min_idle and \
+                now - stack[0]._idle_since > self._idle_timeout:
+            cnx = stack.pop(0)
+            self._debug_dsn('Close idle connection to %r', cnx.dsn)
+            self._discard(cnx)
+
+    def _evict_idle(self):
+        """ Close the connection that has been idle for the longest time,
+            of any database, to make room for another one
+
+            Must be called with the lock in acquired state.
+            @return whether a connection was closed
+        """
+        oldest = None
+        for key, stack in self._idle.iteritems():
+            if stack and (oldest is None or stack[0]._idle_since < self._idle[oldest][0]._idle_since):
+                oldest = key
+        if oldest is None:
+            return False
+        cnx = self._idle[oldest].pop(0)
+        self._debug_dsn('Removing old connection to %r', cnx.dsn)
+        self._discard(cnx)
+        return True
+
+    def _checkout(self, cnx, do_cursor):
+        """ Check that an idle connection is still usable, and open a
+            cursor on it if requested
+
+            @return the result of borrow(), or None if cnx is not usable
+        """
+        try:
+            if psycopg2.__version__ >= '2.2' :
+                pr = cnx.poll()
+                self._debug("Poll: %d", pr)
+        except OperationalError, e:
+            self._debug("Error in poll: %s" % e)
+            return None
+
+        if cnx.closed or not cnx.status:
+            # something is wrong with that connection, let it out
+            self._debug("Troubled connection ")
+            return None
+
+        if not do_cursor:
+            return cnx
+        try:
+            cur = cnx.cursor(cursor_factory=psycopg1cursor)
+            if psycopg2.__version__ < '2.2' and not cur.isready():
+                return None
+            if cur.closed:
+                return None
+        except OperationalError:
+            return None
+        return (cnx, cur)
+
+    def _checked_out(self, cnx, key, start, waiting):
+        """ Record that cnx has been borrowed, after having waited since
+            start if waiting
+            Must be called with the lock in acquired state.
+        """
+        self._used[cnx] = key
+        self.pool_stats['checkouts'] += 1
+        if waiting:
+            waited = time.time() - start
+            self.pool_stats['wait_time'] += waited
+            self.pool_stats['max_wait'] = max(self.pool_stats['max_wait'], waited)
+
     @locked
     def borrow(self, dsn, do_cursor=False):
         self._debug_dsn('Borrow connection to %r', dsn)
+        key = dsn_key(dsn)
 
         # free leaked connections
-        for i, (cnx, _) in tools.reverse_enumerate(self._connections):
-            if getattr(cnx, 'leaked', False):
-                delattr(cnx, 'leaked')
-                self._connections.pop(i)
-                self._connections.append((cnx, False))
-                self._debug_dsn('Free leaked connection to %r', cnx.dsn)
-
-        result = None
-        for i, (cnx, used) in enumerate(self._connections):
-            if not used and dsn_are_equals(cnx.dsn, dsn):
-                self._connections.pop(i)
-                try:
-                   if psycopg2.__version__ >= '2.2' :
-                        pr = cnx.poll()
-                        self._debug("Poll: %d", pr)
-                except OperationalError, e:
-                    self._debug("Error in poll: %s" % e)
-                    continue
-                
-                if cnx.closed or not cnx.status:
-                    # something is wrong with that connection, let it out
-                    self._debug("Troubled connection ")
+        while self._leaked:
+            cnx = self._leaked.pop()
+            self._debug_dsn('Free leaked connection to %r', cnx.dsn)
+            try:
+                self._give_back(cnx)
+            except PoolError:
+                pass # closed by close_all() meanwhile
+
+        start = time.time()
+        self._reap_idle(key, start)
+        waiting = False
+        while True:
+            stack = self._idle.get(key)
+            while stack:
+                cnx = stack.pop()
+                result = None
+                if not self._is_old(cnx, time.time()):
+                    result = self._checkout(cnx, do_cursor)
+                if result is None:
+                    self._discard(cnx)
                     continue
-                
-                self._debug('Existing connection found at index %d', i)
-                if do_cursor:
-                    try:
-                        cur = cnx.cursor(cursor_factory=psycopg1cursor)
-                        if psycopg2.__version__ < '2.2' and not cur.isready():
-                            continue
-                        if cur.closed:
-                            continue
-                        self._connections.insert(i,(cnx, True))
-
-                        result = (cnx, cur)
-                    except OperationalError:
-                        continue
-                else:
-                    self._connections.insert(i,(cnx, True))
-                    result = cnx
+                self._debug('Existing connection found')
+                self._checked_out(cnx, key, start, waiting)
+                return result
+
+            if self._count < self._maxconn or self._evict_idle():
                 break
-        if result:
-            return result
-
-        if len(self._connections) >= self._maxconn:
-            # try to remove the oldest connection not used
-            for i, (cnx, used) in enumerate(self._connections):
-                if not used:
-                    self._connections.pop(i)
-                    self._debug_dsn('Removing old connection at index %d: %r', i, cnx.dsn, dsn_pos=1)
-                    break
-            else:
-                # note: this code is called only if the for loop has completed (no break)
+
+            # all the connections are in use: wait for one to be given back
+            if not waiting:
+                waiting = True
+                self.pool_stats['waits'] += 1
+            remaining = start + self._wait_timeout - time.time()
+            if remaining <= 0:
+                self.pool_stats['timeouts'] += 1
                 raise PoolError('The Connection Pool Is Full')
+            self._lock.wait(remaining)
 
         try:
             result = psycopg2.connect(dsn=dsn, connection_factory=PsycoConnection)
         except psycopg2.Error, e:
             self.__logger.exception('Connection to the database failed')
             raise
-        self._connections.append((result, True))
+        result._created = time.time()
+        self._count += 1
+        self.pool_stats['creations'] += 1
+        self._checked_out(result, key, start, waiting)
         self._debug('Create new connection')
         if do_cursor:
             cur = result.cursor(cursor_factory=psycopg1cursor)
             return (result, cur)
         return result
 
+    def _give_back(self, connection, keep_in_pool=True):
+        """ Must be called with the lock in acquired state
+        """
+        key = self._used.pop(connection, None)
+        if key is None:
+            raise PoolError('This connection does not below to the pool')
+        now = time.time()
+        stack = self._idle.setdefault(key, [])
+        if keep_in_pool and not (connection.closed or not connection.status) \
+                and not self._is_old(connection, now) \
+                and not (self._max_idle and len(stack) >= self._max_idle):
+            connection._idle_since = now
+            stack.append(connection)
+            self._lock.notify()
+            self._debug_dsn('Put connection to %r back in pool', connection.dsn)
+        else:
+            self._debug_dsn('Forgot connection to %r', connection.dsn)
+            self._discard(connection)
+        self._reap_idle(key, now)
+
     @locked
     def give_back(self, connection, keep_in_pool=True):
         self._debug_dsn('Give back connection to %r', connection.dsn)
-        for i, (cnx, used) in enumerate(self._connections):
-            if cnx is connection:
-                self._connections.pop(i)
-                if keep_in_pool and not (cnx.closed or not cnx.status):
-                    self._connections.insert(i,(cnx, False))
-                    self._debug_dsn('Put connection to %r back in pool', cnx.dsn)
-                else:
-                    self._debug_dsn('Forgot connection to %r', cnx.dsn)
-                break
-        else:
-            raise PoolError('This connection does not below to the pool')
+        self._give_back(connection, keep_in_pool)
 
     @locked
     def close_all(self, dsn):
         self._debug_dsn('Close all connections to %r', dsn)
-        for i, (cnx, used) in tools.reverse_enumerate(self._connections):
-            if dsn_are_equals(cnx.dsn, dsn):
-                cnx.close()
-                self._connections.pop(i)
+        key = dsn_key(dsn)
+        for cnx in self._idle.pop(key, []):
+            self._discard(cnx)
+        for cnx, k in self._used.items():
+            if k == key:
+                del self._used[cnx]
+                self._discard(cnx)
+
+    @locked
+    def close_idle(self):
+        """ Close the idle connections to all databases, e.g. before
+            forking, as the connections cannot be shared by processes
+        """
+        self._debug('Close all idle connections')
+        for stack in self._idle.values():
+            for cnx in stack:
+                self._discard(cnx)
+        self._idle = {}
+
+    @locked
+    def forget_used(self):
+        """ Drop the connections in use without closing them, in a forked
+            process: they belong to the threads of the parent process
+        """
+        self._debug('Forget %d connections in use', len(self._used))
+        self._count -= len(self._used)
+        self._used = {}
+        self._leaked = []
+
+    @locked
+    def used_count(self, dsn):
+        """ Return the number of connections to dsn that are in use """
+        key = dsn_key(dsn)
+        return len([k for k in self._used.itervalues() if k == key])
+
+    @locked
+    def stats(self):
+        """ Return a newline-delimited string of the pool counters
+        """
+        st = self.pool_stats
+        res = ["Connection pool: %d used, %d idle in %d databases, %d max" % \
+                (len(self._used), self._count - len(self._used),
+                len([s for s in self._idle.values() if s]), self._maxconn)]
+        res.append("    %d checkouts, %d creations, %d closed, %d waits "
+                "(%.3fs, max %.3fs), %d timeouts" % \
+                (st['checkouts'], st['creations'], st['closed'], st['waits'],
+                st['wait_time'], st['max_wait'], st['timeouts']))
+        res.append("    %d statements prepared, %d deallocated, %d resets" % \
+                (st['prepares'], st['deallocations'], st['prepared_resets']))
+        return '\n'.join(res)
 
     def print_all_stats(self):
         logger = logging.getLogger('db.cursor') # shall be the same..
@@ -618,12 +993,21 @@ for p in ('host', 'port', 'user', 'password'):
 def dsn(db_name):
     return '%sdbname=%s' % (_dsn, db_name)
 
+_dsn_keys = {}
+
+def dsn_key(dsn):
+    """ Return a hashable key of the connection parameters of dsn, that
+        does not depend on their order or on the password
+    """
+    k = _dsn_keys.get(dsn)
+    if k is None:
+        d = dict(x.split('=', 1) for x in dsn.strip().split())
+        d.pop('password', None) # password is not relevant
+        k = _dsn_keys[dsn] = tuple(sorted(d.items()))
+    return k
+
 def dsn_are_equals(first, second):
-    def key(dsn):
-        k = dict(x.split('=', 1) for x in dsn.strip().split())
-        k.pop('password', None) # password is not relevant
-        return k
-    return key(first) == key(second)
+    return dsn_key(first) == dsn_key(second)
 
 
 _Pool = ConnectionPool(int(tools.config['db_maxconn']), 
@@ -635,7 +1019,7 @@ def db_connect(db_name):
 def close_db(db_name):
     _Pool.close_all(dsn(db_name))
     Agent.cancel(db_name)
-    tools.cache.clean_caches_for_db(db_name)
+    tools.cache.clean_caches_for_db(db_name, signal=False)
 
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -21,3 +21,5 @@
 
 from test_osv import *
 from test_translate import *
+from test_browse import *
+from test_workflow import *
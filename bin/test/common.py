@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2010 OpenERP S.A. http://www.openerp.com
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+""" In-memory models shared by the tests, with just what the tested code
+    needs from the orm
+"""
+
+class FakePool(dict):
+    def get(self, name):
+        return dict.get(self, name)
+
+class FakeModel(object):
+    """ An orm model whose rows are kept in a dictionary { id: values }
+
+        The fields of the _inherits parents, which must be created first,
+        are added to _inherit_fields like the orm does.
+    """
+    _vtable = False
+    _debug = False
+
+    def __init__(self, pool, name, columns, rows=None, inherits=None):
+        self._name = name
+        self._table = name.replace('.', '_')
+        self._columns = columns
+        self._column_stats = {}
+        self._inherits = inherits or {}
+        self._inherit_fields = {}
+        for parent, link in self._inherits.items():
+            for col in pool[parent]._columns:
+                if col not in columns:
+                    self._inherit_fields[col] = (parent, link, pool[parent]._columns[col], parent)
+        self.rows = rows or {}
+        self.reads = 0
+        self.pool = pool
+        pool[name] = self
+
+    def read(self, cr, uid, ids, fields, context=None, load='_classic_read'):
+        self.reads += 1
+        res = []
+        for id in ids:
+            r = dict((f, self.rows[id][f]) for f in fields)
+            r['id'] = id
+            res.append(r)
+        return res
+
+    def fields_get(self, cr, uid, fields=None, context=None):
+        res = {}
+        columns = dict([(name, inherited[2]) for name, inherited in self._inherit_fields.items()])
+        columns.update(self._columns)
+        for name, column in columns.items():
+            res[name] = {'type': column._type}
+            if column._obj:
+                res[name]['relation'] = column._obj
+            if hasattr(column, 'selection'):
+                res[name]['selection'] = column.selection
+        return res
+
+    def create(self, cr, uid, values, context=None):
+        id = max(self.rows.keys() + [0]) + 1
+        self.rows[id] = dict(values)
+        return id
+
+    def create_multi(self, cr, uid, vals_list, context=None):
+        self.batches = getattr(self, 'batches', 0) + 1
+        return [self.create(cr, uid, values, context) for values in vals_list]
+
+    def name_search(self, cr, uid, name='', args=None, operator='ilike', context=None, limit=100):
+        return [(id, r['name']) for id, r in sorted(self.rows.items())
+                if r.get('name') == name]
+
+    def name_get(self, cr, uid, ids, context=None):
+        return [(id, self.rows[id]['name']) for id in ids]
+
+    def _store_flush(self, cr):
+        pass
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
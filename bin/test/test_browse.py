@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+""" Tests of the browse_record cache, with in-memory models
+
+    Run this file directly to benchmark a large browse walk:
+
+        python test/test_browse.py [number of lines]
+"""
+
+import sys
+import time
+import unittest
+from osv import fields
+from osv.orm import browse_record, browse_record_list, browse_null, \
+        browse_model_cache, _prefetch_paths
+from common import FakePool, FakeModel
+
+def make_models(n, n_products=100):
+    pool = FakePool()
+    products = FakeModel(pool, 'test.product', {
+            'name': fields.char('Name', size=64),
+            'price': fields.float('Price'),
+        }, dict((i, {'name': 'Product %d' % i, 'price': float(i)})
+                for i in range(1, n_products + 1)))
+    lines = FakeModel(pool, 'test.line', {
+            'name': fields.char('Name', size=64),
+            'quantity': fields.float('Quantity'),
+            'product_id': fields.many2one('test.product', 'Product'),
+        }, dict((i, {'name': 'Line %d' % i, 'quantity': float(i % 7),
+                     'product_id': (i % 3) and (i % n_products + 1) or False})
+                for i in range(1, n + 1)))
+    return lines, products
+
+def make_orders(n_orders, n_lines):
+    lines, products = make_models(n_orders * n_lines)
+    pool = lines.pool
+    orders = FakeModel(pool, 'test.order', {
+            'name': fields.char('Name', size=64),
+            'line_ids': fields.one2many('test.line', 'order_id', 'Lines'),
+        }, dict((i, {'name': 'Order %d' % i,
+                     'line_ids': range((i - 1) * n_lines + 1, i * n_lines + 1)})
+                for i in range(1, n_orders + 1)))
+    return orders, lines, products
+
+def browse(model, ids, cache):
+    return browse_record_list([browse_record(None, 1, id, model, cache,
+                                             fields_only=False)
+                               for id in ids])
+
+class BrowseRecordTestCase(unittest.TestCase):
+
+    def test_values(self):
+        lines, products = make_models(10)
+        recs = browse(lines, range(1, 11), {})
+        self.assertEquals(recs[0].name, 'Line 1')
+        self.assertEquals(recs[3]['quantity'], 4.0)
+        self.assertEquals(recs[2].id, 3)
+        # all the lines have been read at once
+        self.assertEquals(lines.reads, 1)
+        self.assertEquals([r.name for r in recs], ['Line %d' % i for i in range(1, 11)])
+        self.assertEquals(lines.reads, 1)
+
+    def test_many2one(self):
+        lines, products = make_models(10)
+        recs = browse(lines, range(1, 11), {})
+        self.assert_(isinstance(recs[2].product_id, browse_null))
+        self.assertEquals(recs[0].product_id.name, 'Product 2')
+        self.assertEquals(recs[0].product_id, recs[1].product_id.__class__(
+                None, 1, 2, products, recs[0]._cache))
+        self.assertEquals(set(r.product_id.name for r in recs if r.product_id),
+                          set(['Product %d' % i for i in (2, 3, 5, 6, 8, 9, 11)]))
+        # the products of all the lines have been read at once
+        self.assertEquals(products.reads, 1)
+
+    def test_one2many_walk(self):
+        orders, lines, products = make_orders(5, 4)
+        recs = browse(orders, range(1, 6), {})
+        for order in recs:
+            for line in order.line_ids:
+                line.product_id and line.product_id.name
+        self.assertEquals((orders.reads, lines.reads, products.reads), (1, 1, 1))
+
+    def test_prefetch_paths(self):
+        orders, lines, products = make_orders(5, 4)
+        recs = browse(orders, range(1, 6), {})
+        _prefetch_paths(recs, ['line_ids.product_id.name'])
+        self.assertEquals((orders.reads, lines.reads, products.reads), (1, 1, 1))
+        self.assertEquals(recs[4].line_ids[3].product_id.name, 'Product 21')
+        self.assertEquals((orders.reads, lines.reads, products.reads), (1, 1, 1))
+
+    def test_model_cache(self):
+        cache = browse_model_cache()
+        cache.add(4)
+        cache.set(7, 'name', 'seven')
+        self.assertEquals(cache.ids, [4, 7])
+        self.assert_(cache.has(7, 'name'))
+        self.failIf(cache.has(4, 'name'))
+        self.assertEquals(cache.missing_ids('name'), [4])
+        self.assertEquals(cache.missing_ids('other'), [4, 7])
+        self.assertEquals(cache.record(7), {'id': 7, 'name': 'seven'})
+        self.assertRaises(KeyError, cache.get, 4, 'name')
+
+    def test_slots(self):
+        lines, products = make_models(1)
+        rec = browse(lines, [1], {})[0]
+        # no __dict__ to store other attributes
+        self.assertRaises(AttributeError, setattr, rec, 'foo', 1)
+        self.assertRaises(AttributeError, setattr, browse_null(), 'foo', 1)
+        self.assertRaises(AttributeError, setattr, browse_record_list([]), 'foo', 1)
+
+def benchmark(n):
+    """ Walk n lines and their products, and compare the memory taken by
+        the cache and the records with the former layout: a dictionary
+        per cached record, and per browse_record instance
+    """
+    lines, products = make_models(n)
+    cache = {}
+    start = time.time()
+    recs = browse(lines, range(1, n + 1), cache)
+    total = 0.0
+    for r in recs:
+        total += r.quantity * (r.product_id and r.product_id.price or 0.0)
+    elapsed = time.time() - start
+
+    size = sys.getsizeof
+    new_cache = 0
+    for model_cache in cache.values():
+        new_cache += size(model_cache) + size(model_cache.ids) + size(model_cache.index)
+        for column in model_cache.columns.values():
+            new_cache += size(column)
+    old_cache = size(cache)
+    for model_cache in cache.values():
+        old_cache += size(dict((id, None) for id in model_cache.ids))
+        for id in model_cache.ids:
+            old_cache += size(model_cache.record(id))
+    slots = ('_list_class', '_cr', '_uid', '_id', '_table', '_table_name',
+             '_context', '_fields_process', '_fields_only', '_data', '_cache')
+    old_record = size(object()) + size(dict.fromkeys(slots))
+
+    print "%d lines browsed in %.3fs (%d + %d reads)" % \
+            (n, elapsed, lines.reads, products.reads)
+    print "cache: %d bytes, %d with one dict per record" % (new_cache, old_cache)
+    print "records: %d bytes, %d with a __dict__" % \
+            (size(recs[0]) * n, old_record * n)
+
+if __name__ == '__main__':
+    benchmark(len(sys.argv) > 1 and int(sys.argv[1]) or 100000)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
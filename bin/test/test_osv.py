@@ -19,8 +19,12 @@
 #
 ##############################################################################
 
+import re
 import unittest
+from osv import fields
+from osv.orm import orm_template
 from osv.query import Query
+from common import FakePool, FakeModel
 
 class QueryTestCase(unittest.TestCase):
 
@@ -62,3 +66,199 @@ class QueryTestCase(unittest.TestCase):
         query.tables.append('"product_product"')
         self.assertRaises(AssertionError, query.join, ("product_template", "product_category", "categ_id", "id"), outer=False)
 
+
+def make_models():
+    pool = FakePool()
+    FakeModel(pool, 'test.template', {
+            'name': fields.char('Name', size=64, translate=True),
+            'categ_id': fields.many2one('test.categ', 'Category'),
+            'tag_ids': fields.many2many('test.categ', 'test_rel', 'tmpl_id', 'categ_id', 'Tags'),
+        })
+    FakeModel(pool, 'test.categ', {
+            'name': fields.char('Name', size=64),
+            'parent_id': fields.many2one('test.categ', 'Parent'),
+        })
+    FakeModel(pool, 'test.product', {
+            'tmpl_id': fields.many2one('test.template', 'Template'),
+        }, inherits={'test.template': 'tmpl_id'})
+    FakeModel(pool, 'test.line', {
+            'product_id': fields.many2one('test.product', 'Product'),
+        })
+    return pool
+
+class RelatedTestCase(unittest.TestCase):
+
+    def test_sql_path(self):
+        pool = make_models()
+        field = fields.related('product_id', 'categ_id', 'parent_id', 'name', type='char')
+        query, models, column = field._sql_path(pool['test.line'])
+        self.assertEquals(query, 'SELECT t0.id, t4.id, t4."name" FROM "test_line" AS t0'
+            ' LEFT JOIN "test_product" AS t1 ON (t1.id = t0."product_id")'
+            ' LEFT JOIN "test_template" AS t2 ON (t2.id = t1."tmpl_id")'
+            ' LEFT JOIN "test_categ" AS t3 ON (t3.id = t2."categ_id")'
+            ' LEFT JOIN "test_categ" AS t4 ON (t4.id = t3."parent_id")'
+            ' WHERE t0.id = ANY(%s)')
+        self.assertEquals([m._name for m in models],
+            ['test.line', 'test.product', 'test.template', 'test.categ', 'test.categ'])
+        self.assert_(column is pool['test.categ']._columns['name'])
+
+    def test_sql_path_fallback(self):
+        pool = make_models()
+        # x2many hop
+        field = fields.related('tag_ids', 'name', type='char')
+        self.assertEquals(field._sql_path(pool['test.template']), None)
+        # function field
+        pool['test.categ']._columns['complete_name'] = fields.function(lambda *a: {}, method=True, type='char')
+        field = fields.related('categ_id', 'complete_name', type='char')
+        self.assertEquals(field._sql_path(pool['test.template']), None)
+
+
+class FakeCursor(object):
+    """ Runs the queries compiled by fields.related._sql_path() on the rows
+        of the models of pool
+    """
+    _select = re.compile(r'SELECT t0\.id, (t\d+)\.id, \1\."(\w+)" FROM "(\w+)" AS t0')
+    _join = re.compile(r'LEFT JOIN "(\w+)" AS (t\d+) ON \(\2\.id = (t\d+)\."(\w+)"\)')
+
+    def __init__(self, pool):
+        self.tables = dict([(model._table, model) for model in pool.values()
+                            if isinstance(model, FakeModel)])
+        self.queries = 0
+
+    def execute(self, query, params=None, debug=False):
+        self.queries += 1
+        alias, name, table = self._select.match(query).groups()
+        joins = self._join.findall(query)
+        models = {'t0': self.tables[table]}
+        self.result = []
+        for id in params[0]:
+            if id not in models['t0'].rows:
+                continue
+            ids = {'t0': id}
+            for table, target, source, link in joins:
+                models[target] = self.tables[table]
+                value = ids[source] and models[source].rows[ids[source]].get(link)
+                ids[target] = value in models[target].rows and value or None
+            value = ids[alias] and models[alias].rows[ids[alias]].get(name)
+            self.result.append((id, ids[alias], value))
+
+    def fetchall(self):
+        return self.result
+
+class FakeTranslation(object):
+    """ The translated values of the fields, { (model, field, id): value } """
+
+    def __init__(self, pool, terms):
+        self.terms = terms
+        pool['ir.translation'] = self
+
+    def _get_multi_ids(self, cr, user, name_list, ids, ttype, lang, prepend=None):
+        return [(name, id, self.terms[(prepend[:-1], name, id)])
+                for name in name_list for id in ids
+                if (prepend[:-1], name, id) in self.terms]
+
+class RelatedReadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = make_models()
+        self.pool['test.categ'].rows = {
+            1: {'name': 'Chairs', 'parent_id': False},
+            2: {'name': '', 'parent_id': 1},
+        }
+        self.pool['test.template'].rows = {
+            1: {'name': 'Office chair', 'categ_id': 1},
+            2: {'name': 'Stool', 'categ_id': 2},
+            3: {'name': False, 'categ_id': False},
+        }
+        self.pool['test.product'].rows = {
+            1: {'tmpl_id': 1},
+            2: {'tmpl_id': 2},
+            3: {'tmpl_id': 3},
+        }
+        self.pool['test.line'].rows = {
+            1: {'product_id': 1},
+            2: {'product_id': 2},
+            3: {'product_id': 3},
+            4: {'product_id': False},
+        }
+        FakeTranslation(self.pool, {('test.template', 'name', 1): 'Chaise de bureau'})
+        self.cr = FakeCursor(self.pool)
+
+    def read(self, field, ids, context=None):
+        res = field._fnct_read(self.pool['test.line'], self.cr, 1, ids, 'x', None, context)
+        self.assertEquals(self.cr.queries, 1)
+        return res
+
+    def test_translated_inherited(self):
+        """ The value of a translated field of an _inherits parent is taken
+            in the language of the context
+        """
+        field = fields.related('product_id', 'name', type='char')
+        self.assertEquals(self.read(field, [1, 2], {'lang': 'fr_FR'}),
+                          {1: 'Chaise de bureau', 2: 'Stool'})
+
+    def test_untranslated(self):
+        field = fields.related('product_id', 'name', type='char')
+        self.assertEquals(self.read(field, [1, 2]), {1: 'Office chair', 2: 'Stool'})
+
+    def test_falsy_values(self):
+        """ Empty values, and the records whose chain is broken, give False """
+        field = fields.related('product_id', 'categ_id', 'name', type='char')
+        self.assertEquals(self.read(field, [1, 2, 3, 4]),
+                          {1: 'Chairs', 2: False, 3: False, 4: False})
+
+    def test_many2one(self):
+        """ The many2one values are given with their name_get() """
+        field = fields.related('product_id', 'categ_id', 'parent_id', type='many2one', relation='test.categ')
+        self.assertEquals(self.read(field, [1, 2, 4]),
+                          {1: False, 2: (1, 'Chairs'), 4: False})
+
+class FakeModelData(object):
+    """ The ir.model.data of the imports: the records with an external id
+        are created through _update()
+    """
+    doinit = True
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.xml_ids = {}
+
+    def _get_id(self, cr, uid, module, xml_id):
+        if (module, xml_id) not in self.xml_ids:
+            raise ValueError('No references to %s.%s' % (module, xml_id))
+        return self.xml_ids[(module, xml_id)]
+
+    def read(self, cr, uid, ids, fields, context=None):
+        return [{'id': id, 'res_id': id[1]} for id in ids]
+
+    def _update(self, cr, uid, model, module, values, xml_id=False, store=True,
+                noupdate=False, mode='init', res_id=False, context=None):
+        res_id = self.pool.get(model).create(cr, uid, values, context)
+        self.xml_ids[(module, xml_id)] = (model, res_id)
+        return res_id
+
+class ImportTestCase(unittest.TestCase):
+
+    def test_import_data(self):
+        pool = FakePool()
+        pool['ir.model.data'] = FakeModelData(pool)
+        FakeModel(pool, 'test.product', {
+                'name': fields.char('Name', size=64),
+            }, {1: {'name': 'Product 1'}, 2: {'name': 'Product 2'}})
+        lines = FakeModel(pool, 'test.line', {
+                'name': fields.char('Name', size=64),
+                'quantity': fields.float('Quantity'),
+                'product_id': fields.many2one('test.product', 'Product'),
+            })
+        res = orm_template.import_data.im_func(lines, None, 1,
+                ['id', 'name', 'product_id', 'quantity'],
+                [['line_a', 'A', 'Product 1', '2'],
+                 ['', 'B', 'Product 2', '3'],
+                 ['', 'C', '', '1']], current_module='test')
+        self.assertEquals(res, (3, 0, 0, 0))
+        self.assertEquals(sorted([(r['name'], r['product_id'], r['quantity'])
+                                  for r in lines.rows.values()]),
+                          [('A', 1, 2.0), ('B', 2, 3.0), ('C', False, 1.0)])
+        self.assertEquals(pool['ir.model.data'].xml_ids, {('test', 'line_a'): ('test.line', 1)})
+        # the lines without external id are created together
+        self.assertEquals(lines.batches, 1)
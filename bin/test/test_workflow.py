@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2010 OpenERP S.A. http://www.openerp.com
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import unittest
+import netsvc
+from workflow import instance, wkf_service
+from workflow.wkf_defs import wkf_defs
+
+class FakeCursor(object):
+    """ Answers the queries of trg_trigger() and of the workitems of an
+        instance
+    """
+    dbname = 'test'
+
+    def __init__(self, triggers, instances, workitems):
+        self.triggers = triggers        # { (model, res_id): [instance id, ...] }
+        self.instances = instances      # { instance id: (res_type, res_id) }
+        self.workitems = workitems      # { instance id: [workitem, ...] }
+        self._result = None
+
+    def execute(self, query, params=()):
+        if query.startswith('select instance_id from wkf_triggers'):
+            res_id, model = params
+            self._result = [ (x,) for x in self.triggers.get((model, res_id), []) ]
+        elif query.startswith('select %s,res_type,res_id from wkf_instance'):
+            uid, inst_id = params
+            self._result = [ (uid,) + self.instances[inst_id] ]
+        elif query.startswith('select * from wkf_workitem where inst_id=%s'):
+            self._result = self.workitems[params[0]]
+        else:
+            raise AssertionError('unexpected query %r' % query)
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+    dictfetchall = fetchall
+
+class TriggerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.service = wkf_service.workflow_service('test.workflow')
+        self.saved = (instance.get_active, instance.get_workitems,
+                      instance.validate, instance.update, wkf_defs.load)
+        wkf_defs.load = lambda self, wkf_ids: None
+
+    def tearDown(self):
+        (instance.get_active, instance.get_workitems,
+         instance.validate, instance.update, wkf_defs.load) = self.saved
+        netsvc.Service.remove('test.workflow')
+
+    def test_nested_trigger(self):
+        """ An instance updated by a trigger fired from a workflow action
+            must not be processed with its prefetched workitems afterwards
+        """
+        stale = [{'id': 1, 'inst_id': 20, 'state': 'active'}]
+        fresh = [{'id': 2, 'inst_id': 20, 'state': 'active'}]
+        cr = FakeCursor({('res.a', 5): [20]}, {20: ('res.a', 6)}, {20: fresh})
+        processed = {}
+
+        def validate(cr, inst_id, ident, signal, force_running=False, defs=None, workitems=None):
+            processed[inst_id] = instance._get_workitems(cr, inst_id, workitems, defs)
+            if inst_id == 10:
+                # the action of the workitem of instance 10 fires a trigger
+                self.service.trg_trigger(ident[0], 'res.a', ident[2], cr)
+            return False
+
+        def update(cr, inst_id, ident, defs=None, workitems=None):
+            if defs is None:
+                defs = wkf_defs(cr)
+            instance._get_workitems(cr, inst_id, workitems, defs)
+            return False
+
+        instance.get_active = lambda cr, res_type, res_ids: [(10, 1, 5), (20, 1, 6)]
+        instance.get_workitems = lambda cr, inst_ids: {10: [], 20: stale}
+        instance.validate = validate
+        instance.update = update
+
+        self.service.trg_validate_multi(1, 'res.a', [5, 6], 'go', cr)
+        self.assertEqual(processed[20], fresh)
@@ -100,6 +100,7 @@ class configmanager(object):
             'secure_pkey_file': 'httpsd.sslkey',
             'osv_memory_count_limit': 'osv_memory.count_limit',
             'osv_memory_age_limit': 'osv_memory.age_limit',
+            'preload_databases': 'databases.preload',
         }
         
         self.blacklist_for_save = set(["publisher_warranty_url", "load_language"])
@@ -201,6 +202,8 @@ class configmanager(object):
         group.add_option("--db_port", dest="db_port", help="specify the database port", type="int")
         group.add_option("--db_maxconn", dest="db_maxconn", type='int',
                          help="specify the the maximum number of physical connections to posgresql")
+        group.add_option("--preload-databases", dest="preload_databases",
+                         help="specify a comma-separated list of databases to load at startup, in parallel")
         group.add_option("-P", "--import-partial", dest="import_partial",
                          help="Use this for big data importation, if it crashes you will be able to continue at the current state. Provide a filename to store intermediate importation states.", default=False)
         parser.add_option_group(group)
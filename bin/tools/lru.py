@@ -21,12 +21,17 @@ class LRU:
     http://pype.sourceforge.net
     Copyright 2003 Josiah Carlson.
     """
-    def __init__(self, count, pairs=[]):
+    def __init__(self, count, pairs=[], on_evict=None):
+        """
+        @param on_evict if given, a callable(key, value) that will be
+                notified of the items that are pushed out of the queue
+        """
         self._lock = threading.RLock()
         self.count = max(count, 1)
         self.d = {}
         self.first = None
         self.last = None
+        self.on_evict = on_evict
         for key, value in pairs:
             self[key] = value
 
@@ -61,6 +66,8 @@ class LRU:
             self.first = a.next
             a.next = None
             del self.d[a.me[0]]
+            if self.on_evict is not None:
+                self.on_evict(*a.me)
             del a
 
     @synchronized()
@@ -109,6 +116,12 @@ class LRU:
     def keys(self):
         return self.d.keys()
 
+    @synchronized()
+    def clear(self):
+        self.d = {}
+        self.first = None
+        self.last = None
+
     @synchronized()
     def pop(self,key):
         v=self[key]
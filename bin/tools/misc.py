@@ -794,13 +794,38 @@ def is_hashable(h):
     except TypeError:
         return False
 
+def _cache_hashable(v):
+    """ Convert v to something usable as (part of) a cache key
+    """
+    if isinstance(v, dict):
+        return _cache_tuple(v)
+    elif isinstance(v, (list, set)):
+        return tuple(v)
+    elif not is_hashable(v):
+        return repr(v)
+    return v
+
+def _cache_tuple(d):
+    pairs = d.items()
+    pairs.sort(key=lambda (k,v): k)
+    return tuple([(k, _cache_hashable(v)) for k, v in pairs])
+
 class cache(object):
     """
     Use it as a decorator of the function you plan to cache
     Timeout: 0 = no timeout, otherwise in seconds
+
+    Entries are kept in one LRU queue per database, and indexed by the
+    value of the first (non-skipped) argument of the function, so that
+    they can be cleared per database or per leading argument without
+    scanning the others. Expired entries are only discarded when they
+    are looked up.
     """
 
     __caches = []
+    # databases whose caches have been cleared by the current thread, that
+    # other server processes must be told about (see `pooler`)
+    __changed_dbs = local()
 
     def __init__(self, timeout=None, skiparg=2, multi=None, size=None):
         assert skiparg >= 2 , "at least self and cr must be skipped in cache"
@@ -809,17 +834,18 @@ class cache(object):
         self.fun = None
         self._debug = False
         self.__logger = None
+        self.hits = self.misses = self.expired = self.evicted = 0
         if config.get_misc('cache', 'enable', True):
             cache.__caches.append(self)
-            self.lasttime = time.time()
-            size = size or config.get_misc('cache', 'size', 8192)
-            self.cache = LRU(size)
+            self.size = size or int(config.get_misc('cache', 'size', 8192))
+            self.cache = {} # { dbname: LRU }
+            self._leads = {} # { dbname: { leading arg: set(keys) } }
+            self._lock = threading.RLock()
             if timeout is None:
                 self.timeout = int(config.get_misc('cache','timeout', 100000))
             else:
                 self.timeout = timeout
         else:
-            self.lasttime = None
             self.cache = None # will break attempts to use it.
             self.timeout = 10
 
@@ -830,32 +856,29 @@ class cache(object):
             self.__logger = logging.getLogger('tools.cache')
         self.__logger.debug(*args, **kwargs)
 
-    def _generate_keys(self, dbname, kwargs2):
+    def _generate_keys(self, kwargs2):
         """
         Generate keys depending of the arguments and the self.mutli value
+
+        Yields (key, id, lead) tuples, where lead is the value of the
+        leading argument, which the key is indexed by.
         """
 
-        def to_tuple(d):
-            pairs = d.items()
-            pairs.sort(key=lambda (k,v): k)
-            for i, (k, v) in enumerate(pairs):
-                if isinstance(v, dict):
-                    pairs[i] = (k, to_tuple(v))
-                if isinstance(v, (list, set)):
-                    pairs[i] = (k, tuple(v))
-                elif not is_hashable(v):
-                    pairs[i] = (k, repr(v))
-            return tuple(pairs)
+        def get_lead(key):
+            for k, v in key:
+                if k == self.lead_arg:
+                    return v
+            return None
 
         if not self.multi:
-            key = (('dbname', dbname),) + to_tuple(kwargs2)
-            yield key, None
+            key = _cache_tuple(kwargs2)
+            yield key, None, get_lead(key)
         else:
             multis = kwargs2[self.multi][:]
             for id in multis:
                 kwargs2[self.multi] = (id,)
-                key = (('dbname', dbname),) + to_tuple(kwargs2)
-                yield key, id
+                key = _cache_tuple(kwargs2)
+                yield key, id, get_lead(key)
 
     def _unify_args(self, *args, **kwargs):
         # Update named arguments with positional argument values (without self and cr)
@@ -864,24 +887,134 @@ class cache(object):
         kwargs2.update(dict(zip(self.fun_arg_names, args[self.skiparg-2:])))
         return kwargs2
 
+    def _get_lru(self, dbname):
+        """ Return the LRU queue of dbname, create it if needed
+
+            Must be called with self._lock held
+        """
+        lru = self.cache.get(dbname)
+        if lru is None:
+            leads = self._leads[dbname] = {}
+            def evicted(key, value):
+                self.evicted += 1
+                self._forget_lead(leads, key, value[2])
+            lru = self.cache[dbname] = LRU(self.size, on_evict=evicted)
+        return lru
+
+    def _forget_lead(self, leads, key, lead):
+        keys = leads.get(lead)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del leads[lead]
+
+    def _pop(self, dbname, key):
+        """ Remove one key from the cache of dbname
+
+            Must be called with self._lock held
+        """
+        lru = self.cache.get(dbname)
+        if lru is None or key not in lru:
+            return
+        value = lru.pop(key)
+        self._forget_lead(self._leads[dbname], key, value[2])
+
+    def _store(self, dbname, key, lead, result):
+        self._lock.acquire()
+        try:
+            self._get_lru(dbname)[key] = (result, time.time(), lead)
+            self._leads[dbname].setdefault(lead, set()).add(key)
+        finally:
+            self._lock.release()
+
+    def _clear(self, dbname, args, kwargs):
+        self._lock.acquire()
+        try:
+            if dbname not in self.cache:
+                return
+            if not args and not kwargs:
+                self.debug("Clearing cache for: %s, all of %s", repr(self.fun), dbname)
+                del self.cache[dbname]
+                del self._leads[dbname]
+                return
+
+            kwargs2 = self._unify_args(*args, **kwargs)
+            if [a for a in self.fun_arg_names if a not in kwargs2]:
+                # Not all the arguments are specified, so we clear all the
+                # keys of the leading one, or the whole db if it is missing, too
+                if self.lead_arg not in kwargs2:
+                    self.debug("Clearing cache for: %s, all of %s", repr(self.fun), dbname)
+                    del self.cache[dbname]
+                    del self._leads[dbname]
+                    return
+                lead = _cache_hashable(kwargs2[self.lead_arg])
+                keys_to_del = list(self._leads[dbname].get(lead, []))
+            else:
+                lru = self.cache[dbname]
+                keys_to_del = [key for key, _, _ in self._generate_keys(kwargs2) if key in lru]
+
+            self.debug("Clearing cache for: %s, %s", repr(self.fun), repr(keys_to_del))
+            for key in keys_to_del:
+                self._pop(dbname, key)
+        finally:
+            self._lock.release()
+
     def clear(self, dbname, *args, **kwargs):
         """clear the cache for database dbname
             if *args and **kwargs are both empty, clear all the keys related to this database
+            if they don't cover all the arguments of the function, clear all
+            the keys that have the same value for the leading argument
+
+            The change is also recorded, so that it can be signalled to the
+            other server processes at the end of the current request.
         """
-        if not args and not kwargs:
-            keys_to_del = [key for key in self.cache.keys() if key[0][1] == dbname]
-        else:
-            kwargs2 = self._unify_args(*args, **kwargs)
-            keys_to_del = [key for key, _ in self._generate_keys(dbname, kwargs2) if key in self.cache.keys()]
+        self._clear(dbname, args, kwargs)
+        cache._mark_changed(dbname)
+
+    @classmethod
+    def clean_caches_for_db(cls, dbname, signal=True):
+        """clear all the caches for database dbname
+
+            @param signal if False, the change will not be propagated to
+                    other server processes (eg. because it comes from them)
+        """
+        for c in cls.__caches:
+            c._clear(dbname, (), {})
+        if signal:
+            cls._mark_changed(dbname)
+
+    @classmethod
+    def _mark_changed(cls, dbname):
+        changed = getattr(cls.__changed_dbs, 'dbs', None)
+        if changed is None:
+            changed = cls.__changed_dbs.dbs = set()
+        changed.add(dbname)
 
-        self.debug("Clearing cache for: %s, %s", repr(self.fun), repr(keys_to_del))
-        for key in keys_to_del:
-            self.cache.pop(key)
+    @classmethod
+    def pop_changed(cls, dbname):
+        """ Tell whether the current thread has cleared any cache of dbname
+            since the last call, and reset that flag
+        """
+        changed = getattr(cls.__changed_dbs, 'dbs', None)
+        if changed and dbname in changed:
+            changed.discard(dbname)
+            return True
+        return False
 
     @classmethod
-    def clean_caches_for_db(cls, dbname):
+    def allStats(cls):
+        """ Return a newline-delimited string of the counters of all caches
+        """
+        res = ["Caches: %d" % len(cls.__caches)]
         for c in cls.__caches:
-            c.clear(dbname)
+            if c.fun is None:
+                continue
+            res.append("    %s.%s: %d entries in %d db, %d hits, %d misses, "
+                        "%d expired, %d evicted" % \
+                        (c.fun.__module__, c.fun.func_name,
+                        sum(map(len, c.cache.values())), len(c.cache),
+                        c.hits, c.misses, c.expired, c.evicted))
+        return '\n'.join(res)
 
     def clear_cache_stub(self, dbname, *args, **kwargs):
         pass
@@ -900,26 +1033,34 @@ class cache(object):
         self.fun_default_values = {}
         if argspec[3]:
             self.fun_default_values = dict(zip(self.fun_arg_names[-len(argspec[3]):], argspec[3]))
+        self.lead_arg = self.fun_arg_names and self.fun_arg_names[0] or None
 
         def cached_result(self2, cr, *args, **kwargs):
             if hasattr(self2, '_debug'):
                 self._debug = self2._debug
-            if time.time()-int(self.timeout) > self.lasttime:
-                self.lasttime = time.time()
-                t = time.time()-int(self.timeout)
-                old_keys = [key for key in self.cache.keys() if self.cache[key][1] < t]
-                for key in old_keys:
-                    self.cache.pop(key)
 
             kwargs2 = self._unify_args(*args, **kwargs)
+            dbname = cr.dbname
 
             result = {}
             notincache = {}
-            for key, id in self._generate_keys(cr.dbname, kwargs2):
-                if key in self.cache:
-                    result[id] = self.cache[key][0]
-                else:
-                    notincache[id] = key
+            self._lock.acquire()
+            try:
+                lru = self._get_lru(dbname)
+                min_time = self.timeout and (time.time() - self.timeout)
+                for key, id, lead in self._generate_keys(kwargs2):
+                    if key in lru:
+                        value = lru[key]
+                        if value[1] >= min_time:
+                            result[id] = value[0]
+                            self.hits += 1
+                            continue
+                        self.expired += 1
+                        self._pop(dbname, key)
+                    notincache[id] = (key, lead)
+                    self.misses += 1
+            finally:
+                self._lock.release()
 
             if notincache:
                 if self.multi:
@@ -928,13 +1069,13 @@ class cache(object):
                 self.debug("Must call %s for keys: %s", repr(fn), repr(kwargs2))
                 result2 = fn(self2, cr, *args[:self.skiparg-2], **kwargs2)
                 if not self.multi:
-                    key = notincache[None]
-                    self.cache[key] = (result2, time.time())
+                    key, lead = notincache[None]
+                    self._store(dbname, key, lead, result2)
                     result[None] = result2
                 else:
                     for id in result2:
-                        key = notincache[id]
-                        self.cache[key] = (result2[id], time.time())
+                        key, lead = notincache[id]
+                        self._store(dbname, key, lead, result2[id])
                     result.update(result2)
             else:
                 self.debug("Got all results for %s from cache: %s", repr(fn), repr(result))
@@ -38,7 +38,7 @@ from opcode import HAVE_ARGUMENT, opmap, opname
 from types import CodeType
 import logging
 
-__all__ = ['test_expr', 'literal_eval', 'safe_eval', 'const_eval' ]
+__all__ = ['test_expr', 'literal_eval', 'safe_eval', 'const_eval', 'safe_code' ]
 
 # The time module is usually already provided in the safe_eval environment
 # but some code, e.g. datetime.datetime.now() (Windows/Python 2.5.2, bug
@@ -218,6 +218,22 @@ def _import(name, globals={}, locals={}, fromlist=[], level=-1):
         return __import__(name, globals, locals, level)
     raise ImportError(name)
 
+class safe_code(object):
+    """ An expression that has been checked and compiled once, so that it
+        can be passed to safe_eval() many times, without the cost of
+        compiling it again.
+    """
+    __slots__ = ('expr', 'code')
+
+    def __init__(self, expr, mode="eval"):
+        if '__subclasses__' in expr:
+            raise ValueError('expression not allowed (__subclasses__)')
+        self.expr = expr
+        self.code = test_expr(expr, _SAFE_OPCODES, mode=mode)
+
+    def __repr__(self):
+        return '<safe_code %r>' % self.expr
+
 def safe_eval(expr, globals_dict=None, locals_dict=None, mode="eval", nocopy=False):
     """safe_eval(expression[, globals[, locals[, mode[, nocopy]]]]) -> result
 
@@ -241,8 +257,12 @@ def safe_eval(expr, globals_dict=None, locals_dict=None, mode="eval", nocopy=Fal
     if isinstance(expr, CodeType):
         raise ValueError("safe_eval does not allow direct evaluation of code objects.")
 
-    if '__subclasses__' in expr:
-       raise ValueError('expression not allowed (__subclasses__)')
+    if isinstance(expr, safe_code):
+        code = expr.code
+    else:
+        if '__subclasses__' in expr:
+           raise ValueError('expression not allowed (__subclasses__)')
+        code = None
 
     if globals_dict is None:
         globals_dict = {}
@@ -282,7 +302,9 @@ def safe_eval(expr, globals_dict=None, locals_dict=None, mode="eval", nocopy=Fal
                 'set' : set
             }
     )
-    return eval(test_expr(expr,_SAFE_OPCODES, mode=mode), globals_dict, locals_dict)
+    if code is None:
+        code = test_expr(expr,_SAFE_OPCODES, mode=mode)
+    return eval(code, globals_dict, locals_dict)
 
 import logging
 import traceback
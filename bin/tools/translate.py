@@ -152,6 +152,54 @@ def translate(cr, name, source_type, lang, source=None):
     res = res_trans and res_trans[0] or False
     return res
 
+class _db_ref(object):
+    """ Stands for a cursor of the database dbname, when _() finds no
+        cursor in its caller: one is only opened to load the catalog
+    """
+    def __init__(self, dbname):
+        self.dbname = dbname
+
+def _load_code_catalog(self, cr, lang):
+    """ Return the { source: translation } dict of the code terms (and
+        sql constraint messages) translated in lang
+    """
+    own_cr = not hasattr(cr, 'execute')
+    if own_cr:
+        cr = pooler.get_db(cr.dbname).cursor()
+    try:
+        cr.execute("SELECT src, value FROM ir_translation "
+                    "WHERE lang=%s AND type IN (%s,%s) "
+                    "AND value IS NOT NULL AND value != '' ",
+                    (lang, 'code', 'sql_constraint'))
+        return dict(cr.fetchall())
+    finally:
+        if own_cr:
+            cr.close()
+
+_get_code_catalog = tools.misc.cache(skiparg=2)(_load_code_catalog)
+
+def _clear_code_catalog(dbname, lang):
+    if lang:
+        _get_code_catalog.clear_cache(dbname, lang)
+    else:
+        _get_code_catalog.clear_cache(dbname)
+
+def clear_code_catalog(cr, lang=None):
+    """ Forget the code terms of lang, or of all languages, loaded from
+        the database of cr, after they have been modified in its
+        transaction.
+
+        They are forgotten again at the end of the transaction: until then,
+        other requests may load them as they were before the change, and
+        the transaction may load them as changed and roll back.
+    """
+    _clear_code_catalog(cr.dbname, lang)
+    cleared = cr.transaction.setdefault('code_catalog_clear', set())
+    if lang not in cleared:
+        cleared.add(lang)
+        cr.after_commit(_clear_code_catalog, cr.dbname, lang)
+        cr.after_rollback(_clear_code_catalog, cr.dbname, lang)
+
 class GettextAlias(object):
     def __call__(self, source):
         try:
@@ -165,7 +213,6 @@ class GettextAlias(object):
         except Exception:
             return source
 
-        own_cr = False
         cr = frame.f_locals.get('cr')
         try:
             ctx = frame.f_locals.get('context', False)
@@ -189,32 +236,34 @@ class GettextAlias(object):
             if (not cr) and frame.f_globals.get('pooler',False):
                 db = frame.f_locals.get('dbname') or frame.f_locals.get('db')
                 if db and isinstance(db, basestring):
-                    cr = pooler.get_db(db).cursor()
-                    own_cr = True
-            if not cr:
+                    cr = _db_ref(db)
+            if not (hasattr(cr, 'execute') or isinstance(cr, _db_ref)):
                 return source
         except Exception:
             return source
 
-        if hasattr(cr, 'execute'):
-            try:
-                # TODO: try to match the frame's filename, line_no,
-                # but in a "least distance" sense
-                # if so, double-check the root/base translations filenames
-                
-                cr.execute("SELECT value FROM ir_translation " \
-                            "WHERE lang=%s and type IN (%s,%s) AND src=%s "
-                            "AND value IS NOT NULL AND value != '' ",
-                            (lang, 'code','sql_constraint', source))
-                res_trans = cr.fetchone()
-                return res_trans and res_trans[0] or source
-            finally:
-                try:
-                    if own_cr:
-                        cr.close()
-                except Exception: pass
-        else:
-            return source
+        if _get_code_catalog is _load_code_catalog:
+            # the caches are disabled, only look for source
+            return self._lookup(cr, lang, source)
+        # TODO: try to match the frame's filename, line_no,
+        # but in a "least distance" sense
+        # if so, double-check the root/base translations filenames
+        return _get_code_catalog(None, cr, lang).get(source) or source
+
+    def _lookup(self, cr, lang, source):
+        own_cr = not hasattr(cr, 'execute')
+        if own_cr:
+            cr = pooler.get_db(cr.dbname).cursor()
+        try:
+            cr.execute("SELECT value FROM ir_translation " \
+                        "WHERE lang=%s and type IN (%s,%s) AND src=%s "
+                        "AND value IS NOT NULL AND value != '' ",
+                        (lang, 'code','sql_constraint', source))
+            res_trans = cr.fetchone()
+            return res_trans and res_trans[0] or source
+        finally:
+            if own_cr:
+                cr.close()
 _ = GettextAlias()
 
 
@@ -874,13 +923,14 @@ def trans_generate(lang, modules, cr):
 
     return out
 
-def trans_load(cr, filename, lang, verbose=True, context=None):
+def trans_load(cr, filename, lang, verbose=True, context=None, import_cursor=None):
     logger = logging.getLogger('i18n')
     try:
         fileobj = open(filename,'r')
         logger.info("loading %s", filename)
         fileformat = os.path.splitext(filename)[-1][1:].lower()
-        r = trans_load_data(cr, fileobj, fileformat, lang, verbose=verbose, context=context)
+        r = trans_load_data(cr, fileobj, fileformat, lang, verbose=verbose, context=context,
+                            import_cursor=import_cursor)
         fileobj.close()
         return r
     except IOError:
@@ -888,8 +938,13 @@ def trans_load(cr, filename, lang, verbose=True, context=None):
             logger.error("couldn't read translation file %s", filename)
         return None
 
-def trans_load_data(cr, fileobj, fileformat, lang, lang_name=None, verbose=True, context=None):
+def trans_load_data(cr, fileobj, fileformat, lang, lang_name=None, verbose=True, context=None,
+                    import_cursor=None):
     """Populates the ir_translation table. 
+
+    @param import_cursor an import cursor of ir.translation, that is fed
+        with the terms of the file and left to the caller to finish(),
+        to load several files at once
     """
     logger = logging.getLogger('i18n')
     if verbose:
@@ -934,7 +989,7 @@ def trans_load_data(cr, fileobj, fileformat, lang, lang_name=None, verbose=True,
 
         # read the rest of the file
         line = 1
-        irt_cursor = trans_obj._get_import_cursor(cr, uid, context=context)
+        irt_cursor = import_cursor or trans_obj._get_import_cursor(cr, uid, context=context)
 
         for row in reader:
             line += 1
@@ -980,7 +1035,8 @@ def trans_load_data(cr, fileobj, fileformat, lang, lang_name=None, verbose=True,
 
             irt_cursor.push(dic)
 
-        irt_cursor.finish()
+        if not import_cursor:
+            irt_cursor.finish()
         if verbose:
             logger.info("translation file loaded succesfully")
     except IOError:
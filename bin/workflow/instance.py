@@ -21,45 +21,115 @@
 
 import wkf_logs
 import workitem
+from wkf_defs import wkf_defs
 
 import netsvc
 import pooler
 
-def create(cr, ident, wkf_id):
+def create(cr, ident, wkf_id, defs=None):
     (uid,res_type,res_id) = ident
     cr.execute('insert into wkf_instance (res_type,res_id,uid,wkf_id) values (%s,%s,%s,%s) RETURNING id', (res_type,res_id,uid,wkf_id))
     id_new = cr.fetchone()[0]
-    cr.execute('select * from wkf_activity where flow_start=True and wkf_id=%s', (wkf_id,))
-    res = cr.dictfetchall()
-    stack = []
-    workitem.create(cr, res, id_new, ident, stack=stack)
-    update(cr, id_new, ident)
+    start(cr, id_new, ident, wkf_id, defs=defs)
     return id_new
 
+def create_multi(cr, uid, res_type, res_ids, wkf_id, defs):
+    """ Create instances of workflow wkf_id for all res_ids at once, and
+        start them
+
+        @return the list of new instance ids
+    """
+    inst_ids = []
+    for sub_ids in cr.split_for_in_conditions(res_ids):
+        params = []
+        for res_id in sub_ids:
+            params += [res_type, res_id, uid, wkf_id]
+        cr.execute('insert into wkf_instance (res_type,res_id,uid,wkf_id) values ' + \
+                    ','.join(['(%s,%s,%s,%s)'] * len(sub_ids)) + \
+                    ' RETURNING id, res_id', params)
+        inst_ids.extend(cr.fetchall())
+    order = dict([ (res_id, i) for i, res_id in enumerate(res_ids) ])
+    inst_ids.sort(key=lambda (inst_id, res_id): order[res_id])
+    for inst_id, res_id in inst_ids:
+        start(cr, inst_id, (uid, res_type, res_id), wkf_id, defs=defs)
+    return [ x[0] for x in inst_ids ]
+
+def start(cr, inst_id, ident, wkf_id, defs=None):
+    """ Create the workitems of the start activities of a new instance
+    """
+    if defs is None:
+        defs = wkf_defs(cr)
+    res = defs.start_activities(wkf_id)
+    stack = []
+    workitem.create(cr, res, inst_id, ident, stack=stack, defs=defs)
+    update(cr, inst_id, ident, defs=defs)
+
 def delete(cr, ident):
     (uid,res_type,res_id) = ident
     cr.execute('delete from wkf_instance where res_id=%s and res_type=%s', (res_id,res_type))
 
-def validate(cr, inst_id, ident, signal, force_running=False):
-    cr.execute("select * from wkf_workitem where inst_id=%s", (inst_id,))
+def delete_multi(cr, res_type, res_ids):
+    for sub_ids in cr.split_for_in_conditions(res_ids):
+        cr.execute('delete from wkf_instance where res_id IN %s and res_type=%s', (sub_ids, res_type))
+
+def get_active(cr, res_type, res_ids):
+    """ Return the (id, wkf_id, res_id) of the active instances of res_ids,
+        in the order of res_ids
+    """
+    res = []
+    for sub_ids in cr.split_for_in_conditions(res_ids):
+        cr.execute('select id, wkf_id, res_id from wkf_instance '
+                    'where res_id IN %s and res_type=%s and state=%s',
+                    (sub_ids, res_type, 'active'))
+        res.extend(cr.fetchall())
+    order = dict([ (res_id, i) for i, res_id in enumerate(res_ids) ])
+    res.sort(key=lambda r: (order[r[2]], r[0]))
+    return res
+
+def get_workitems(cr, inst_ids):
+    """ Fetch the workitems of inst_ids, in one go
+
+        @return a dictionary of { inst_id: [workitem, ...] }
+    """
+    res = dict([ (inst_id, []) for inst_id in inst_ids ])
+    for sub_ids in cr.split_for_in_conditions(inst_ids):
+        cr.execute("select * from wkf_workitem where inst_id IN %s order by id", (sub_ids,))
+        for witem in cr.dictfetchall():
+            res[witem['inst_id']].append(witem)
+    return res
+
+def _get_workitems(cr, inst_id, workitems, defs):
+    """ Use the prefetched workitems, unless some previous operation
+        has modified the instance
+
+        The instance is then marked as touched, for the rest of the batch
+    """
+    if workitems is None or inst_id in defs.touched_instances:
+        cr.execute("select * from wkf_workitem where inst_id=%s", (inst_id,))
+        workitems = cr.dictfetchall()
+    defs.touched_instances.add(inst_id)
+    return workitems
+
+def validate(cr, inst_id, ident, signal, force_running=False, defs=None, workitems=None):
+    if defs is None:
+        defs = wkf_defs(cr)
     stack = []
-    for witem in cr.dictfetchall():
+    for witem in _get_workitems(cr, inst_id, workitems, defs):
         stack = []
-        workitem.process(cr, witem, ident, signal, force_running, stack=stack)
+        workitem.process(cr, witem, ident, signal, force_running, stack=stack, defs=defs)
         # An action is returned
-    _update_end(cr, inst_id, ident)
+    _update_end(cr, inst_id, ident, defs)
     return stack and stack[0] or False
 
-def update(cr, inst_id, ident):
-    cr.execute("select * from wkf_workitem where inst_id=%s", (inst_id,))
-    for witem in cr.dictfetchall():
+def update(cr, inst_id, ident, defs=None, workitems=None):
+    if defs is None:
+        defs = wkf_defs(cr)
+    for witem in _get_workitems(cr, inst_id, workitems, defs):
         stack = []
-        workitem.process(cr, witem, ident, stack=stack)
-    return _update_end(cr, inst_id, ident)
+        workitem.process(cr, witem, ident, stack=stack, defs=defs)
+    return _update_end(cr, inst_id, ident, defs)
 
-def _update_end(cr, inst_id, ident):
-    cr.execute('select wkf_id from wkf_instance where id=%s', (inst_id,))
-    wkf_id = cr.fetchone()[0]
+def _update_end(cr, inst_id, ident, defs):
     cr.execute('select state,flow_stop from wkf_workitem w left join wkf_activity a on (a.id=w.act_id) where w.inst_id=%s', (inst_id,))
     ok=True
     for r in cr.fetchall():
@@ -73,8 +143,9 @@ def _update_end(cr, inst_id, ident):
         cr.execute("update wkf_workitem set state='complete' where subflow_id=%s", (inst_id,))
         cr.execute("select i.id,w.osv,i.res_id from wkf_instance i left join wkf w on (i.wkf_id=w.id) where i.id IN (select inst_id from wkf_workitem where subflow_id=%s)", (inst_id,))
         for i in cr.fetchall():
+            defs.touched_instances.add(i[0])
             for act_name in act_names:
-                validate(cr, i[0], (ident[0],i[1],i[2]), 'subflow.'+act_name[0])
+                validate(cr, i[0], (ident[0],i[1],i[2]), 'subflow.'+act_name[0], defs=defs)
     return ok
 
 
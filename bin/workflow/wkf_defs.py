@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-2009 Tiny SPRL (<http://tiny.be>).
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import tools
+import wkf_expr
+
+class wkf_graph(object):
+    """ The activities and transitions of one workflow, with their
+        expressions compiled once.
+
+        Graphs are shared by all the requests on a database (see
+        `graphs`), so they must never be modified once built.
+    """
+    __slots__ = ('wkf_id', 'activities', 'transitions', 'trans_from', 'trans_to', 'start')
+
+    def __init__(self, cr, wkf_id):
+        self.wkf_id = wkf_id
+        self.activities = {}    # { act_id: activity }
+        self.transitions = {}   # { trans_id: transition }
+        self.trans_from = {}    # { act_id: [transition, ...] }
+        self.trans_to = {}      # { act_id: [transition id, ...] }
+        self.start = []         # [activity, ...]
+        cr.execute('select * from wkf_activity where wkf_id=%s order by id', (wkf_id,))
+        for act in cr.dictfetchall():
+            act['action_code'] = wkf_expr.compile_expr(act['action'])
+            self.activities[act['id']] = act
+            self.trans_from[act['id']] = []
+            self.trans_to[act['id']] = []
+            if act['flow_start']:
+                self.start.append(act)
+        # transitions leaving or reaching the activities of the workflow
+        cr.execute('select t.* from wkf_transition t '
+                    'join wkf_activity a on (a.id=t.act_from) '
+                    'join wkf_activity b on (b.id=t.act_to) '
+                    'where a.wkf_id=%s or b.wkf_id=%s order by t.id', (wkf_id, wkf_id))
+        for trans in cr.dictfetchall():
+            trans['condition_code'] = wkf_expr.compile_expr(trans['condition'])
+            trans['trigger_expr_code'] = wkf_expr.compile_expr(trans['trigger_expr_id'])
+            if trans['act_from'] in self.trans_from:
+                self.transitions[trans['id']] = trans
+                self.trans_from[trans['act_from']].append(trans)
+            if trans['act_to'] in self.trans_to:
+                self.trans_to[trans['act_to']].append(trans['id'])
+
+class wkf_graph_cache(object):
+    """ Keeps the graphs of the workflows of each database in memory,
+        until workflow definitions are modified (see `clear`).
+    """
+    @tools.cache(timeout=0)
+    def get(self, cr, wkf_id):
+        return wkf_graph(cr, wkf_id)
+
+    @tools.cache(timeout=0)
+    def activity_workflow(self, cr, act_id):
+        cr.execute('select wkf_id from wkf_activity where id=%s', (act_id,))
+        return cr.fetchone()[0]
+
+    @tools.cache(timeout=0)
+    def transition_workflow(self, cr, trans_id):
+        cr.execute('select a.wkf_id from wkf_transition t join wkf_activity a on (a.id=t.act_from) '
+                    'where t.id=%s', (trans_id,))
+        return cr.fetchone()[0]
+
+    def clear(self, dbname):
+        self.get.clear_cache(dbname)
+        self.activity_workflow.clear_cache(dbname)
+        self.transition_workflow.clear_cache(dbname)
+
+graphs = wkf_graph_cache()
+
+class wkf_defs(object):
+    """ Definitions of workflow activities and transitions, for one batch
+        of workflow operations.
+
+        They are taken per whole workflow from `graphs`, the first time
+        any of its activities is needed, so that processing many workitems
+        only costs dictionary lookups.
+
+        It also records the instances that have been modified as a side
+        effect of processing other ones (through subflows), so that their
+        prefetched workitems can be discarded.
+    """
+    def __init__(self, cr):
+        self.cr = cr
+        self.activities = {}    # { act_id: activity }
+        self.transitions = {}   # { trans_id: transition }
+        self.trans_from = {}    # { act_id: [transition, ...] }
+        self.trans_to = {}      # { act_id: [transition id, ...] }
+        self.start = {}         # { wkf_id: [activity, ...] }
+        self.touched_instances = set()
+
+    def load(self, wkf_ids):
+        """ Fetch the activities and transitions of the wkf_ids workflows
+        """
+        for wkf_id in set(wkf_ids):
+            if wkf_id in self.start:
+                continue
+            graph = graphs.get(self.cr, wkf_id)
+            self.activities.update(graph.activities)
+            self.transitions.update(graph.transitions)
+            self.trans_from.update(graph.trans_from)
+            self.trans_to.update(graph.trans_to)
+            self.start[wkf_id] = graph.start
+
+    def _load_act(self, act_id):
+        if act_id not in self.activities:
+            self.load([graphs.activity_workflow(self.cr, act_id)])
+
+    def activity(self, act_id):
+        self._load_act(act_id)
+        return self.activities[act_id]
+
+    def transitions_from(self, act_id):
+        """ Return the list of transitions leaving activity act_id
+        """
+        self._load_act(act_id)
+        return self.trans_from[act_id]
+
+    def transitions_to(self, act_id):
+        """ Return the ids of the transitions arriving at activity act_id
+        """
+        self._load_act(act_id)
+        return self.trans_to[act_id]
+
+    def transition(self, trans_id):
+        if trans_id not in self.transitions:
+            self.load([graphs.transition_workflow(self.cr, trans_id)])
+        return self.transitions[trans_id]
+
+    def start_activities(self, wkf_id):
+        self.load([wkf_id])
+        return self.start[wkf_id]
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -23,7 +23,7 @@ import sys
 import netsvc
 import osv as base
 import pooler
-from tools.safe_eval import safe_eval as eval
+from tools.safe_eval import safe_eval as eval, safe_code
 
 class Env(dict):
     def __init__(self, cr, uid, model, ids):
@@ -41,17 +41,41 @@ class Env(dict):
         else:
             return super(Env, self).__getitem__(key)
 
-def _eval_expr(cr, ident, workitem, action):
-    ret=False
-    assert action, 'You used a NULL action in a workflow, use dummy node instead.'
+def compile_expr(action):
+    """ Compile the lines of a workflow expression once, for _eval_expr().
+
+        Returns a tuple of True, False or safe_code items, or None if the
+        expression cannot be compiled, in which case it is left to
+        _eval_expr() to report the error when it is evaluated.
+    """
+    if not action:
+        return None
+    res = []
     for line in action.split('\n'):
         line = line.strip()
-        uid=ident[0]
-        model=ident[1]
-        ids=[ident[2]]
-        if line =='True':
+        if line == 'True':
+            res.append(True)
+        elif line == 'False':
+            res.append(False)
+        else:
+            try:
+                res.append(safe_code(line))
+            except Exception:
+                return None
+    return tuple(res)
+
+def _eval_expr(cr, ident, workitem, action, compiled=None):
+    ret=False
+    assert action, 'You used a NULL action in a workflow, use dummy node instead.'
+    if compiled is None:
+        compiled = [ line.strip() for line in action.split('\n') ]
+    uid=ident[0]
+    model=ident[1]
+    ids=[ident[2]]
+    for line in compiled:
+        if line is True or line =='True':
             ret=True
-        elif line =='False':
+        elif line is False or line =='False':
             ret=False
         else:
             env = Env(cr, uid, model, ids)
@@ -65,7 +89,7 @@ def execute_action(cr, ident, workitem, activity):
     return result
 
 def execute(cr, ident, workitem, activity):
-    return _eval_expr(cr, ident, workitem, activity['action'])
+    return _eval_expr(cr, ident, workitem, activity['action'], activity.get('action_code'))
 
 def check(cr, workitem, ident, transition, signal):
     if transition['signal'] and signal != transition['signal']:
@@ -78,7 +102,7 @@ def check(cr, workitem, ident, transition, signal):
         if not transition['group_id'] in user_groups:
             return False
 
-    return _eval_expr(cr, ident, workitem, transition['condition'])
+    return _eval_expr(cr, ident, workitem, transition['condition'], transition.get('condition_code'))
 
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
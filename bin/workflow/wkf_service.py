@@ -22,45 +22,99 @@
 import wkf_logs
 import workitem
 import instance
+from wkf_defs import wkf_defs, graphs
 
 import netsvc
 import pooler
+import threading
 
 class workflow_service(netsvc.Service):
     def __init__(self, name='workflow', audience='*'):
         netsvc.Service.__init__(self, name, audience)
         self.exportMethod(self.trg_write)
+        self.exportMethod(self.trg_write_multi)
         self.exportMethod(self.trg_delete)
+        self.exportMethod(self.trg_delete_multi)
         self.exportMethod(self.trg_create)
+        self.exportMethod(self.trg_create_multi)
         self.exportMethod(self.trg_validate)
+        self.exportMethod(self.trg_validate_multi)
         self.exportMethod(self.trg_redirect)
         self.exportMethod(self.trg_trigger)
         self.exportMethod(self.clear_cache)
         self.wkf_on_create_cache={}
+        self._batch = threading.local()
 
     def clear_cache(self, cr, uid):
         self.wkf_on_create_cache[cr.dbname]={}
+        graphs.clear(cr.dbname)
+
+    def _begin(self, cr):
+        """ Return the workflow definitions of the batch running on cr
+
+            Triggers that are fired from within workflow actions share
+            the definitions of the outer batch, so that they all know of
+            the instances modified by each other.
+
+            @return (defs, prev), prev to be passed to _end()
+        """
+        prev = getattr(self._batch, 'defs', None)
+        if prev is not None and prev.cr is cr:
+            return prev, prev
+        self._batch.defs = wkf_defs(cr)
+        return self._batch.defs, prev
+
+    def _end(self, prev):
+        self._batch.defs = prev
+
+    def _prefetch(self, cr, defs, res_type, res_ids):
+        """ Load the active instances of res_ids, their workitems and the
+            definitions of their workflows, in a few queries
+
+            @return (instances, workitems)
+        """
+        res_ids = [ x for x in res_ids if x ]
+        if not (res_ids and res_type):
+            return [], {}
+        insts = instance.get_active(cr, res_type, res_ids)
+        defs.load([ wkf_id for (id, wkf_id, res_id) in insts ])
+        workitems = instance.get_workitems(cr, [ id for (id, wkf_id, res_id) in insts ])
+        return insts, workitems
 
     def trg_write(self, uid, res_type, res_id, cr):
-        ident = (uid,res_type,res_id)
-        cr.execute('select id from wkf_instance where res_id=%s and res_type=%s and state=%s', (res_id or None,res_type or None, 'active'))
-        for (id,) in cr.fetchall():
-            instance.update(cr, id, ident)
+        self.trg_write_multi(uid, res_type, [res_id], cr)
+
+    def trg_write_multi(self, uid, res_type, res_ids, cr):
+        defs, prev = self._begin(cr)
+        try:
+            insts, workitems = self._prefetch(cr, defs, res_type, res_ids)
+            for (id, wkf_id, res_id) in insts:
+                instance.update(cr, id, (uid,res_type,res_id), defs=defs,
+                                workitems=workitems[id])
+        finally:
+            self._end(prev)
 
     def trg_trigger(self, uid, res_type, res_id, cr):
         cr.execute('select instance_id from wkf_triggers where res_id=%s and model=%s', (res_id,res_type))
         res = cr.fetchall()
-        for (instance_id,) in res:
-            cr.execute('select %s,res_type,res_id from wkf_instance where id=%s', (uid, instance_id,))
-            ident = cr.fetchone()
-            instance.update(cr, instance_id, ident)
+        defs, prev = self._begin(cr)
+        try:
+            for (instance_id,) in res:
+                cr.execute('select %s,res_type,res_id from wkf_instance where id=%s', (uid, instance_id,))
+                ident = cr.fetchone()
+                instance.update(cr, instance_id, ident, defs=defs)
+        finally:
+            self._end(prev)
 
     def trg_delete(self, uid, res_type, res_id, cr):
         ident = (uid,res_type,res_id)
         instance.delete(cr, ident)
 
-    def trg_create(self, uid, res_type, res_id, cr):
-        ident = (uid,res_type,res_id)
+    def trg_delete_multi(self, uid, res_type, res_ids, cr):
+        if res_ids:
+            instance.delete_multi(cr, res_type, res_ids)
+
+    def _get_on_create(self, cr, res_type):
         self.wkf_on_create_cache.setdefault(cr.dbname, {})
         if res_type in self.wkf_on_create_cache[cr.dbname]:
             wkf_ids = self.wkf_on_create_cache[cr.dbname][res_type]
@@ -68,17 +122,51 @@ class workflow_service(netsvc.Service):
             cr.execute('select id from wkf where osv=%s and on_create=True', (res_type,))
             wkf_ids = cr.fetchall()
             self.wkf_on_create_cache[cr.dbname][res_type] = wkf_ids
-        for (wkf_id,) in wkf_ids:
-            instance.create(cr, ident, wkf_id)
+        return wkf_ids
 
-    def trg_validate(self, uid, res_type, res_id, signal, cr):
-        result = False
+    def trg_create(self, uid, res_type, res_id, cr):
         ident = (uid,res_type,res_id)
-        # ids of all active workflow instances for a corresponding resource (id, model_nam)
-        cr.execute('select id from wkf_instance where res_id=%s and res_type=%s and state=%s', (res_id, res_type, 'active'))
-        for (id,) in cr.fetchall():
-            res2 = instance.validate(cr, id, ident, signal)
-            result = result or res2
+        wkf_ids = self._get_on_create(cr, res_type)
+        if not wkf_ids:
+            return
+        defs, prev = self._begin(cr)
+        try:
+            for (wkf_id,) in wkf_ids:
+                instance.create(cr, ident, wkf_id, defs=defs)
+        finally:
+            self._end(prev)
+
+    def trg_create_multi(self, uid, res_type, res_ids, cr):
+        wkf_ids = self._get_on_create(cr, res_type)
+        if not (wkf_ids and res_ids):
+            return
+        defs, prev = self._begin(cr)
+        try:
+            defs.load([ wkf_id for (wkf_id,) in wkf_ids ])
+            for (wkf_id,) in wkf_ids:
+                instance.create_multi(cr, uid, res_type, res_ids, wkf_id, defs)
+        finally:
+            self._end(prev)
+
+    def trg_validate(self, uid, res_type, res_id, signal, cr):
+        return self.trg_validate_multi(uid, res_type, [res_id], signal, cr).get(res_id, False)
+
+    def trg_validate_multi(self, uid, res_type, res_ids, signal, cr):
+        """ Send signal to the workflow instances of all res_ids
+
+            @return a dictionary of { res_id: result }, where result is the
+                    (first) client action returned, or False
+        """
+        result = {}
+        defs, prev = self._begin(cr)
+        try:
+            insts, workitems = self._prefetch(cr, defs, res_type, res_ids)
+            for (id, wkf_id, res_id) in insts:
+                res2 = instance.validate(cr, id, (uid,res_type,res_id), signal,
+                                        defs=defs, workitems=workitems[id])
+                result[res_id] = result.get(res_id) or res2
+        finally:
+            self._end(prev)
         return result
 
     # make all workitems which are waiting for a (subflow) workflow instance
@@ -29,28 +29,29 @@ import instance
 
 import wkf_expr
 import wkf_logs
+from wkf_defs import wkf_defs
 
-def create(cr, act_datas, inst_id, ident, stack):
+def create(cr, act_datas, inst_id, ident, stack, defs=None):
+    if defs is None:
+        defs = wkf_defs(cr)
     for act in act_datas:
-        cr.execute("select nextval('wkf_workitem_id_seq')")
-        id_new = cr.fetchone()[0]
-        cr.execute("insert into wkf_workitem (id,act_id,inst_id,state) values (%s,%s,%s,'active')", (id_new, act['id'], inst_id))
-        cr.execute('select * from wkf_workitem where id=%s',(id_new,))
+        cr.execute("insert into wkf_workitem (act_id,inst_id,state) values (%s,%s,'active') RETURNING *", (act['id'], inst_id))
         res = cr.dictfetchone()
         wkf_logs.log(cr,ident,act['id'],'active')
-        process(cr, res, ident, stack=stack)
+        process(cr, res, ident, stack=stack, defs=defs)
 
-def process(cr, workitem, ident, signal=None, force_running=False, stack=None):
+def process(cr, workitem, ident, signal=None, force_running=False, stack=None, defs=None):
     if stack is None:
         raise RuntimeError('No stack!')
+    if defs is None:
+        defs = wkf_defs(cr)
     result = True
-    cr.execute('select * from wkf_activity where id=%s', (workitem['act_id'],))
-    activity = cr.dictfetchone()
+    activity = defs.activity(workitem['act_id'])
 
     triggers = False
     if workitem['state']=='active':
         triggers = True
-        result = _execute(cr, workitem, activity, ident, stack)
+        result = _execute(cr, workitem, activity, ident, stack, defs)
         if not result:
             return False
 
@@ -58,15 +59,14 @@ def process(cr, workitem, ident, signal=None, force_running=False, stack=None):
         pass
 
     if workitem['state']=='complete' or force_running:
-        ok = _split_test(cr, workitem, activity['split_mode'], ident, signal, stack)
+        ok = _split_test(cr, workitem, activity['split_mode'], ident, signal, stack, defs)
         triggers = triggers and not ok
 
     if triggers:
-        cr.execute('select * from wkf_transition where act_from=%s', (workitem['act_id'],))
-        alltrans = cr.dictfetchall()
+        alltrans = defs.transitions_from(workitem['act_id'])
         for trans in alltrans:
             if trans['trigger_model']:
-                ids = wkf_expr._eval_expr(cr,ident,workitem,trans['trigger_expr_id'])
+                ids = wkf_expr._eval_expr(cr,ident,workitem,trans['trigger_expr_id'],trans.get('trigger_expr_code'))
                 for res_id in ids:
                     cr.execute('select nextval(\'wkf_triggers_id_seq\')')
                     id =cr.fetchone()[0]
@@ -82,7 +82,7 @@ def _state_set(cr, workitem, activity, state, ident):
     workitem['state'] = state
     wkf_logs.log(cr,ident,activity['id'],state)
 
-def _execute(cr, workitem, activity, ident, stack):
+def _execute(cr, workitem, activity, ident, stack, defs):
     result = True
     #
     # send a signal to parent workflow (signal: subflow.signal_name)
@@ -131,7 +131,7 @@ def _execute(cr, workitem, activity, ident, stack):
                 cr.execute('select id from wkf_instance where res_id=%s and wkf_id=%s', (id_new,activity['subflow_id']))
                 id_new = cr.fetchone()[0]
             else:
-                id_new = instance.create(cr, ident, activity['subflow_id'])
+                id_new = instance.create(cr, ident, activity['subflow_id'], defs=defs)
             cr.execute('update wkf_workitem set subflow_id=%s where id=%s', (id_new, workitem['id']))
             workitem['subflow_id'] = id_new
         if workitem['state']=='running':
@@ -140,17 +140,16 @@ def _execute(cr, workitem, activity, ident, stack):
             if state=='complete':
                 _state_set(cr, workitem, activity, 'complete', ident)
     for t in signal_todo:
-        instance.validate(cr, t[0], t[1], t[2], force_running=True)
+        instance.validate(cr, t[0], t[1], t[2], force_running=True, defs=defs)
 
     return result
 
-def _split_test(cr, workitem, split_mode, ident, signal=None, stack=None):
+def _split_test(cr, workitem, split_mode, ident, signal=None, stack=None, defs=None):
     if stack is None:
         raise 'Error !!!'
-    cr.execute('select * from wkf_transition where act_from=%s', (workitem['act_id'],))
     test = False
     transitions = []
-    alltrans = cr.dictfetchall()
+    alltrans = defs.transitions_from(workitem['act_id'])
     if split_mode=='XOR' or split_mode=='OR':
         for transition in alltrans:
             if wkf_expr.check(cr, workitem, ident, transition,signal):
@@ -171,30 +170,28 @@ def _split_test(cr, workitem, split_mode, ident, signal=None, stack=None):
         cr.executemany('insert into wkf_witm_trans (trans_id,inst_id) values (%s,%s)', transitions)
         cr.execute('delete from wkf_workitem where id=%s', (workitem['id'],))
         for t in transitions:
-            _join_test(cr, t[0], t[1], ident, stack)
+            _join_test(cr, t[0], t[1], ident, stack, defs)
         return True
     return False
 
-def _join_test(cr, trans_id, inst_id, ident, stack):
-    cr.execute('select * from wkf_activity where id=(select act_to from wkf_transition where id=%s)', (trans_id,))
-    activity = cr.dictfetchone()
+def _join_test(cr, trans_id, inst_id, ident, stack, defs):
+    activity = defs.activity(defs.transition(trans_id)['act_to'])
     if activity['join_mode']=='XOR':
-        create(cr,[activity], inst_id, ident, stack)
+        create(cr,[activity], inst_id, ident, stack, defs)
         cr.execute('delete from wkf_witm_trans where inst_id=%s and trans_id=%s', (inst_id,trans_id))
     else:
-        cr.execute('select id from wkf_transition where act_to=%s', (activity['id'],))
-        trans_ids = cr.fetchall()
+        trans_ids = defs.transitions_to(activity['id'])
         ok = True
-        for (id,) in trans_ids:
+        for id in trans_ids:
             cr.execute('select count(*) from wkf_witm_trans where trans_id=%s and inst_id=%s', (id,inst_id))
             res = cr.fetchone()[0]
             if not res:
                 ok = False
                 break
         if ok:
-            for (id,) in trans_ids:
+            for id in trans_ids:
                 cr.execute('delete from wkf_witm_trans where trans_id=%s and inst_id=%s', (id,inst_id))
-            create(cr, [activity], inst_id, ident, stack)
+            create(cr, [activity], inst_id, ident, stack, defs)
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
 